@@ -2,26 +2,118 @@ from flask import Flask, render_template, request, jsonify, send_file
 import os
 import numpy as np
 import base64
-import io
 import json
+import re
 import time
-from PIL import Image
+import uuid
+import shutil
+import tempfile
+import atexit
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError, features
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 from datetime import datetime
 from model.model import UnShineyModel
-from model.utils import preprocess_image, image_to_base64
+from model.utils import (preprocess_image, image_to_base64, base64_to_image, encode_image, IMAGE_MIMETYPES,
+                         open_image, process_for_model, process_luminance, ImageTooLarge,
+                         DEFAULT_MAX_PIXELS, decode_mask_rle, remove_shine_from_image)
+from model.pipeline import PipelineCache
+from model.dataset_store import DatasetStore, DatasetWriter, INDEX_FILE, convert_json_dataset, is_store
+from model.catalog import Catalog, model_record, store_record
+from model.jobs import JobManager, JobQueueFull, FINISHED_STATES
+from model.workers import ProcessPool, WorkerTimeout, WorkerError
+from model.result_cache import ResultCache
+from model.synthetic import write_pairs
+from model.tiling import process_tiled
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32MB max upload
-app.config['DATASET_FOLDER'] = 'datasets'
-app.config['MODEL_CONFIG_FOLDER'] = 'model_configs'
+app.config['MAX_DATASET_STREAM_LENGTH'] = 64 * 1024 * 1024 * 1024  # 64GB max streamed dataset
+app.config['DATASET_FOLDER'] = os.path.join(app.root_path, 'datasets')
+app.config['MODEL_CONFIG_FOLDER'] = os.path.join(app.root_path, 'model_configs')
+app.config['PIPELINE_CACHE_SIZE'] = 64
+app.config['DATASET_PREVIEW_ITEMS'] = 20
+app.config['DATASET_PREVIEW_MAX_ITEMS'] = 100
+app.config['OPEN_DATASET_STORES'] = 32
+app.config['CATALOG_PATH'] = os.path.join(app.root_path, 'catalog.db')
+app.config['TRAINING_SAMPLE_COUNT'] = 20  # Synthetic pairs to train on without a dataset
+app.config['TRAINING_WORKERS'] = 2  # Training jobs that run at the same time
+app.config['TRAINING_MAX_QUEUED'] = 16  # Training jobs that may wait for a worker
+app.config['TRAINING_EVENTS_HEARTBEAT'] = 15  # Seconds between keep-alives on idle event streams
+app.config['PROCESS_WORKERS'] = 0  # Worker processes for /process (0 processes on the request thread, None for one per CPU)
+app.config['PROCESS_TIMEOUT'] = 30  # Seconds a /process job may take before its worker is replaced
+app.config['PROCESS_PRELOAD_MODELS'] = ['dense', 'conv', 'hybrid', 'custom']
+app.config['MAX_IMAGE_PIXELS'] = DEFAULT_MAX_PIXELS  # Larger uploads are refused before decoding
+app.config['TILE_SIZE'] = 256  # Tile side for full resolution processing
+app.config['TILE_OVERLAP'] = 32  # Pixels blended at the seams between tiles
+app.config['TILE_WORKERS'] = None  # Threads processing tiles (None for the executor default)
+app.config['RESULT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # In-memory /process result cache
+app.config['RESULT_CACHE_DIR'] = None  # Folder for the on-disk result cache tier (None to disable)
+app.config['RESULT_CACHE_DISK_MAX_BYTES'] = 1024 * 1024 * 1024
+app.config['PNG_COMPRESS_LEVEL'] = 6  # Default zlib level of PNG responses (0 fastest, 9 smallest)
+app.config['PNG_OPTIMIZE'] = False  # Default for the slow smallest-output PNG search
+app.config['WEBP_METHOD'] = 4  # Default effort of lossless WebP responses (0 fastest, 6 smallest)
+app.config['SYNTHETIC_MAX_COUNT'] = 10000  # Largest synthetic dataset generated per request
+app.config['SYNTHETIC_MAX_PIXELS'] = 256 * 1024 * 1024  # Largest count * size² per request (2 bytes per pixel on disk)
+app.config['SYNTHETIC_PROCESSES'] = 0  # Worker processes rendering synthetic pairs (0 renders on the request thread)
+
+# Worker processes import this module too, but only process images
+IS_WORKER_PROCESS = multiprocessing.parent_process() is not None
 
 # Create folders if they don't exist
-os.makedirs(app.config['DATASET_FOLDER'], exist_ok=True)
-os.makedirs(app.config['MODEL_CONFIG_FOLDER'], exist_ok=True)
+if not IS_WORKER_PROCESS:
+    os.makedirs(app.config['DATASET_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['MODEL_CONFIG_FOLDER'], exist_ok=True)
 
 # Store active models in memory
 active_models = {}
 
+# Prebuilt processing pipelines keyed by model type and configuration
+pipeline_cache = PipelineCache(max_size=app.config['PIPELINE_CACHE_SIZE'])
+
+# Opened dataset stores by id, with the index version they were opened at
+_open_stores = OrderedDict()
+_open_stores_lock = threading.Lock()
+
+# Per-dataset locks held while a store is appended to, converted or replaced
+_dataset_locks = {}
+_dataset_locks_lock = threading.Lock()
+
+# Worker processes for /process, started on first use when enabled
+process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Processed results keyed by upload content and model
+result_cache = ResultCache(
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    disk_path=app.config['RESULT_CACHE_DIR'],
+    disk_max_bytes=app.config['RESULT_CACHE_DISK_MAX_BYTES']
+)
+
+# Threads that process the tiles of full resolution images
+tile_executor = ThreadPoolExecutor(max_workers=app.config['TILE_WORKERS'], thread_name_prefix='tiles')
+
+# Background training jobs
+training_jobs = JobManager(max_workers=app.config['TRAINING_WORKERS'],
+                           max_queued=app.config['TRAINING_MAX_QUEUED'])
+
+# Index of saved models and datasets
+catalog = None
+
+def init_catalog():
+    """Open the catalog at CATALOG_PATH and index what changed in the folders on disk"""
+    global catalog
+    catalog = Catalog(app.config['CATALOG_PATH'])
+    catalog.rebuild(app.config['MODEL_CONFIG_FOLDER'], app.config['DATASET_FOLDER'])
+    return catalog
+
+if not IS_WORKER_PROCESS:
+    init_catalog()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -45,83 +137,256 @@ def process_image():
         except json.JSONDecodeError:
             return jsonify({'error': 'Invalid model configuration'}), 400
     
-    # Get image from request
-    img = Image.open(file.stream)
+    # Pick the response format and encoder settings before doing any work
+    response_format = _negotiate_image_format()
+    if response_format is None:
+        return jsonify({'error': 'Can only respond with application/json, image/png or image/webp'}), 406
+    try:
+        encoder_options = _encoder_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 'resize' processes a 64×64 thumbnail, 'tiled' the full resolution image
+    mode = request.form.get('mode', 'resize')
+    if mode not in ('resize', 'tiled'):
+        return jsonify({'error': "mode must be 'resize' or 'tiled'"}), 400
+    
+    # Color output processes only the luminance and keeps the chroma
+    color = request.form.get('color', '').lower() in ('1', 'true', 'yes')
     
-    # Process image through the selected model
-    processed_img = process_with_model(img, model_type, model_config)
+    # Identical uploads with the same model get the same result
+    variant = ('' if mode == 'resize' else mode) + ('+color' if color else '')
+    cache_key = result_cache.key(file.stream, model_type, model_config, variant=variant)
+    etag, weak = _result_etag(cache_key, response_format, encoder_options)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=weak)
+        response.headers['Vary'] = 'Accept'
+        return response
+    
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        processed_img = Image.fromarray(cached)
+    else:
+        # Get image from request, reading only its header for now
+        try:
+            img = open_image(file.stream, app.config['MAX_IMAGE_PIXELS'])
+        except ImageTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except UnidentifiedImageError:
+            return jsonify({'error': 'Unsupported image format'}), 400
+        
+        # Process image through the selected model
+        try:
+            if mode == 'tiled':
+                processed_img = process_with_model_tiled(img, model_type, model_config, color)
+            else:
+                processed_img = process_with_model(img, model_type, model_config, color, source=file.stream)
+        except WorkerTimeout as e:
+            return jsonify({'error': str(e)}), 504
+        except WorkerError as e:
+            return jsonify({'error': str(e)}), 500
+        result_cache.put(cache_key, np.asarray(processed_img))
+    
+    # Raw image bytes for clients that accept them
+    if response_format != 'json':
+        response = app.response_class(
+            encode_image(processed_img, response_format, **encoder_options),
+            mimetype=IMAGE_MIMETYPES[response_format]
+        )
+        response.set_etag(etag, weak=weak)
+        response.headers['Vary'] = 'Accept'
+        return response
     
     # Return base64 encoded image
-    img_buffer = io.BytesIO()
-    processed_img.save(img_buffer, format='PNG')
-    img_str = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+    img_str = base64.b64encode(encode_image(processed_img, 'PNG', **encoder_options)).decode('utf-8')
     
-    return jsonify({
+    response = jsonify({
         'processed_image': f'data:image/png;base64,{img_str}',
         'processing_time': f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     })
+    response.set_etag(etag, weak=weak)
+    response.headers['Vary'] = 'Accept'
+    return response
 
-@app.route('/train', methods=['POST'])
-def train_model():
-    data = request.json
+def _result_etag(cache_key, response_format, encoder_options):
+    """
+    Get the ETag of a /process response
+    
+    The JSON form carries a timestamp, so it only gets a weak ETag.
+    
+    Returns:
+        Tuple (etag, weak) with the unquoted ETag
+    """
+    png_options = f"{encoder_options['compress_level']}-{int(encoder_options['optimize'])}"
+    if response_format == 'json':
+        return f"{cache_key}-json-{png_options}", True
+    if response_format == 'PNG':
+        return f"{cache_key}-png-{png_options}", False
+    return f"{cache_key}-webp-{encoder_options['webp_method']}", False
+
+def _negotiate_image_format(default='json'):
+    """
+    Pick the response format of an image endpoint from the Accept header
+    
+    Args:
+        default: Format for requests without an Accept header or with */*
+            ('json', 'PNG' or 'WEBP')
+    
+    Returns:
+        'json', 'PNG', 'WEBP', or None if nothing acceptable can be
+        produced
+    """
+    if not request.accept_mimetypes:
+        return default
+    formats = {'application/json': 'json', 'image/png': 'PNG'}
+    if features.check('webp'):
+        formats['image/webp'] = 'WEBP'
+    # Ties, as with */*, go to the first offered type
+    offered = sorted(formats, key=lambda mimetype: formats[mimetype] != default)
+    best = request.accept_mimetypes.best_match(offered)
+    if best is None:
+        return None
+    return formats[best]
+
+def _encoder_options():
+    """
+    Read image encoder options from the request's query string or form
+    
+    Returns:
+        Dictionary of encode_image keyword arguments
+    """
+    options = {
+        'compress_level': request.values.get('compress_level', app.config['PNG_COMPRESS_LEVEL'], type=int),
+        'optimize': request.values.get('optimize', str(app.config['PNG_OPTIMIZE'])).lower() in ('1', 'true', 'yes'),
+        'webp_method': request.values.get('webp_method', app.config['WEBP_METHOD'], type=int)
+    }
+    if not 0 <= options['compress_level'] <= 9:
+        raise ValueError('compress_level must be between 0 and 9')
+    if not 0 <= options['webp_method'] <= 6:
+        raise ValueError('webp_method must be between 0 and 6')
+    return options
+
+def _parse_training_request(data):
+    """
+    Validate the parameters of a training request
     
+    Args:
+        data: JSON body of the request
+        
+    Returns:
+        Tuple (spec, error) where error is a (message, status) tuple or None
+    """
     required_fields = ['model_type', 'epochs', 'batch_size', 'learning_rate']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required training parameters'}), 400
+    if not data or not all(field in data for field in required_fields):
+        return None, ('Missing required training parameters', 400)
+    
+    try:
+        spec = {
+            'model_type': data['model_type'],
+            'epochs': int(data['epochs']),
+            'batch_size': int(data['batch_size']),
+            'learning_rate': float(data['learning_rate']),
+            'validation_split': float(data.get('validation_split', 0.2)),
+            'dataset_id': data.get('dataset_id', None),
+            'name': data.get('name', None)
+        }
+    except (TypeError, ValueError):
+        return None, ('Invalid training parameters', 400)
     
-    model_type = data['model_type']
-    epochs = int(data['epochs'])
-    batch_size = int(data['batch_size'])
-    learning_rate = float(data['learning_rate'])
     model_config = data.get('model_config', None)
-    dataset_id = data.get('dataset_id', None)
-    validation_split = float(data.get('validation_split', 0.2))
+    try:
+        spec['model_config'] = model_config if isinstance(model_config, dict) or model_config is None else json.loads(model_config)
+    except json.JSONDecodeError:
+        return None, ('Invalid model configuration', 400)
     
-    # Generate a model ID
-    model_id = f"model_{model_type}_{int(time.time())}"
+    if spec['dataset_id'] and _open_dataset_store(spec['dataset_id']) is None:
+        return None, ('Dataset not found', 404)
     
-    # Create model name based on parameters
-    model_name = f"{model_type.capitalize()} Model ({epochs} epochs)"
-    if 'name' in data and data['name']:
-        model_name = data['name']
-    
-    # Initialize training history to simulate progress
-    training_history = {
-        'loss': [],
-        'val_loss': []
-    }
+    return spec, None
+
+def _run_training(spec, on_epoch_end=None, should_stop=None, job_id=None):
+    """
+    Train a model from a parsed training request
+    
+    Saves the model configuration and keeps the trained model in memory.
     
-    # Simulate training process with decreasing loss values
-    for i in range(epochs):
-        # Simulated decreasing loss over epochs with some randomness
-        train_loss = 0.5 * (1 - (i / epochs)) + 0.05 * np.random.random()
-        val_loss = train_loss * (1.2 - 0.2 * (i / epochs)) + 0.08 * np.random.random()
+    Args:
+        spec: Training parameters from _parse_training_request
+        on_epoch_end: Optional callback(epoch, stats) called after every epoch
+        should_stop: Optional callable that cancels training when it returns True
+        job_id: Id of the background job running the training, if any
         
-        training_history['loss'].append(round(train_loss, 4))
-        training_history['val_loss'].append(round(val_loss, 4))
+    Returns:
+        Dictionary of training results
+    """
+    model_type = spec['model_type']
+    epochs = spec['epochs']
+    model_config = spec['model_config']
+    dataset_id = spec['dataset_id']
+    
+    # Generate a model ID, unique even for jobs started in the same second
+    model_id = f"model_{model_type}_{job_id or uuid.uuid4().hex}"
+    
+    # Create model name based on parameters
+    model_name = spec['name'] or f"{model_type.capitalize()} Model ({epochs} epochs)"
+    
+    model = UnShineyModel(model_type, config=model_config)
+    
+    # Train on the stored dataset, or on synthetic samples without one
+    if dataset_id:
+        store = _open_dataset_store(dataset_id)
+        if store is None:
+            raise ValueError('Dataset not found')
+        training_pairs = [(original, clean) for _, original, clean in store.iter_pairs()]
+    else:
+        from model.utils import generate_sample_images
+        training_pairs = generate_sample_images(count=app.config['TRAINING_SAMPLE_COUNT'], size=model.img_size)
+    
+    if not training_pairs:
+        raise ValueError('Dataset is empty')
+    
+    start_time = time.time()
+    training_history = model.train(
+        training_pairs,
+        epochs=epochs,
+        batch_size=spec['batch_size'],
+        learning_rate=spec['learning_rate'],
+        validation_split=spec['validation_split'],
+        on_epoch_end=on_epoch_end,
+        should_stop=should_stop
+    )
+    training_time = time.time() - start_time
     
-    # Simulate training success
     training_results = {
         'model_id': model_id,
         'model_name': model_name,
         'status': 'success',
-        'epochs_completed': epochs,
-        'final_loss': training_history['loss'][-1],
-        'final_val_loss': training_history['val_loss'][-1],
-        'training_time': f"{epochs * 2} seconds",
+        'epochs_completed': training_history['epochs_completed'],
+        'final_loss': training_history['loss'][-1] if training_history['loss'] else None,
+        'final_val_loss': training_history['val_loss'][-1] if training_history['val_loss'] else None,
+        'training_time': f"{training_time:.1f} seconds",
+        'samples_per_sec': training_history['samples_per_sec'],
+        'peak_memory_mb': training_history['peak_memory_mb'],
         'history': training_history
     }
     
+    # A cancelled run is reported but not kept
+    if should_stop is not None and should_stop():
+        training_results['status'] = 'cancelled'
+        return training_results
+    
     # Save model configuration
+    full_config = None
     if model_config:
         # Add training parameters to the configuration
-        full_config = model_config if isinstance(model_config, dict) else json.loads(model_config)
+        full_config = dict(model_config)
         full_config.update({
             'training': {
                 'epochs': epochs,
-                'batch_size': batch_size,
-                'learning_rate': learning_rate,
-                'validation_split': validation_split,
+                'batch_size': spec['batch_size'],
+                'learning_rate': spec['learning_rate'],
+                'validation_split': spec['validation_split'],
                 'dataset_id': dataset_id,
                 'completed_at': datetime.now().isoformat()
             },
@@ -134,21 +399,22 @@ def train_model():
         config_path = os.path.join(app.config['MODEL_CONFIG_FOLDER'], f"{model_id}.json")
         with open(config_path, 'w') as f:
             json.dump(full_config, f, indent=2)
+        catalog.upsert_model(model_record(model_id, config_path, full_config))
         
         training_results['config_saved'] = True
     
-    # Create a simulated model and store it in memory
+    # Keep the trained model in memory
     active_models[model_id] = {
         'id': model_id,
         'name': model_name,
         'type': model_type,
-        'config': full_config if model_config else None,
+        'config': full_config,
         'created_at': datetime.now().isoformat(),
-        'history': training_history
+        'history': training_history,
+        'model': model
     }
     
-    # Add sample processing results for this model
-    # This simulates how different models might process the same image differently
+    # Add sample processing results of the trained model
     sample_results = []
     
     # Create sample images with different processing parameters based on model type
@@ -157,8 +423,7 @@ def train_model():
     
     if samples:
         for i, (input_img, _) in enumerate(samples):
-            # Process the sample with the "model"
-            model = UnShineyModel(model_type=model_type)
+            # Process the sample with the trained network
             processed_array = model.process_image(np.array(input_img.convert('L')))
             processed_img = Image.fromarray(processed_array)
             
@@ -171,31 +436,125 @@ def train_model():
     
     training_results['sample_results'] = sample_results
     
+    return training_results
+
+@app.route('/train', methods=['POST'])
+def train_model():
+    """Train a model and wait for the result (see /train/jobs to train in the background)"""
+    spec, error = _parse_training_request(request.json)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    try:
+        training_results = _run_training(spec)
+    except ValueError as e:
+        # The dataset is empty or the architecture cannot be built
+        return jsonify({'error': str(e)}), 400
+    
     return jsonify(training_results)
 
-@app.route('/models', methods=['GET'])
-def list_models():
-    """List all saved model configurations"""
-    model_files = [f for f in os.listdir(app.config['MODEL_CONFIG_FOLDER']) if f.endswith('.json')]
-    models = []
+@app.route('/train/jobs', methods=['POST'])
+def submit_training_job():
+    """Queue a training job and return its id right away"""
+    spec, error = _parse_training_request(request.json)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
     
-    for file in model_files:
-        path = os.path.join(app.config['MODEL_CONFIG_FOLDER'], file)
-        try:
-            with open(path, 'r') as f:
-                config = json.load(f)
-                models.append({
-                    'id': file.replace('.json', ''),
-                    'name': config.get('name', 'Unnamed Model'),
-                    'type': config.get('type', 'custom'),
-                    'description': config.get('description', ''),
-                    'created_at': datetime.fromtimestamp(os.path.getctime(path)).isoformat()
-                })
-        except:
-            # Skip invalid configs
-            continue
+    def train(job):
+        return _run_training(spec, on_epoch_end=job.on_epoch_end, should_stop=lambda: job.cancel_requested,
+                             job_id=job.id)
+    
+    params = {key: value for key, value in spec.items() if key != 'model_config'}
+    try:
+        job = training_jobs.submit(train, spec['epochs'], params)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    
+    status_url = f"/train/jobs/{job.id}"
+    response = jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': status_url,
+        'events_url': f"{status_url}/events"
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+@app.route('/train/jobs', methods=['GET'])
+def list_training_jobs():
+    """List known training jobs"""
+    return jsonify(training_jobs.list())
+
+@app.route('/train/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """Get the progress of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.snapshot())
+
+@app.route('/train/jobs/<job_id>', methods=['DELETE'])
+def cancel_training_job(job_id):
+    """Cancel a queued or running training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.finished:
+        return jsonify({'error': f"Job already {job.status}"}), 409
+    
+    training_jobs.cancel(job_id)
+    response = jsonify(job.snapshot())
+    response.status_code = 202
+    return response
+
+@app.route('/train/jobs/<job_id>/events', methods=['GET'])
+def training_job_events(job_id):
+    """Stream the progress of a training job as Server-Sent Events"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    heartbeat = app.config['TRAINING_EVENTS_HEARTBEAT']
+    
+    def events():
+        version = -1
+        while True:
+            if not job.wait_for_change(version, timeout=heartbeat):
+                # Comment lines keep proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            snapshot = job.snapshot()
+            version = snapshot['version']
+            finished = snapshot['status'] in FINISHED_STATES
+            yield f"id: {version}\nevent: {'done' if finished else 'progress'}\ndata: {json.dumps(snapshot)}\n\n"
+            if finished:
+                return
+    
+    return app.response_class(events(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _list_catalog(table):
+    """List a catalog table with limit/offset paging and field projection"""
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError('limit and offset must not be negative')
+        records, total = catalog.list(table, limit=limit, offset=offset, fields=fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(models)
+    response = jsonify(records)
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """List saved model configurations from the catalog"""
+    return _list_catalog('models')
 
 @app.route('/models/<model_id>', methods=['GET'])
 def get_model(model_id):
@@ -210,58 +569,223 @@ def get_model(model_id):
     
     return jsonify(config)
 
+def _png_data_url(png_bytes):
+    """Wrap PNG bytes in a data URL"""
+    return f"data:image/png;base64,{base64.b64encode(png_bytes).decode('utf-8')}"
+
+# Dataset ids name files and directories, so they are plain names
+DATASET_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+def _is_valid_dataset_id(dataset_id):
+    """Check a dataset id is a plain name whose store stays inside DATASET_FOLDER"""
+    if not isinstance(dataset_id, str) or not DATASET_ID_PATTERN.fullmatch(dataset_id):
+        return False
+    folder = os.path.realpath(app.config['DATASET_FOLDER'])
+    store_path = os.path.realpath(_dataset_store_path(dataset_id))
+    return os.path.dirname(store_path) == folder
+
+def _dataset_store_path(dataset_id):
+    """Get the directory of a binary dataset store"""
+    return os.path.join(app.config['DATASET_FOLDER'], dataset_id)
+
+def _dataset_lock(dataset_id):
+    """Get the (reentrant) lock serializing writes to a dataset's store"""
+    with _dataset_locks_lock:
+        return _dataset_locks.setdefault(dataset_id, threading.RLock())
+
+def _new_dataset_tmp_path(dataset_id):
+    """Create an empty scratch directory, unique to this upload, to write a new store into"""
+    return tempfile.mkdtemp(prefix=f".{dataset_id}.", suffix='.tmp', dir=app.config['DATASET_FOLDER'])
+
+def _publish_dataset_store(store_path, dataset_id, store):
+    """
+    Move a freshly written store into place and index it
+    
+    Runs under the dataset's lock, so uploads of the same id replace each
+    other whole and the catalog describes the store left on disk.
+    
+    Args:
+        store_path: Directory the store was written to, a scratch directory
+            or the dataset's own store after an append
+        dataset_id: Id of the dataset
+        store: The closed DatasetWriter or a DatasetStore of it
+    """
+    final_path = _dataset_store_path(dataset_id)
+    with _dataset_lock(dataset_id):
+        if store_path != final_path:
+            if is_store(final_path):
+                shutil.rmtree(final_path)
+            os.replace(store_path, final_path)
+        catalog.upsert_dataset(store_record(dataset_id, store, final_path))
+
 @app.route('/datasets', methods=['GET'])
 def list_datasets():
-    """List all saved datasets"""
-    dataset_files = [f for f in os.listdir(app.config['DATASET_FOLDER']) if f.endswith('.json')]
-    datasets = []
-    
-    for file in dataset_files:
-        path = os.path.join(app.config['DATASET_FOLDER'], file)
+    """List saved datasets from the catalog"""
+    return _list_catalog('datasets')
+
+def _convert_legacy_dataset(dataset_id, legacy_path):
+    """Convert a JSON dataset to a binary store once, so previews can seek"""
+    with _dataset_lock(dataset_id):
+        if is_store(_dataset_store_path(dataset_id)):
+            # Another request converted it meanwhile
+            return
+        tmp_path = _new_dataset_tmp_path(dataset_id)
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
-                datasets.append({
-                    'id': file.replace('.json', ''),
-                    'name': file.replace('.json', ''),
-                    'item_count': len(data),
-                    'created_at': datetime.fromtimestamp(os.path.getctime(path)).isoformat()
-                })
-        except:
-            # Skip invalid datasets
-            continue
+            item_count, _ = convert_json_dataset(legacy_path, tmp_path)
+            if item_count:
+                _publish_dataset_store(tmp_path, dataset_id, DatasetStore(tmp_path))
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+def _open_dataset_store(dataset_id):
+    """
+    Open the binary store of a dataset, reusing it until its index changes
+    
+    Legacy JSON datasets are converted on first access.
     
-    return jsonify(datasets)
+    Returns:
+        DatasetStore, or None if the dataset does not exist
+    """
+    if not _is_valid_dataset_id(dataset_id):
+        return None
+    store_path = _dataset_store_path(dataset_id)
+    if not is_store(store_path):
+        legacy_path = os.path.join(app.config['DATASET_FOLDER'], f"{dataset_id}.json")
+        if not os.path.exists(legacy_path):
+            return None
+        _convert_legacy_dataset(dataset_id, legacy_path)
+        if not is_store(store_path):
+            return None
+    
+    stat = os.stat(os.path.join(store_path, INDEX_FILE))
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _open_stores_lock:
+        cached = _open_stores.get(dataset_id)
+        if cached is not None and cached[0] == version:
+            _open_stores.move_to_end(dataset_id)
+            return cached[1]
+    
+    store = DatasetStore(store_path)
+    with _open_stores_lock:
+        _open_stores[dataset_id] = (version, store)
+        _open_stores.move_to_end(dataset_id)
+        while len(_open_stores) > app.config['OPEN_DATASET_STORES']:
+            _open_stores.popitem(last=False)
+    return store
 
 @app.route('/datasets/<dataset_id>', methods=['GET'])
 def get_dataset(dataset_id):
-    """Get a specific dataset"""
-    file_path = os.path.join(app.config['DATASET_FOLDER'], f"{dataset_id}.json")
+    """
+    Get a page of a dataset's items with thumbnail previews
     
-    if not os.path.exists(file_path):
+    Query parameters offset and limit select the page and thumb_size the
+    thumbnail size. Only the items on the page are read, and each
+    thumbnail is generated once and then served from the cache.
+    """
+    try:
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', app.config['DATASET_PREVIEW_ITEMS'], type=int)
+        thumb_size = request.args.get('thumb_size', 64, type=int)
+        if offset < 0 or limit < 0 or not 0 < thumb_size <= 256:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Invalid offset, limit or thumb_size'}), 400
+    limit = min(limit, app.config['DATASET_PREVIEW_MAX_ITEMS'])
+    
+    store = _open_dataset_store(dataset_id)
+    if store is None:
         return jsonify({'error': 'Dataset not found'}), 404
     
-    with open(file_path, 'r') as f:
-        dataset = json.load(f)
-    
-    # Truncate base64 data to save bandwidth in the response
-    truncated_dataset = []
-    for item in dataset:
-        truncated_dataset.append({
-            'id': item.get('id', ''),
-            'original': item.get('original', '')[:100] + '...',
-            'clean': item.get('clean', '')[:100] + '...'
+    preview = []
+    for position in range(offset, min(offset + limit, len(store))):
+        preview.append({
+            'id': store.ids[position],
+            'position': position,
+            'original': _png_data_url(store.thumbnail(position, 'original', thumb_size)),
+            'clean': _png_data_url(store.thumbnail(position, 'clean', thumb_size))
         })
     
     return jsonify({
         'id': dataset_id,
-        'item_count': len(dataset),
-        'preview': truncated_dataset
+        'item_count': len(store),
+        'offset': offset,
+        'limit': limit,
+        'preview': preview
     })
 
+def _iter_ndjson(stream):
+    """Yield (line_number, item) for each line of an NDJSON stream, or the parse error"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+
+def _limited_lines(stream, limit):
+    """Yield the lines of a stream, refusing it once more than limit bytes arrived"""
+    received = 0
+    for line in stream:
+        received += len(line)
+        if received > limit:
+            raise RequestEntityTooLarge(f"Streamed datasets are limited to {limit} bytes")
+        yield line
+
+def _ingest_dataset_items(items, store_path, writer=None):
+    """
+    Decode dataset items and append them to a store one at a time
+    
+    Args:
+        items: Iterable of (position, item) where item is a parsed dataset
+            item or the exception raised while parsing it
+        store_path: Directory to create the store in if no writer is given
+        writer: Optional DatasetWriter to append to
+    
+    Returns:
+        Tuple (writer, appended, errors) where writer is None if nothing was
+        written and errors lists {'item', 'error'} for items that failed
+    """
+    appended = 0
+    errors = []
+    for position, item in items:
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, dict) or 'original' not in item or 'clean' not in item:
+                raise ValueError("Item must be an object with 'original' and 'clean' images")
+            original = base64_to_image(item['original'])
+            clean = base64_to_image(item['clean'])
+            if writer is None:
+                # The first pair fixes the image shape of the dataset, pairs
+                # of another size fail
+                writer = DatasetWriter(store_path, shape=(original.size[1], original.size[0]))
+            writer.append_images(original, clean, item.get('id', position))
+            appended += 1
+        except Exception as e:
+            errors.append({'item': position, 'error': str(e)})
+    
+    return writer, appended, errors
+
 @app.route('/datasets', methods=['POST'])
 def save_dataset():
-    """Save a dataset"""
+    """
+    Save a dataset
+    
+    Accepts either a JSON array of items or, with Content-Type
+    application/x-ndjson, one item per line. NDJSON uploads are decoded and
+    written as they stream in, may exceed MAX_CONTENT_LENGTH, and can add
+    to an existing dataset in several requests with ?append=1.
+    """
+    # Generate a dataset ID if not provided
+    dataset_id = request.args.get('id') or f"dataset_{uuid.uuid4().hex}"
+    if not _is_valid_dataset_id(dataset_id):
+        return jsonify({'error': 'Dataset id may only contain letters, digits, _ and -'}), 400
+    
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return _save_dataset_stream(dataset_id)
+    
     if not request.is_json:
         return jsonify({'error': 'Expected JSON payload'}), 400
     
@@ -270,94 +794,260 @@ def save_dataset():
     if not isinstance(data, list):
         return jsonify({'error': 'Dataset must be an array'}), 400
     
-    # Generate a dataset ID if not provided
-    dataset_id = request.args.get('id') or f"dataset_{int(time.time())}"
+    # Decode every pair into the binary store, skipping undecodable items
+    tmp_path = _new_dataset_tmp_path(dataset_id)
+    try:
+        writer, appended, errors = _ingest_dataset_items(enumerate(data), tmp_path)
+        if writer is None:
+            return jsonify({'error': 'Dataset contains no valid image pairs'}), 400
+        writer.close()
+        _publish_dataset_store(tmp_path, dataset_id, writer)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    return jsonify({
+        'status': 'success',
+        'id': dataset_id,
+        'item_count': len(writer),
+        'skipped': len(errors)
+    })
+
+def _save_dataset_stream(dataset_id):
+    """Ingest an NDJSON dataset upload item by item"""
+    # Streamed uploads have their own, larger, size limit. request.stream
+    # would apply MAX_CONTENT_LENGTH, so the body is read and counted here.
+    limit = app.config['MAX_DATASET_STREAM_LENGTH']
+    if request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge(f"Streamed datasets are limited to {limit} bytes")
+    stream = _limited_lines(get_input_stream(request.environ), limit)
+    
+    append = request.args.get('append', '').lower() in ('1', 'true', 'yes')
+    if append:
+        # Appends write into the live store, one request at a time
+        with _dataset_lock(dataset_id):
+            store_path = _dataset_store_path(dataset_id)
+            if is_store(store_path):
+                return _ingest_dataset_stream(dataset_id, stream, store_path, DatasetWriter(store_path))
+    
+    tmp_path = _new_dataset_tmp_path(dataset_id)
+    try:
+        return _ingest_dataset_stream(dataset_id, stream, tmp_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def _ingest_dataset_stream(dataset_id, stream, store_path, writer=None):
+    """Ingest NDJSON lines into a store and publish it, reporting the items that failed"""
+    try:
+        writer, appended, errors = _ingest_dataset_items(_iter_ndjson(stream), store_path, writer)
+    finally:
+        # Index whatever arrived, so an appended store stays consistent
+        # even if the connection drops or the size limit is hit
+        if writer is not None:
+            writer.close()
     
-    # Save dataset
-    file_path = os.path.join(app.config['DATASET_FOLDER'], f"{dataset_id}.json")
-    with open(file_path, 'w') as f:
-        json.dump(data, f)
+    if writer is None:
+        return jsonify({'error': 'Dataset contains no valid image pairs', 'errors': errors[:100]}), 400
+    
+    _publish_dataset_store(store_path, dataset_id, writer)
     
     return jsonify({
         'status': 'success',
         'id': dataset_id,
-        'item_count': len(data)
+        'item_count': len(writer),
+        'appended': appended,
+        'failed': len(errors),
+        # Report the first failures, a bad upload may fail on every line
+        'errors': errors[:100]
     })
 
 @app.route('/generate_synthetic_dataset', methods=['POST'])
 def generate_synthetic_dataset():
-    """Generate a synthetic dataset for testing"""
-    from model.utils import generate_sample_images
-    
-    # Generate sample image pairs
-    samples = generate_sample_images()
+    """
+    Generate a synthetic dataset for testing
     
-    # Convert to dataset format
-    dataset = []
-    for i, (input_img, target_img) in enumerate(samples):
-        # Convert PIL images to base64
-        input_base64 = image_to_base64(input_img)
-        target_base64 = image_to_base64(target_img)
-        
-        dataset.append({
-            'id': i,
-            'original': f'data:image/png;base64,{input_base64}',
-            'clean': f'data:image/png;base64,{target_base64}'
-        })
+    An optional JSON body sets count (default 5), size (default 256)
+    and seed. count * size² is limited by SYNTHETIC_MAX_PIXELS, which
+    bounds the disk space and time one request can take.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        count = int(data.get('count', 5))
+        size = int(data.get('size', 256))
+        seed = data.get('seed')
+        seed = None if seed is None else int(seed)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count, size and seed must be integers'}), 400
+    if not 1 <= count <= app.config['SYNTHETIC_MAX_COUNT']:
+        return jsonify({'error': f"count must be between 1 and {app.config['SYNTHETIC_MAX_COUNT']}"}), 400
+    if not 8 <= size <= 1024:
+        return jsonify({'error': 'size must be between 8 and 1024'}), 400
+    if count * size * size > app.config['SYNTHETIC_MAX_PIXELS']:
+        return jsonify({'error': f"count * size² must be at most {app.config['SYNTHETIC_MAX_PIXELS']} pixels"}), 400
     
     # Generate a dataset ID
-    dataset_id = f"synthetic_dataset_{int(time.time())}"
+    dataset_id = f"synthetic_dataset_{uuid.uuid4().hex}"
     
-    # Save dataset
-    file_path = os.path.join(app.config['DATASET_FOLDER'], f"{dataset_id}.json")
-    with open(file_path, 'w') as f:
-        json.dump(dataset, f)
+    # Render the pairs in batches straight into a binary store
+    tmp_path = _new_dataset_tmp_path(dataset_id)
+    try:
+        with DatasetWriter(tmp_path, shape=(size, size)) as writer:
+            write_pairs(writer, count, seed=seed, processes=app.config['SYNTHETIC_PROCESSES'])
+        _publish_dataset_store(tmp_path, dataset_id, writer)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
     
     return jsonify({
         'status': 'success',
         'id': dataset_id,
-        'item_count': len(dataset)
+        'item_count': len(writer)
     })
 
+# Methods /process_marked_area can remove the marked shine with
+MARKED_AREA_METHODS = ('pyramid', 'inpainting', 'blend', 'filter')
+
 @app.route('/process_marked_area', methods=['POST'])
 def process_marked_area():
-    """Process an image with marked areas to generate a clean version"""
-    if not request.is_json:
-        return jsonify({'error': 'Expected JSON payload'}), 400
+    """
+    Remove shine from the marked areas of an image
+    
+    Takes a multipart upload with the image in the 'image' part and the
+    mask either as an image in the 'mask' part (white marks shine) or as
+    run lengths in the 'mask_rle' field (see decode_mask_rle). Only the
+    marked regions are processed. The response is the raw image unless
+    the client asks for JSON; JSON requests with base64 data URLs are
+    still accepted and answered in JSON.
+    """
+    if request.is_json:
+        return _process_marked_area_json()
+    
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image provided'}), 400
+    if 'mask' not in request.files and 'mask_rle' not in request.form:
+        return jsonify({'error': 'A mask or mask_rle is required'}), 400
+    
+    # Binary uploads get a binary response by default
+    response_format = _negotiate_image_format(default='PNG')
+    if response_format is None:
+        return jsonify({'error': 'Can only respond with application/json, image/png or image/webp'}), 406
     
+    try:
+        image = open_image(request.files['image'].stream, app.config['MAX_IMAGE_PIXELS'])
+        if 'mask' in request.files:
+            mask = open_image(request.files['mask'].stream, app.config['MAX_IMAGE_PIXELS'])
+        else:
+            mask = decode_mask_rle(request.form['mask_rle'], image.size)
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except UnidentifiedImageError:
+        return jsonify({'error': 'Unsupported image format'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return _respond_marked_area(image, mask, request.form, response_format)
+
+def _process_marked_area_json():
+    """Handle a /process_marked_area request with base64 data URLs in JSON"""
     data = request.json
     
     if 'image' not in data or 'mask' not in data:
         return jsonify({'error': 'Image and mask data required'}), 400
     
-    # In a real app, we would use the mask to clean the image
-    # Here we just simulate it by returning the original without the red marks
+    try:
+        image = base64_to_image(data['image'], app.config['MAX_IMAGE_PIXELS'])
+        if isinstance(data['mask'], str):
+            mask = base64_to_image(data['mask'], app.config['MAX_IMAGE_PIXELS'])
+        else:
+            mask = decode_mask_rle(data['mask'], image.size)
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except UnidentifiedImageError:
+        return jsonify({'error': 'Unsupported image format'}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return _respond_marked_area(image, mask, data, 'json')
+
+def _respond_marked_area(image, mask, params, response_format):
+    """
+    Remove shine from the masked areas of an image and build the response
+    
+    Args:
+        image: PIL Image
+        mask: PIL Image or uint8 numpy array, nonzero where shine was marked
+        params: Request options (method, color, levels, time_budget and
+            the encoder options)
+        response_format: 'json', 'PNG' or 'WEBP'
+    """
+    method = params.get('method', 'pyramid')
+    if method not in MARKED_AREA_METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(MARKED_AREA_METHODS)}"}), 400
+    color = str(params.get('color', '')).lower() in ('1', 'true', 'yes')
+    try:
+        encoder_options = _encoder_options()
+        levels = params.get('levels')
+        levels = None if levels in (None, '') else int(levels)
+        time_budget = params.get('time_budget')
+        time_budget = None if time_budget in (None, '') else float(time_budget)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if isinstance(mask, Image.Image):
+        if mask.size != image.size:
+            return jsonify({'error': f"Mask is {mask.size[0]}x{mask.size[1]}, the image is "
+                                     f"{image.size[0]}x{image.size[1]}"}), 400
+        mask = mask.convert('L')
+    
+    def remove(gray):
+        """Remove shine from a uint8 luminance array"""
+        clean = remove_shine_from_image(Image.fromarray(gray), mask, method, executor=tile_executor,
+                                        levels=levels, time_budget=time_budget)
+        return np.asarray(clean)
     
     try:
-        # Decode base64 strings
-        image_data = data['image'].split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        original_img = Image.open(io.BytesIO(image_bytes))
-        
-        # Create a simulated "clean" version
-        # This is just a placeholder - in a real app this would use the mask
-        # to intelligently remove the marked shine/glare
-        clean_img = original_img.convert('L')
-        clean_img = clean_img.filter(ImageFilter.GaussianBlur(radius=1))
-        
-        # Convert back to base64
-        clean_buffer = io.BytesIO()
-        clean_img.save(clean_buffer, format='PNG')
-        clean_base64 = base64.b64encode(clean_buffer.getvalue()).decode('utf-8')
-        
-        return jsonify({
-            'status': 'success',
-            'clean_image': f'data:image/png;base64,{clean_base64}'
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        if color:
+            clean_img = process_luminance(image, remove)
+        else:
+            clean_img = Image.fromarray(remove(np.asarray(image.convert('L'))))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Raw image bytes for clients that accept them
+    if response_format != 'json':
+        return app.response_class(
+            encode_image(clean_img, response_format, **encoder_options),
+            mimetype=IMAGE_MIMETYPES[response_format]
+        )
+    
+    clean_base64 = base64.b64encode(encode_image(clean_img, 'PNG', **encoder_options)).decode('utf-8')
+    return jsonify({
+        'status': 'success',
+        'clean_image': f'data:image/png;base64,{clean_base64}'
+    })
+
+def _get_process_pool():
+    """Get the /process worker pool, starting it on first use (None when disabled)"""
+    global process_pool
+    if app.config['PROCESS_WORKERS'] == 0:
+        return None
+    with _process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPool(
+                workers=app.config['PROCESS_WORKERS'],
+                timeout=app.config['PROCESS_TIMEOUT'],
+                preload=app.config['PROCESS_PRELOAD_MODELS'],
+                cache_size=app.config['PIPELINE_CACHE_SIZE']
+            )
+            atexit.register(process_pool.close)
+        return process_pool
 
-def process_with_model(image, model_type, model_config=None):
+def _model_runner(model_type, model_config=None):
+    """Get a callable running the model pipeline on a 2-D uint8 array, in a worker process when the pool is enabled"""
+    pool = _get_process_pool()
+    if pool is not None:
+        return lambda img_array: pool.run(img_array, model_type, model_config)
+    return pipeline_cache.get(model_type, model_config).run
+
+def process_with_model(image, model_type, model_config=None, color=False, source=None):
     """
     Process an image using the specified model type and configuration.
     
@@ -365,83 +1055,53 @@ def process_with_model(image, model_type, model_config=None):
         image: PIL Image to process
         model_type: Type of model to use (dense, conv, hybrid, custom)
         model_config: Optional custom model configuration
+        color: Keep color by processing only the luminance
+        source: Optional seekable file the image was opened from; with the
+            worker pool enabled its bytes are decoded and resized in a worker
     
     Returns:
-        Processed PIL Image
+        Processed PIL Image (grayscale, or RGB with color)
     """
-    # Convert to grayscale and resize
-    image = image.convert('L')
-    image = image.resize((64, 64), Image.LANCZOS)
+    pool = _get_process_pool()
+    if pool is not None and source is not None:
+        # Only the upload crosses to the worker, decoding and resizing run there
+        source.seek(0)
+        return Image.fromarray(pool.run_encoded(source.read(), model_type, model_config,
+                                                size=(64, 64), color=color))
     
-    # Get image data as numpy array
-    img_array = np.array(image)
+    # Convert to grayscale (or YCbCr), resize, decoding at reduced resolution when possible,
+    # and run the prebuilt pipeline for this model type and configuration
+    return process_for_model(image, _model_runner(model_type, model_config), size=(64, 64), color=color)
+
+def process_with_model_tiled(image, model_type, model_config=None, color=False):
+    """
+    Process an image at its native resolution in overlapping tiles
     
-    # If model_config is provided and has custom processing parameters
-    if model_config and 'processing_params' in model_config:
-        params = model_config['processing_params']
-        
-        # Example custom processing logic based on parameters
-        if 'contrast' in params:
-            contrast = float(params['contrast'])
-            img_array = np.clip((img_array.astype(float) * contrast), 0, 255).astype(np.uint8)
-        
-        if 'brightness' in params:
-            brightness = float(params['brightness'])
-            img_array = np.clip(img_array.astype(float) + brightness, 0, 255).astype(np.uint8)
-        
-        if 'blur' in params:
-            from scipy import ndimage
-            blur = float(params['blur'])
-            img_array = ndimage.gaussian_filter(img_array, sigma=blur)
-        
-    else:
-        # Apply different processing based on model type
-        if model_type == 'dense':
-            # Simulate dense model by adjusting contrast
-            img_array = np.clip((img_array.astype(float) * 1.2), 0, 255).astype(np.uint8)
-            
-        elif model_type == 'conv':
-            # Simulate conv model with edge enhancement and slight blur
-            from scipy import ndimage
-            img_array = ndimage.gaussian_filter(img_array, sigma=1)
-            
-            # Apply edge enhancement
-            from scipy.ndimage import sobel
-            edge_h = sobel(img_array, axis=0)
-            edge_v = sobel(img_array, axis=1)
-            magnitude = np.sqrt(edge_h**2 + edge_v**2)
-            
-            # Blend original with edge enhancement
-            img_array = np.clip(img_array.astype(float) * 0.8 + magnitude * 0.2, 0, 255).astype(np.uint8)
-            
-        elif model_type == 'hybrid':
-            # Simulate hybrid model with histogram equalization and edge preservation
-            from skimage import exposure
-            from scipy import ndimage
-            
-            # Histogram equalization
-            img_array = exposure.equalize_hist(img_array) * 255
-            
-            # Edge preservation
-            edge_preserving = ndimage.gaussian_filter(img_array, sigma=0.5)
-            img_array = edge_preserving.astype(np.uint8)
-            
-        elif model_type == 'custom':
-            # Simulate a custom model with multiple effects
-            from scipy import ndimage
-            from skimage import exposure
-            
-            # Apply a combination of effects
-            img_array = ndimage.gaussian_filter(img_array, sigma=0.8)
-            img_array = exposure.adjust_gamma(img_array, gamma=0.8)
-            
-            # Apply a slight sharpening
-            blurred = ndimage.gaussian_filter(img_array, sigma=1.0)
-            highpass = img_array - blurred
-            img_array = np.clip(img_array + highpass * 0.5, 0, 255).astype(np.uint8)
+    Tiles of a row run in parallel (in worker processes when the pool is
+    enabled) and are feathered together at the seams.
+    
+    Args:
+        image: PIL Image to process
+        model_type: Type of model to use (dense, conv, hybrid, custom)
+        model_config: Optional custom model configuration
+        color: Keep color by processing only the luminance
+    
+    Returns:
+        Processed PIL Image of the same size
+    """
+    run_tile = _model_runner(model_type, model_config)
+    
+    def run_tiled(img):
+        return process_tiled(
+            img, run_tile,
+            tile_size=app.config['TILE_SIZE'],
+            overlap=app.config['TILE_OVERLAP'],
+            executor=tile_executor
+        )
     
-    # Convert back to PIL Image
-    return Image.fromarray(img_array)
+    if color:
+        return process_luminance(image, run_tiled)
+    return Image.fromarray(run_tiled(image.convert('L')))
 
 if __name__ == '__main__':
     # Make sure dependencies are installed
@@ -0,0 +1,102 @@
+"""
+Benchmark the fast bilateral filter against skimage's denoise_bilateral
+
+Both filters run on equalized noisy test images the way the hybrid model
+calls them. Errors are in 8-bit grey levels against the output of the
+current skimage call, which is what the hybrid model gives by default,
+and against a brute-force symmetric bilateral filter, which is what the
+fast filter approximates. skimage's spatial weights are misplaced within
+its window, so the first error does not shrink with accuracy.
+
+Usage:
+    python benchmarks/bench_bilateral.py [--sizes 64 256 1024] [--accuracy 0.5 1 2]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from skimage import exposure, restoration
+
+# Add the repository root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.bilateral import bilateral_filter
+
+SIGMA_COLOR = 0.1
+SIGMA_SPATIAL = 1.0
+
+def make_stack(count, size, seed=0):
+    """Equalized noisy images with sharp edges, as the hybrid model sees them"""
+    rng = np.random.RandomState(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    base = 0.5 + 0.3 * np.sign(np.sin(xx / 9.0)) * np.cos(yy / 13.0)
+    return np.stack([
+        exposure.equalize_hist(np.clip(base + rng.normal(0, 0.05, base.shape), 0, 1))
+        for _ in range(count)
+    ]).astype(np.float32)
+
+def reference_bilateral(img, radius=3):
+    """Brute-force bilateral filter over a (2 * radius + 1)² window"""
+    img = img.astype(np.float64)
+    height, width = img.shape
+    padded = np.pad(img, radius, mode='symmetric')
+    num = np.zeros_like(img)
+    den = np.zeros_like(img)
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            neighbour = padded[radius + dy:radius + dy + height, radius + dx:radius + dx + width]
+            weight = (np.exp(-(dy * dy + dx * dx) / (2.0 * SIGMA_SPATIAL ** 2)) *
+                      np.exp(-(neighbour - img) ** 2 / (2.0 * SIGMA_COLOR ** 2)))
+            num += weight * neighbour
+            den += weight
+    return num / den
+
+def best_time(fn, repeat):
+    """Best wall time of a few runs, and the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def error(result, expected):
+    """Mean and max absolute difference in 8-bit grey levels"""
+    diff = np.abs(np.asarray(result, dtype=np.float64) - expected) * 255
+    return diff.mean(), diff.max()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--accuracy', type=float, nargs='+', default=[0.5, 0.75, 1.0, 2.0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'shape':>16} {'method':>12} {'time (s)':>9} {'speedup':>8} "
+          f"{'vs skimage mean/max':>20} {'vs symmetric mean/max':>22}")
+    for size in args.sizes:
+        # Small images come in batches, like a training set
+        count = 64 if size <= 64 else 1
+        stack = make_stack(count, size)
+        shape = 'x'.join(map(str, stack.shape))
+        exact = reference_bilateral(stack[0])
+
+        skimage_time, skimage_result = best_time(lambda: np.stack([
+            restoration.denoise_bilateral(img, sigma_color=SIGMA_COLOR, sigma_spatial=SIGMA_SPATIAL)
+            for img in stack
+        ]), args.repeat)
+        mean, peak = error(skimage_result[0], exact)
+        print(f"{shape:>16} {'skimage':>12} {skimage_time:9.4f} {1.0:8.2f} {0.0:10.2f} /{0.0:7.2f} "
+              f"{mean:12.2f} /{peak:7.2f}")
+
+        for accuracy in args.accuracy:
+            fast_time, fast_result = best_time(
+                lambda: bilateral_filter(stack, SIGMA_COLOR, SIGMA_SPATIAL, accuracy=accuracy), args.repeat)
+            mean, peak = error(fast_result[0], skimage_result[0])
+            exact_mean, exact_peak = error(fast_result[0], exact)
+            print(f"{shape:>16} {f'fast {accuracy:g}':>12} {fast_time:9.4f} {skimage_time / fast_time:8.2f} "
+                  f"{mean:10.2f} /{peak:7.2f} {exact_mean:12.2f} /{exact_peak:7.2f}")
+
+if __name__ == '__main__':
+    main()
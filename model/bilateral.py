@@ -0,0 +1,225 @@
+import numpy as np
+from model.kernels import gaussian_kernel
+
+# Intensity quantization used to look up the per-level weights
+_LUT_BINS = 1024
+
+# Spatial kernels are cut at 3 sigma, the window denoise_bilateral uses
+_TRUNCATE = 3.0
+
+# Pixels filtered at a time, so the buffers of every level stay in cache
+_BLOCK_PIXELS = 64 * 1024
+
+def _mirror(padded, radius, axis):
+    """Fill the radius wide borders of a padded axis by symmetric reflection"""
+    if radius == 0:
+        return
+    length = padded.shape[axis] - 2 * radius
+    src = [slice(None)] * padded.ndim
+    dst = [slice(None)] * padded.ndim
+    for step in range(radius):
+        # Before the start: row radius - 1 - step mirrors row radius + step
+        dst[axis], src[axis] = radius - 1 - step, radius + min(step, length - 1)
+        padded[tuple(dst)] = padded[tuple(src)]
+        # After the end
+        dst[axis], src[axis] = radius + length + step, radius + length - 1 - min(step, length - 1)
+        padded[tuple(dst)] = padded[tuple(src)]
+
+def _correlate_padded(padded, weights, axis, output, scratch):
+    """
+    Correlate along an axis whose borders are already padded
+
+    A short symmetric kernel is applied as a sum of shifted slices, which
+    is several times faster than ndimage.correlate1d along strided axes.
+    """
+    radius = len(weights) // 2
+    length = output.shape[axis]
+
+    def shifted(offset):
+        index = [slice(None)] * padded.ndim
+        index[axis] = slice(radius + offset, radius + offset + length)
+        return padded[tuple(index)]
+
+    np.multiply(shifted(0), weights[radius], out=output)
+    for offset in range(1, radius + 1):
+        # The kernel is symmetric, so both sides share one multiply
+        np.add(shifted(-offset), shifted(offset), out=scratch)
+        scratch *= weights[radius + offset]
+        output += scratch
+
+class _SpatialBlur:
+    """
+    Separable Gaussian blur of the last two axes with preallocated padding
+
+    Equivalent to ndimage.gaussian_filter with mode 'reflect' on each image
+    of a stack. Callers write the image straight into ``input``, the
+    unpadded centre of the buffer, and the buffers are reused across calls.
+    """
+    def __init__(self, shape, sigma):
+        self.weights = gaussian_kernel(float(sigma), _TRUNCATE).astype(np.float32)
+        self.radius = len(self.weights) // 2
+        r = self.radius
+        height, width = shape[-2:]
+        self.rows = np.empty(shape[:-2] + (height + 2 * r, width), dtype=np.float32)
+        self.columns = np.empty(shape[:-2] + (height, width + 2 * r), dtype=np.float32)
+        self.scratch = np.empty(shape, dtype=np.float32)
+        self.input = self.rows[..., r:r + height, :]
+
+    def __call__(self, output):
+        """Blur the contents of ``input`` into output"""
+        r = self.radius
+        width = output.shape[-1]
+        _mirror(self.rows, r, -2)
+        _correlate_padded(self.rows, self.weights, -2, self.columns[..., r:r + width], self.scratch)
+        _mirror(self.columns, r, -1)
+        _correlate_padded(self.columns, self.weights, -1, output, self.scratch)
+        return output
+
+def _filter_block(img, index, levels, sigma_color, sigma_spatial):
+    """
+    Piecewise-linear bilateral filter of one N×H×W block
+
+    Args:
+        img: float32 block
+        index: LUT bin of every pixel of the block, within its own image's table
+        levels: Tuple (bin_values, values, spacing, counts) of the block's
+            images, see _image_levels
+        sigma_color: Standard deviation of the intensity weights
+        sigma_spatial: Standard deviation of the spatial weights
+
+    Returns:
+        Filtered float32 block
+    """
+    bin_values, values, spacing, counts = levels
+    # Each image looks up its own rows of the flattened level tables
+    offsets = np.arange(len(img)) * _LUT_BINS
+    index = index + offsets[:, np.newaxis, np.newaxis]
+    output = np.zeros_like(img)
+    # Weights and weighted intensities are blurred together in one call
+    blur = _SpatialBlur((2,) + img.shape, sigma_spatial)
+    pair = blur.input
+    blurred = np.empty((2,) + img.shape, dtype=np.float32)
+    tent = np.empty_like(img)
+    for level in range(counts.max()):
+        distance = bin_values - values[:, level, np.newaxis]
+        range_lut = np.exp(distance * distance / (-2.0 * sigma_color * sigma_color)).astype(np.float32)
+        tent_lut = np.maximum(1.0 - np.abs(distance) / spacing[:, np.newaxis], 0).astype(np.float32)
+        # Images with fewer levels sit this one out
+        tent_lut[level >= counts] = 0
+
+        np.take(range_lut, index, out=pair[0])
+        np.multiply(pair[0], img, out=pair[1])
+        blur(blurred)
+
+        # Normalized result of this level, weighted by its tent
+        np.maximum(blurred[0], np.finfo(np.float32).tiny, out=blurred[0])
+        np.divide(blurred[1], blurred[0], out=blurred[1])
+        np.take(tent_lut, index, out=tent)
+        blurred[1] *= tent
+        output += blurred[1]
+    return output
+
+def _image_levels(img, sigma_color, accuracy):
+    """
+    Pick the intensity levels of each image of an N×H×W stack
+
+    Every image is sampled over its own intensity range, so an image
+    filters the same alone or in any stack.
+
+    Returns:
+        Tuple (index, levels) where index is the LUT bin of every pixel and
+        levels is (bin_values, values, spacing, counts) with one row per image
+    """
+    low = img.min(axis=(1, 2))
+    high = img.max(axis=(1, 2))
+    extent = high.astype(np.float64) - low
+
+    # Intensity levels at most sigma_color / accuracy apart
+    counts = np.maximum(2, np.ceil(extent * accuracy / sigma_color).astype(np.intp) + 1)
+    steps = np.arange(counts.max())
+    spacing = extent / (counts - 1)
+    # Levels past an image's count repeat its top level and get no weight
+    values = low[:, np.newaxis] + np.minimum(steps, counts[:, np.newaxis] - 1) * spacing[:, np.newaxis]
+    values[np.arange(len(img)), counts - 1] = high
+
+    # Quantize once so each level's range and tent weights are a table lookup
+    scale = (_LUT_BINS - 1) / extent
+    index = np.rint((img - low[:, np.newaxis, np.newaxis]) *
+                    scale.astype(np.float32)[:, np.newaxis, np.newaxis]).astype(np.intp)
+    bin_values = low[:, np.newaxis] + np.arange(_LUT_BINS) / scale[:, np.newaxis]
+    return index, (bin_values, values, spacing, counts)
+
+def bilateral_filter(img_stack, sigma_color=0.1, sigma_spatial=1.0, accuracy=1.0,
+                     block_pixels=_BLOCK_PIXELS):
+    """
+    Fast approximate bilateral filter
+
+    Piecewise-linear bilateral filtering (Durand and Dorsey): the intensity
+    range of each image is sampled at a few levels, each level's
+    range-weighted image is smoothed with one separable Gaussian blur, and
+    every pixel interpolates linearly between the results of the two levels
+    around its own value. The work is done in blocks of a few images, or of
+    rows with a halo for large images, so the buffers of all levels stay in
+    cache. Images in a stack never mix.
+
+    The filter converges on the symmetric bilateral filter with a
+    reflected border as accuracy grows. That is not what
+    skimage.restoration.denoise_bilateral computes: its spatial lookup
+    table is built on a grid of win_size + 1 points but indexed with a
+    stride of win_size, so its spatial weights are misplaced within the
+    window, and it pads the image with zeros. On the hybrid model's images
+    the two differ by about 7.5 gray levels on average and 44-64 at most,
+    at every accuracy (see benchmarks/bench_bilateral.py), so switching
+    the hybrid model to this filter changes its output by that much.
+
+    Args:
+        img_stack: Float image (H×W) or stack (N×H×W)
+        sigma_color: Standard deviation of the intensity weights, in image units
+        sigma_spatial: Standard deviation of the spatial weights, in pixels
+        accuracy: Levels per sigma_color; higher is closer to the exact filter
+            and proportionally slower
+        block_pixels: Approximate number of pixels filtered at a time
+
+    Returns:
+        Filtered float32 array of the same shape
+    """
+    if accuracy <= 0:
+        raise ValueError('accuracy must be positive')
+    img = np.ascontiguousarray(img_stack, dtype=np.float32)
+    if img.size == 0:
+        return img.copy()
+
+    shape = img.shape
+    height, width = shape[-2:]
+    img = img.reshape((-1, height, width))
+    output = img.copy()
+
+    # Flat images come out unchanged
+    varying = np.flatnonzero(img.max(axis=(1, 2)) - img.min(axis=(1, 2)) > 1e-12)
+    if len(varying) == 0:
+        return output.reshape(shape)
+    index, levels = _image_levels(img[varying], sigma_color, accuracy)
+
+    def image_levels(images):
+        return tuple(level[images] for level in levels)
+
+    if height * width <= block_pixels:
+        # Small images: several whole images per block
+        step = max(1, block_pixels // (height * width))
+        for start in range(0, len(varying), step):
+            block = slice(start, start + step)
+            output[varying[block]] = _filter_block(img[varying[block]], index[block], image_levels(block),
+                                                   sigma_color, sigma_spatial)
+    else:
+        # Large images: bands of rows, with a halo as wide as the kernel
+        halo = int(_TRUNCATE * sigma_spatial + 0.5)
+        rows = max(1, block_pixels // width)
+        for n, i in enumerate(varying):
+            for top in range(0, height, rows):
+                bottom = min(top + rows, height)
+                first, last = max(0, top - halo), min(height, bottom + halo)
+                band = _filter_block(img[i:i + 1, first:last], index[n:n + 1, first:last],
+                                     image_levels(slice(n, n + 1)), sigma_color, sigma_spatial)
+                output[i, top:bottom] = band[0, top - first:bottom - first]
+
+    return output.reshape(shape)
@@ -0,0 +1,229 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from model.dataset_store import INDEX_FILE, DatasetStore, is_store
+
+# Columns of each catalog table, in listing order
+MODEL_FIELDS = ('id', 'name', 'type', 'description', 'created_at')
+DATASET_FIELDS = ('id', 'name', 'item_count', 'format', 'created_at')
+
+_TABLES = {
+    'models': MODEL_FIELDS,
+    'datasets': DATASET_FIELDS
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    description TEXT,
+    created_at TEXT,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    item_count INTEGER,
+    format TEXT,
+    created_at TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS models_created_at ON models (created_at);
+CREATE INDEX IF NOT EXISTS datasets_created_at ON datasets (created_at);
+"""
+
+class Catalog:
+    """
+    SQLite index of saved model configurations and datasets
+
+    Kept up to date by the code that writes configs and datasets, so
+    listing never has to open the files themselves.
+    """
+    def __init__(self, db_path):
+        """
+        Open the catalog, creating it if needed
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            # Catalogs created before mtimes were recorded
+            for table in _TABLES:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                if 'mtime' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN mtime REAL")
+
+    def _connect(self):
+        """Open a connection (one per call keeps the catalog thread safe)"""
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _upsert(self, table, record):
+        """Insert or replace a record in a table"""
+        # The modification time of the file a record was read from is kept
+        # for rebuild, but not listed
+        fields = _TABLES[table] + ('mtime',)
+        values = [record.get(field) for field in fields]
+        placeholders = ', '.join('?' for _ in fields)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(fields)}) VALUES ({placeholders})",
+                values
+            )
+
+    def upsert_model(self, record):
+        """Add or update a model configuration record"""
+        self._upsert('models', record)
+
+    def upsert_dataset(self, record):
+        """Add or update a dataset record"""
+        self._upsert('datasets', record)
+
+    def list(self, table, limit=None, offset=0, fields=None):
+        """
+        List records, newest first
+
+        Args:
+            table: 'models' or 'datasets'
+            limit: Maximum number of records (None for all)
+            offset: Number of records to skip
+            fields: Optional list of fields to return
+
+        Returns:
+            Tuple (records, total) where records is a list of dictionaries
+        """
+        allowed = _TABLES[table]
+        fields = list(fields) if fields else list(allowed)
+        unknown = [field for field in fields if field not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+        query = f"SELECT {', '.join(fields)} FROM {table} ORDER BY created_at DESC, id LIMIT ? OFFSET ?"
+        with closing(self._connect()) as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            rows = conn.execute(query, (-1 if limit is None else limit, offset)).fetchall()
+
+        return [dict(zip(fields, row)) for row in rows], total
+
+    def _mtimes(self, table):
+        """Get the recorded file modification time of every record of a table"""
+        with closing(self._connect()) as conn:
+            return dict(conn.execute(f"SELECT id, mtime FROM {table}"))
+
+    def _remove_missing(self, table, ids):
+        """Delete the records of a table whose id is not in ids"""
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            stale = [row[0] for row in conn.execute(f"SELECT id FROM {table}") if row[0] not in ids]
+            conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(record_id,) for record_id in stale])
+
+    def rebuild(self, model_folder, dataset_folder):
+        """
+        Bring the catalog in line with the configs and datasets on disk
+
+        Only entries that are new or whose file changed since they were
+        indexed are read, and records whose files are gone are dropped,
+        so the catalog matches the folders even after they were changed
+        while the app was not running. Legacy JSON datasets are not
+        parsed: they are listed without an item count until they are
+        first opened and converted.
+
+        Args:
+            model_folder: Folder with model configuration files
+            dataset_folder: Folder with datasets
+        """
+        known = self._mtimes('models')
+        model_ids = set()
+        for file in os.listdir(model_folder):
+            if not file.endswith('.json'):
+                continue
+            model_id = file.replace('.json', '')
+            path = os.path.join(model_folder, file)
+            try:
+                if known.get(model_id) != os.path.getmtime(path):
+                    self.upsert_model(model_record(model_id, path))
+            except Exception:
+                # Skip invalid configs
+                continue
+            model_ids.add(model_id)
+        self._remove_missing('models', model_ids)
+
+        known = self._mtimes('datasets')
+        dataset_ids = set()
+        for entry in os.listdir(dataset_folder):
+            if entry.startswith('.'):
+                continue
+            path = os.path.join(dataset_folder, entry)
+            try:
+                if is_store(path):
+                    if known.get(entry) != store_mtime(path):
+                        self.upsert_dataset(store_record(entry, DatasetStore(path)))
+                    dataset_ids.add(entry)
+                elif entry.endswith('.json') and not is_store(path[:-len('.json')]):
+                    # A JSON dataset that was converted is listed as its store
+                    dataset_id = entry.replace('.json', '')
+                    mtime = os.path.getmtime(path)
+                    if known.get(dataset_id) != mtime:
+                        self.upsert_dataset({
+                            'id': dataset_id,
+                            'name': dataset_id,
+                            'item_count': None,
+                            'format': 'json',
+                            'created_at': datetime.fromtimestamp(os.path.getctime(path)).isoformat(),
+                            'mtime': mtime
+                        })
+                    dataset_ids.add(dataset_id)
+            except Exception:
+                # Skip invalid datasets
+                continue
+        self._remove_missing('datasets', dataset_ids)
+
+def model_record(model_id, path, config=None):
+    """
+    Build the catalog record of a model configuration file
+
+    Args:
+        model_id: Id of the model
+        path: Path of the configuration file
+        config: The configuration if already in memory (read from path otherwise)
+    """
+    if config is None:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    return {
+        'id': model_id,
+        'name': config.get('name', 'Unnamed Model'),
+        'type': config.get('type', 'custom'),
+        'description': config.get('description', ''),
+        'created_at': datetime.fromtimestamp(os.path.getctime(path)).isoformat(),
+        'mtime': os.path.getmtime(path)
+    }
+
+def store_mtime(path):
+    """Get the modification time of a dataset store, which changes whenever its index is written"""
+    return os.path.getmtime(os.path.join(path, INDEX_FILE))
+
+def store_record(dataset_id, store, path=None):
+    """
+    Build the catalog record of a binary dataset store (or its writer)
+
+    Args:
+        dataset_id: Id of the dataset
+        store: DatasetStore or closed DatasetWriter
+        path: Where the store is now, if it was moved after it was written
+    """
+    return {
+        'id': dataset_id,
+        'name': dataset_id,
+        'item_count': len(store),
+        'format': 'binary',
+        'created_at': store.index.get('created_at'),
+        'mtime': store_mtime(path or store.path)
+    }
@@ -0,0 +1,400 @@
+import os
+import io
+import json
+import tempfile
+import numpy as np
+from datetime import datetime
+from PIL import Image
+from model.utils import base64_to_image
+
+STORE_FORMAT = 'unshiney-shards'
+STORE_VERSION = 1
+INDEX_FILE = 'index.json'
+DEFAULT_SHARD_SIZE = 4096
+
+def is_store(path):
+    """Check whether a path holds a binary dataset store"""
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temporary file of its own and move it into place"""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def image_to_array(img, shape):
+    """
+    Convert a PIL Image to a grayscale uint8 array of a fixed shape
+
+    Args:
+        img: PIL Image
+        shape: (height, width) of the result
+
+    Returns:
+        numpy uint8 array of the requested shape
+    """
+    img = img.convert('L')
+    if img.size != (shape[1], shape[0]):
+        img = img.resize((shape[1], shape[0]), Image.LANCZOS)
+    return np.asarray(img, dtype=np.uint8)
+
+class DatasetWriter:
+    """
+    Appends image pairs to a binary dataset store
+
+    Each pair is stored as a fixed-size uint8 record (original then clean)
+    in shard files that can be memory-mapped as (count, 2, H, W) arrays.
+    The index with shape, dtype, shard counts and item ids is written when
+    the writer is closed. Opening a writer on an existing store appends.
+    """
+    def __init__(self, path, shape=None, shard_size=DEFAULT_SHARD_SIZE):
+        """
+        Open a store for writing
+
+        Args:
+            path: Directory of the store
+            shape: (height, width) of every image, required for a new store
+            shard_size: Number of pairs per shard file
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        if is_store(path):
+            with open(os.path.join(path, INDEX_FILE), 'r') as f:
+                self.index = json.load(f)
+        else:
+            if shape is None:
+                raise ValueError('shape is required to create a dataset store')
+            self.index = {
+                'format': STORE_FORMAT,
+                'version': STORE_VERSION,
+                'shape': [int(shape[0]), int(shape[1])],
+                'dtype': 'uint8',
+                'shard_size': int(shard_size),
+                'item_count': 0,
+                'shards': [],
+                'ids': [],
+                'created_at': datetime.now().isoformat()
+            }
+
+        self.shape = tuple(self.index['shape'])
+        self.item_bytes = 2 * self.shape[0] * self.shape[1]
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.index['item_count']
+
+    def _current_shard(self):
+        """Get the file of the shard to append to, starting a new one when full"""
+        shards = self.index['shards']
+        if not shards or shards[-1]['count'] >= self.index['shard_size']:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            shards.append({'file': f"shard_{len(shards):05d}.bin", 'count': 0})
+
+        if self._file is None:
+            shard_path = os.path.join(self.path, shards[-1]['file'])
+            self._file = open(shard_path, 'ab')
+            # Drop bytes of an interrupted write that never made it into the index
+            self._file.truncate(shards[-1]['count'] * self.item_bytes)
+        return self._file
+
+    def append(self, original, clean, item_id=None):
+        """
+        Append one image pair
+
+        Args:
+            original: uint8 array of the image with shine
+            clean: uint8 array of the clean image
+            item_id: Optional id of the item (defaults to its position)
+
+        Returns:
+            The id the item was stored under
+        """
+        original = np.asarray(original, dtype=np.uint8)
+        clean = np.asarray(clean, dtype=np.uint8)
+        if original.shape != self.shape or clean.shape != self.shape:
+            raise ValueError(f"Expected images of shape {self.shape}, got {original.shape} and {clean.shape}")
+
+        if item_id is None:
+            item_id = self.index['item_count']
+
+        f = self._current_shard()
+        f.write(np.ascontiguousarray(original))
+        f.write(np.ascontiguousarray(clean))
+
+        self.index['shards'][-1]['count'] += 1
+        self.index['item_count'] += 1
+        self.index['ids'].append(str(item_id))
+        return str(item_id)
+
+    def append_batch(self, originals, cleans, item_ids=None):
+        """
+        Append N image pairs with one write per shard
+
+        Args:
+            originals: N×H×W uint8 array of images with shine
+            cleans: N×H×W uint8 array of clean images
+            item_ids: Optional sequence of N ids (defaults to positions)
+
+        Returns:
+            List of the ids the items were stored under
+        """
+        originals = np.asarray(originals, dtype=np.uint8)
+        cleans = np.asarray(cleans, dtype=np.uint8)
+        if originals.shape[1:] != self.shape or cleans.shape != originals.shape:
+            raise ValueError(f"Expected stacks of shape (N, {self.shape[0]}, {self.shape[1]}), "
+                             f"got {originals.shape} and {cleans.shape}")
+
+        count = len(originals)
+        first = self.index['item_count']
+        if item_ids is None:
+            item_ids = range(first, first + count)
+        item_ids = [str(item_id) for item_id in item_ids]
+        if len(item_ids) != count:
+            raise ValueError(f"Got {len(item_ids)} ids for {count} pairs")
+
+        done = 0
+        while done < count:
+            f = self._current_shard()
+            shard = self.index['shards'][-1]
+            take = min(self.index['shard_size'] - shard['count'], count - done)
+
+            # Interleave to the (count, 2, H, W) record layout
+            records = np.stack((originals[done:done + take], cleans[done:done + take]), axis=1)
+            f.write(records)
+
+            shard['count'] += take
+            self.index['item_count'] += take
+            done += take
+
+        self.index['ids'].extend(item_ids)
+        return item_ids
+
+    def append_images(self, original, clean, item_id=None, resize=False):
+        """
+        Append one pair of PIL Images
+
+        Stores hold grayscale images, so color images are stored as their
+        'L' luminance. Images of another size than the store's are refused
+        unless resize is set.
+
+        Args:
+            original: PIL Image with shine
+            clean: PIL Image of the clean image
+            item_id: Optional id of the item (defaults to its position)
+            resize: Resize images to the store's shape instead of refusing them
+
+        Returns:
+            The id the item was stored under
+        """
+        size = (self.shape[1], self.shape[0])
+        if not resize and (original.size != size or clean.size != size):
+            raise ValueError(f"Expected {size[0]}x{size[1]} images, "
+                             f"got {original.size[0]}x{original.size[1]} and {clean.size[0]}x{clean.size[1]}")
+        return self.append(image_to_array(original, self.shape),
+                           image_to_array(clean, self.shape), item_id)
+
+    def close(self):
+        """Flush the shard being written and write the index"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.index['updated_at'] = datetime.now().isoformat()
+        _write_json_atomic(os.path.join(self.path, INDEX_FILE), self.index)
+
+class DatasetStore:
+    """
+    Read-only random access to a binary dataset store
+
+    Shards are memory-mapped on first use, so reading one item touches
+    only that item's bytes.
+    """
+    def __init__(self, path):
+        """
+        Open a store
+
+        Args:
+            path: Directory of the store
+        """
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), 'r') as f:
+            self.index = json.load(f)
+        if self.index.get('format') != STORE_FORMAT:
+            raise ValueError(f"{path} is not a dataset store")
+
+        self.shape = tuple(self.index['shape'])
+        self.dtype = np.dtype(self.index['dtype'])
+        self.shard_size = self.index['shard_size']
+        self.ids = self.index['ids']
+        self._positions = None
+        self._shards = {}
+
+    def __len__(self):
+        return self.index['item_count']
+
+    def _shard(self, shard_number):
+        """Get the memory map of a shard as a (count, 2, H, W) array"""
+        shard = self._shards.get(shard_number)
+        if shard is None:
+            info = self.index['shards'][shard_number]
+            shard = np.memmap(
+                os.path.join(self.path, info['file']),
+                dtype=self.dtype, mode='r',
+                shape=(info['count'], 2) + self.shape
+            )
+            self._shards[shard_number] = shard
+        return shard
+
+    def position(self, item_id):
+        """Get the position of an item id in the store"""
+        if self._positions is None:
+            self._positions = {item: i for i, item in enumerate(self.ids)}
+        try:
+            return self._positions[str(item_id)]
+        except KeyError:
+            raise KeyError(f"No item {item_id!r} in dataset") from None
+
+    def get_at(self, position):
+        """
+        Get the pair stored at a position
+
+        Returns:
+            Tuple (original, clean) of read-only uint8 arrays
+        """
+        if not 0 <= position < len(self):
+            raise IndexError(f"Position {position} out of range")
+        pair = self._shard(position // self.shard_size)[position % self.shard_size]
+        return pair[0], pair[1]
+
+    def get(self, item_id):
+        """
+        Get the pair stored under an item id
+
+        Returns:
+            Tuple (original, clean) of read-only uint8 arrays
+        """
+        return self.get_at(self.position(item_id))
+
+    def iter_pairs(self, start=0, stop=None):
+        """Iterate over (item_id, original, clean) in storage order"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for position in range(start, stop):
+            original, clean = self.get_at(position)
+            yield self.ids[position], original, clean
+
+    def thumbnail(self, position, which='original', size=64):
+        """
+        Get a PNG thumbnail of one image of a pair, generating it on first use
+
+        Thumbnails are cached as files under the store's thumbnails folder,
+        so each one is only ever encoded once.
+
+        Args:
+            position: Position of the pair in the store
+            which: 'original' or 'clean'
+            size: Maximum width and height of the thumbnail
+
+        Returns:
+            PNG encoded bytes
+        """
+        if which not in ('original', 'clean'):
+            raise ValueError(f"Unknown image {which!r}")
+
+        thumb_path = os.path.join(self.path, 'thumbnails', str(int(size)), f"{position}_{which}.png")
+        try:
+            with open(thumb_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        original, clean = self.get_at(position)
+        img = Image.fromarray(np.array(original if which == 'original' else clean))
+        img.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+        data = buffer.getvalue()
+
+        # Write to a temporary file first so readers never see half a thumbnail
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, thumb_path)
+        return data
+
+    def close(self):
+        """Drop the shard memory maps"""
+        self._shards.clear()
+
+def convert_json_dataset(json_path, store_path, shape=None, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Convert a JSON dataset of base64 data URLs to a binary dataset store
+
+    Items that cannot be decoded are skipped, as are items of another
+    size than the first one unless a shape is given to resize them to.
+
+    Args:
+        json_path: Path of the JSON dataset file
+        store_path: Directory of the store to create
+        shape: (height, width) to resize images to (defaults to the first item's size)
+        shard_size: Number of pairs per shard file
+
+    Returns:
+        Tuple (item_count, skipped_count)
+    """
+    resize = shape is not None
+    with open(json_path, 'r') as f:
+        items = json.load(f)
+
+    writer = None
+    skipped = 0
+    try:
+        for position, item in enumerate(items):
+            try:
+                original = base64_to_image(item['original'])
+                clean = base64_to_image(item['clean'])
+                if writer is None:
+                    if shape is None:
+                        shape = (original.size[1], original.size[0])
+                    writer = DatasetWriter(store_path, shape=shape, shard_size=shard_size)
+                writer.append_images(original, clean, item.get('id', position), resize=resize)
+            except Exception:
+                # Skip items without decodable image pairs of the dataset's size
+                skipped += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return (len(writer) if writer is not None else 0), skipped
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert JSON datasets to binary dataset stores')
+    parser.add_argument('folder', nargs='?', default='datasets', help='Folder with JSON datasets')
+    parser.add_argument('--size', type=int, default=None, help='Store images at this square size')
+    args = parser.parse_args()
+
+    shape = (args.size, args.size) if args.size else None
+    for file in sorted(os.listdir(args.folder)):
+        if not file.endswith('.json'):
+            continue
+        store_path = os.path.join(args.folder, file[:-len('.json')])
+        if is_store(store_path):
+            print(f"Skipping {file}: already converted")
+            continue
+        count, skipped = convert_json_dataset(os.path.join(args.folder, file), store_path, shape=shape)
+        print(f"Converted {file}: {count} items ({skipped} skipped)")
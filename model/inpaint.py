@@ -0,0 +1,177 @@
+import time
+import numpy as np
+
+# Relaxation sweeps per pyramid level, and per extra coarsest level sweep
+DEFAULT_ITERATIONS = 20
+# Largest change, in gray levels, at which a level stops early
+DEFAULT_TOLERANCE = 0.05
+# The pyramid stops once the smaller side would drop below this
+_MIN_SIDE = 4
+
+def pyramid_levels(shape):
+    """Number of halvings before the smaller side of shape drops below 4 pixels"""
+    side = min(shape)
+    levels = 0
+    while side // 2 >= _MIN_SIDE:
+        side //= 2
+        levels += 1
+    return levels
+
+def _downsample(values, known):
+    """
+    Average every 2×2 block of a level
+
+    A block is known only if all of its pixels are: the mean of a partly
+    known block sits off the block's centre and would bias the boundary
+    the coarser fill starts from. Partly known blocks still count if no
+    block is fully known.
+    """
+    height, width = values.shape
+    rows, cols = -(-height // 2), -(-width // 2)
+    weight = np.zeros((rows * 2, cols * 2), dtype=np.float32)
+    weight[:height, :width] = known
+    total = np.zeros_like(weight)
+    total[:height, :width] = values
+    total *= weight
+    pixels = np.zeros_like(weight)
+    pixels[:height, :width] = 1
+
+    total = total.reshape(rows, 2, cols, 2).sum(axis=(1, 3))
+    weight = weight.reshape(rows, 2, cols, 2).sum(axis=(1, 3))
+    pixels = pixels.reshape(rows, 2, cols, 2).sum(axis=(1, 3))
+    coarse_known = weight == pixels
+    if not coarse_known.any():
+        coarse_known = weight > 0
+    np.divide(total, weight, out=total, where=weight > 0)
+    return total, coarse_known
+
+def _interpolation(fine, coarse):
+    """Indices and weights interpolating a coarse axis at the centres of a fine one"""
+    # Coarse pixel i covers fine pixels 2i and 2i + 1, so its centre is at 2i + 0.5
+    position = np.clip((np.arange(fine) - 0.5) / 2, 0, coarse - 1)
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, coarse - 1)
+    return low, high, (position - low).astype(np.float32)
+
+def _upsample(coarse, shape):
+    """Bilinear enlargement of a coarse level to shape"""
+    low, high, fraction = _interpolation(shape[0], coarse.shape[0])
+    rows = coarse[low] * (1 - fraction)[:, np.newaxis] + coarse[high] * fraction[:, np.newaxis]
+    low, high, fraction = _interpolation(shape[1], coarse.shape[1])
+    return rows[:, low] * (1 - fraction) + rows[:, high] * fraction
+
+def _relax(values, unknown, iterations, tolerance, deadline):
+    """
+    Red-black Gauss-Seidel sweeps of Laplace's equation on the unknown pixels
+
+    Known pixels are fixed boundary values and the image edges reflect,
+    so the unknown pixels converge to the harmonic fill of their boundary.
+    """
+    height, width = values.shape
+    checker = (np.add.outer(np.arange(height), np.arange(width)) % 2).astype(bool)
+    colors = [color for color in (unknown & ~checker, unknown & checker) if color.any()]
+    # Multiplying by a float mask is much faster than a reduction with where=
+    scales = [color.astype(values.dtype) for color in colors]
+    average = np.empty_like(values)
+    change = np.empty_like(values)
+
+    for _ in range(iterations):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        largest = 0.0
+        for color, scale in zip(colors, scales):
+            # Mean of the four neighbours, an edge pixel counting itself for the missing one
+            average[1:] = values[:-1]
+            average[0] = values[0]
+            average[:-1] += values[1:]
+            average[-1] += values[-1]
+            average[:, 1:] += values[:, :-1]
+            average[:, 0] += values[:, 0]
+            average[:, :-1] += values[:, 1:]
+            average[:, -1] += values[:, -1]
+            average *= 0.25
+
+            np.subtract(average, values, out=change)
+            np.abs(change, out=change)
+            change *= scale
+            largest = max(largest, float(change.max()))
+            np.copyto(values, average, where=color)
+        if largest < tolerance:
+            break
+    return values
+
+def pyramid_inpaint(img_array, mask, levels=None, iterations=DEFAULT_ITERATIONS,
+                    tolerance=DEFAULT_TOLERANCE, time_budget=None, deadline=None):
+    """
+    Fill the masked pixels of an image with a coarse to fine harmonic fill
+
+    The known pixels are averaged down an image pyramid until the holes
+    shrink to a few pixels. The coarsest level is filled by relaxing
+    Laplace's equation from the mean of its known pixels, and every finer
+    level starts from the level below, enlarged, and only needs a few
+    relaxation sweeps to converge. The total cost is a small multiple of
+    the pixel count however large the holes are. Once the time budget is
+    spent the remaining levels are only enlarged, not relaxed, so a
+    complete (if blockier) fill is always returned.
+
+    Args:
+        img_array: 2-D grayscale image
+        mask: Boolean array of the image's shape, True for pixels to fill
+        levels: Number of pyramid levels below the full resolution (None
+            to halve until the holes are a few pixels across)
+        iterations: Maximum relaxation sweeps per level
+        tolerance: Largest change in gray levels at which a level stops
+        time_budget: Optional maximum number of seconds to spend
+        deadline: Optional time.perf_counter() value to stop relaxing at,
+            shared by calls that split one budget
+
+    Returns:
+        float32 array of the image's shape: known pixels unchanged and
+        masked pixels filled
+    """
+    if levels is not None and levels < 0:
+        raise ValueError('levels must not be negative')
+    if time_budget is not None:
+        budget_end = time.perf_counter() + time_budget
+        deadline = budget_end if deadline is None else min(deadline, budget_end)
+
+    result = np.array(img_array, dtype=np.float32)
+    unknown = np.asarray(mask, dtype=bool)
+    if not unknown.any():
+        return result
+    if unknown.all():
+        # Nothing to fill from
+        result[:] = result.mean()
+        return result
+
+    # Only the holes and a margin around them are filled
+    rows = np.flatnonzero(unknown.any(axis=1))
+    cols = np.flatnonzero(unknown.any(axis=0))
+    if levels is None:
+        levels = pyramid_levels((len(rows), len(cols)))
+    # Two blocks of the coarsest level, so it keeps fully known pixels around the holes
+    margin = 2 ** (levels + 1)
+    box = (slice(max(rows[0] - margin, 0), rows[-1] + 1 + margin),
+           slice(max(cols[0] - margin, 0), cols[-1] + 1 + margin))
+    values, known = result[box], ~unknown[box]
+
+    # Average the known pixels down the pyramid
+    pyramid = [(values, known)]
+    for _ in range(levels):
+        coarse, coarse_known = _downsample(*pyramid[-1])
+        pyramid.append((coarse, coarse_known))
+        if coarse_known.all() or min(coarse.shape) < 2:
+            break
+
+    # Start the coarsest holes from the mean and relax them fully
+    coarse, coarse_known = pyramid[-1]
+    coarse[~coarse_known] = coarse[coarse_known].mean()
+    _relax(coarse, ~coarse_known, iterations * 4, tolerance, deadline)
+
+    # Enlarge each level into the holes of the next finer one and relax
+    for values, known in reversed(pyramid[:-1]):
+        unknown = ~known
+        np.copyto(values, _upsample(coarse, values.shape), where=unknown)
+        _relax(values, unknown, iterations, tolerance, deadline)
+        coarse = values
+    return result
@@ -0,0 +1,241 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class TrainingJob:
+    """
+    State of one background training run
+
+    Progress is published by the worker through update() and read by any
+    number of clients through snapshot() or wait_for_change().
+    """
+    def __init__(self, job_id, epochs, params=None):
+        """
+        Create a queued job
+
+        Args:
+            job_id: Id of the job
+            epochs: Number of epochs the job will train
+            params: Optional training parameters to report back
+        """
+        self.id = job_id
+        self.epochs = epochs
+        self.params = params or {}
+        self.status = QUEUED
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.epoch = 0
+        self.history = {'loss': [], 'val_loss': []}
+        self.samples_per_sec = None
+        self.eta_seconds = None
+        self.result = None
+        self.error = None
+
+        # Every change bumps the version and wakes up waiting clients
+        self.version = 0
+        self._changed = threading.Condition()
+        self._cancel = threading.Event()
+        self._start_time = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def _set(self, **fields):
+        """Update fields and notify waiting clients"""
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def start(self):
+        """Mark the job as running"""
+        self._start_time = time.perf_counter()
+        self._set(status=RUNNING, started_at=datetime.now().isoformat())
+
+    def on_epoch_end(self, epoch, stats):
+        """Record the stats of a finished epoch (the training callback)"""
+        with self._changed:
+            self.history['loss'].append(stats['loss'])
+            self.history['val_loss'].append(stats['val_loss'])
+        elapsed = time.perf_counter() - self._start_time
+        done = epoch + 1
+        self._set(
+            epoch=done,
+            samples_per_sec=round(stats['samples_per_sec'], 1),
+            eta_seconds=round(elapsed / done * (self.epochs - done), 1)
+        )
+
+    def finish(self, result=None, error=None):
+        """Mark the job as completed, failed or cancelled"""
+        if error is not None:
+            status = FAILED
+        elif self.cancel_requested:
+            status = CANCELLED
+        else:
+            status = COMPLETED
+        self._set(status=status, result=result, error=error, eta_seconds=0.0,
+                  finished_at=datetime.now().isoformat())
+
+    def cancel(self):
+        """Ask the job to stop; a queued job is cancelled right away"""
+        self._cancel.set()
+        with self._changed:
+            if self.status == QUEUED:
+                self.status = CANCELLED
+                self.finished_at = datetime.now().isoformat()
+                self.version += 1
+                self._changed.notify_all()
+
+    def snapshot(self):
+        """Get the job's state as a JSON serializable dictionary"""
+        with self._changed:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'epoch': self.epoch,
+                'epochs': self.epochs,
+                'progress': round(self.epoch / self.epochs, 4) if self.epochs else 1.0,
+                'history': {key: list(values) for key, values in self.history.items()},
+                'samples_per_sec': self.samples_per_sec,
+                'eta_seconds': self.eta_seconds,
+                'params': self.params,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'result': self.result,
+                'error': self.error,
+                'version': self.version
+            }
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the job changes past a version
+
+        Args:
+            version: Last version the caller has seen
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            True if the job changed, False on timeout
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version > version, timeout)
+
+class JobManager:
+    """
+    Runs training jobs on a bounded pool of worker threads
+
+    Training spends its time in NumPy, which releases the GIL, so the
+    request threads stay responsive while jobs run. At most max_queued
+    jobs wait for a worker; finished jobs are kept for polling until
+    max_finished newer ones have finished.
+    """
+    def __init__(self, max_workers=2, max_queued=16, max_finished=100):
+        """
+        Create the job manager
+
+        Args:
+            max_workers: Number of jobs that train at the same time
+            max_queued: Maximum number of jobs waiting for a worker
+            max_finished: Number of finished jobs to remember
+        """
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, epochs, params=None):
+        """
+        Queue a training job
+
+        Args:
+            fn: Callable fn(job) that trains, using job.on_epoch_end as the epoch
+                callback and job.cancel_requested to stop; returns the job result
+            epochs: Number of epochs the job will train
+            params: Optional training parameters to report back
+
+        Returns:
+            The queued TrainingJob
+        """
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} training jobs are already waiting")
+            job = TrainingJob(uuid.uuid4().hex, epochs, params)
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        """Run a job on a worker thread"""
+        if job.finished:
+            # Cancelled while queued
+            return
+        job.start()
+        try:
+            result = fn(job)
+        except Exception as e:
+            job.finish(error=str(e))
+        else:
+            job.finish(result=result)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Get a job by id (None if unknown)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """Get snapshots of all known jobs, oldest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in jobs]
+
+    def cancel(self, job_id):
+        """
+        Cancel a job
+
+        Returns:
+            The job, or None if unknown
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def shutdown(self, wait=True):
+        """Cancel every job and stop the workers"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=wait)
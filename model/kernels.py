@@ -0,0 +1,187 @@
+import numpy as np
+from functools import lru_cache
+from scipy import ndimage
+from skimage import morphology
+
+def _read_only(array):
+    """Mark a cached array read-only so callers cannot corrupt the cache"""
+    array.setflags(write=False)
+    return array
+
+@lru_cache(maxsize=128)
+def gaussian_kernel(sigma, truncate=4.0):
+    """
+    Get a normalized 1-D Gaussian kernel
+
+    Built exactly the way ndimage.gaussian_filter builds its kernels, so
+    filtering with it gives bit-identical results.
+
+    Args:
+        sigma: Standard deviation of the Gaussian
+        truncate: Truncate the kernel at this many standard deviations
+
+    Returns:
+        Read-only 1-D float64 array
+    """
+    sigma = float(sigma)
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    phi_x = np.exp(-0.5 / (sigma * sigma) * x ** 2)
+    phi_x = phi_x / phi_x.sum()
+    return _read_only(phi_x)
+
+@lru_cache(maxsize=128)
+def gaussian_dct_response(length, sigma):
+    """
+    Get the response of gaussian_blur along one axis in the DCT-II basis
+
+    gaussian_blur reflects the image about its borders (ndimage mode
+    'reflect'), and a symmetric filter with that extension is diagonal in
+    the DCT-II basis: dct(blurred) == response * dct(image), with the
+    unnormalized scipy.fft.dct. This holds for kernels longer than the axis
+    too.
+
+    Args:
+        length: Number of samples along the axis
+        sigma: Standard deviation of the Gaussian
+
+    Returns:
+        Read-only 1-D float64 array of the given length
+    """
+    if sigma <= 1e-15:
+        return _read_only(np.ones(length))
+    weights = gaussian_kernel(sigma)
+    radius = len(weights) // 2
+    phase = np.outer(np.arange(length), np.arange(-radius, radius + 1)) * (np.pi / length)
+    return _read_only(np.cos(phase) @ weights)
+
+@lru_cache(maxsize=32)
+def disk_footprint(radius):
+    """
+    Get a disk shaped structuring element
+
+    Args:
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Read-only uint8 array as returned by morphology.disk
+    """
+    return _read_only(morphology.disk(radius))
+
+def gaussian_blur(img_array, sigma, output=None):
+    """
+    Blur an image with a cached Gaussian kernel
+
+    Equivalent to ndimage.gaussian_filter(img_array, sigma) including the
+    dtype of the result, without rebuilding the kernel on every call. Only
+    the last two (spatial) axes are filtered, so an N×H×W stack is blurred
+    image by image.
+
+    Args:
+        img_array: 2-D image or N×H×W stack
+        sigma: Standard deviation of the Gaussian
+        output: Optional array to write the result to
+
+    Returns:
+        Blurred numpy array with the same dtype as the input
+    """
+    if output is None:
+        output = np.zeros_like(img_array)
+    if sigma <= 1e-15:
+        output[...] = img_array
+        return output
+    weights = gaussian_kernel(sigma)
+    ndimage.correlate1d(img_array, weights, -2, output)
+    ndimage.correlate1d(output, weights, -1, output)
+    return output
+
+def truncated_blur(img_array, sigma, workspace, scale_space=None):
+    """
+    Gaussian blur of whole gray levels, truncated the way a uint8 blur is
+
+    ndimage truncates the result of each 1-D pass of a uint8 blur. The
+    passes write to a uint8 scratch buffer so the result is the same bit
+    for bit: truncating a float32 blur instead flips the pixels whose sums
+    round up to the next whole level in float32.
+
+    Args:
+        img_array: float32 array of whole gray levels, blurred in place
+        sigma: Standard deviation of the Gaussian
+        workspace: Workspace to take the scratch buffer from
+        scale_space: Optional ScaleSpace of img_array to take the blur from
+
+    Returns:
+        img_array
+    """
+    if scale_space is not None:
+        scratch = scale_space.truncated(sigma)
+    else:
+        scratch = gaussian_blur(img_array, sigma, output=workspace.get('blur_uint8', img_array.shape, np.uint8))
+    np.copyto(img_array, scratch)
+    return img_array
+
+def unsharp_mask(img_array, sigma, amount, workspace, scale_space=None):
+    """
+    Add back a scaled high-pass of whole gray levels, in place
+
+    Computes x + (x - blur(x)) * amount with a signed high-pass, so pixels
+    darker than their surroundings get darker. The blur is truncated like
+    a uint8 blur.
+
+    Args:
+        img_array: float32 array of whole gray levels
+        sigma: Standard deviation of the blur
+        amount: Weight of the high-pass
+        workspace: Workspace to take the scratch buffers from
+        scale_space: Optional ScaleSpace of img_array to take the blur from
+
+    Returns:
+        img_array, not yet clipped or truncated
+    """
+    if scale_space is not None:
+        blurred = scale_space.truncated(sigma)
+    else:
+        blurred = gaussian_blur(img_array, sigma, output=workspace.get('blur_uint8', img_array.shape, np.uint8))
+    highpass = np.subtract(img_array, blurred, out=workspace.get('highpass', img_array.shape))
+    highpass *= amount
+    img_array += highpass
+    return img_array
+
+def spatial_sobel(img_stack, axis, output=None):
+    """
+    Sobel filter of an N×H×W stack along a spatial axis
+
+    Mirrors ndimage.sobel on each 2-D image: the derivative runs along
+    ``axis`` (0 for rows, 1 for columns) and the smoothing only along the
+    other spatial axis, never across the stack.
+    """
+    if output is None:
+        output = np.zeros_like(img_stack)
+    derivative_axis = axis + 1
+    smoothing_axis = 2 if derivative_axis == 1 else 1
+    ndimage.correlate1d(img_stack, [-1, 0, 1], derivative_axis, output)
+    ndimage.correlate1d(output, [1, 2, 1], smoothing_axis, output)
+    return output
+
+def edge_blend(img_stack, workspace):
+    """
+    Blend an N×H×W stack of whole gray levels with its Sobel edge magnitude, in place
+
+    Computes 0.8 * x + 0.2 * sqrt(sobel_h**2 + sobel_v**2) with signed
+    float32 Sobel filters, so strong edges brighten instead of wrapping
+    around.
+
+    Args:
+        img_stack: float32 N×H×W stack of whole gray levels
+        workspace: Workspace to take the scratch buffers from
+
+    Returns:
+        img_stack, not yet clipped or truncated
+    """
+    edge_h = spatial_sobel(img_stack, axis=0, output=workspace.get('edge_h', img_stack.shape))
+    edge_v = spatial_sobel(img_stack, axis=1, output=workspace.get('edge_v', img_stack.shape))
+    magnitude = np.hypot(edge_h, edge_v, out=edge_h)
+    magnitude *= 0.2
+    img_stack *= 0.8
+    img_stack += magnitude
+    return img_stack
@@ -0,0 +1,139 @@
+import numpy as np
+from skimage import exposure
+
+# Every uint8 value, the domain of a lookup table
+LUT_DOMAIN = np.arange(256, dtype=np.uint8)
+LUT_DOMAIN.setflags(write=False)
+
+def _read_only(table):
+    """Mark a table read-only so shared tables cannot be corrupted"""
+    table.setflags(write=False)
+    return table
+
+def point_lut(func):
+    """
+    Tabulate a uint8 -> uint8 point operation over all 256 input values
+
+    Args:
+        func: Function mapping a uint8 array to a uint8 array of the same shape
+
+    Returns:
+        Read-only 256 entry uint8 table
+    """
+    return _read_only(np.asarray(func(LUT_DOMAIN), dtype=np.uint8))
+
+def gain_lut(gain):
+    """Table of np.clip(v * gain, 0, 255).astype(np.uint8)"""
+    return point_lut(lambda v: np.clip(v.astype(float) * gain, 0, 255).astype(np.uint8))
+
+def offset_lut(offset):
+    """Table of np.clip(v + offset, 0, 255).astype(np.uint8)"""
+    return point_lut(lambda v: np.clip(v.astype(float) + offset, 0, 255).astype(np.uint8))
+
+def gamma_lut(gamma, gain=1.0):
+    """Table of exposure.adjust_gamma(v, gamma, gain) on uint8 values"""
+    return point_lut(lambda v: exposure.adjust_gamma(v, gamma=gamma, gain=gain))
+
+def compose(*tables):
+    """
+    Compose lookup tables into one
+
+    Args:
+        tables: uint8 tables in the order they are applied
+
+    Returns:
+        Read-only table equal to applying every table in turn
+    """
+    composed = LUT_DOMAIN
+    for table in tables:
+        composed = table[composed]
+    return _read_only(np.array(composed))
+
+def apply_lut(table, img_array, out=None):
+    """
+    Apply a lookup table to a uint8 image with one indexed lookup per pixel
+
+    Args:
+        table: 256 entry table of any dtype
+        img_array: uint8 array of any shape
+        out: Optional output array of the table's dtype
+
+    Returns:
+        Array of the image's shape and the table's dtype
+    """
+    if out is None:
+        return np.take(table, img_array)
+    return np.take(table, img_array, out=out, mode='clip')
+
+def histogram(img_array):
+    """
+    256 bin histogram of uint8 images with one np.bincount
+
+    Args:
+        img_array: uint8 H×W image or N×H×W stack
+
+    Returns:
+        int64 array of shape (256,), or (N, 256) for a stack
+    """
+    img_array = np.asarray(img_array)
+    if img_array.ndim < 3:
+        return np.bincount(img_array.ravel(), minlength=256)
+
+    # Offset every image into its own block of 256 bins
+    count = len(img_array)
+    offsets = (np.arange(count, dtype=np.intp) * 256)[:, np.newaxis]
+    flat = img_array.reshape(count, -1) + offsets
+    return np.bincount(flat.ravel(), minlength=256 * count).reshape(count, 256)
+
+def equalize_lut(hist):
+    """
+    Histogram equalization table of a uint8 image
+
+    Gives exactly exposure.equalize_hist(img) for a uint8 image whose
+    histogram is hist: the normalized cumulative histogram over the
+    image's own value range.
+
+    Args:
+        hist: 256 bin histogram from histogram()
+
+    Returns:
+        Read-only 256 entry float64 table with values in [0, 1]
+    """
+    present = np.flatnonzero(hist)
+    table = np.zeros(256)
+    if len(present):
+        low, high = present[0], present[-1]
+        cdf = np.cumsum(hist[low:high + 1], dtype=np.float64)
+        table[low:high + 1] = cdf / cdf[-1]
+        table[high + 1:] = 1.0
+    return _read_only(table)
+
+def percentile(hist, q):
+    """
+    Percentile of a uint8 image from its histogram
+
+    Same result as np.percentile(img, q) with linear interpolation,
+    without sorting the image.
+
+    Args:
+        hist: 256 bin histogram, or (N, 256) histograms of a stack
+        q: Percentile between 0 and 100
+
+    Returns:
+        float, or array of N floats for a stack
+    """
+    hist = np.asarray(hist)
+    cumulative = np.cumsum(hist, axis=-1)
+    total = cumulative[..., -1]
+    position = q / 100.0 * (total - 1)
+    below = np.floor(position)
+    fraction = position - below
+
+    def value_at(rank):
+        # The sorted element at a rank falls in the first bin whose cumulative count passes it
+        return (cumulative <= np.asarray(rank)[..., np.newaxis]).sum(axis=-1)
+
+    low = value_at(below)
+    high = value_at(np.minimum(below + 1, total - 1))
+    result = low + (high - low) * fraction
+    return float(result) if np.ndim(result) == 0 else result
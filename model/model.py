@@ -2,8 +2,38 @@ import numpy as np
 import json
 import datetime
 import time
-from scipy import ndimage
-from skimage import exposure, feature, restoration, morphology
+from PIL import Image
+from skimage import feature, restoration
+from model.bilateral import bilateral_filter
+from model.kernels import edge_blend, truncated_blur, unsharp_mask
+from model.lut import apply_lut, gain_lut, histogram, equalize_lut, percentile
+from model.morphology import close_open
+from model.plan import ProcessingPlan
+from model.regions import blur_radius, blurred_box, region_boxes, replace_regions
+from model.scale_space import ScaleSpace
+from model.tv import denoise_tv, tv_options
+from model.workspace import get_workspace
+from model.training import Network, train_network
+
+# Gain of the dense model, truncated to whole levels like the uint8 image it used to give
+_DENSE_GAIN = gain_lut(1.2).astype(np.float32)
+_DENSE_GAIN.setflags(write=False)
+
+# Blur that replaces shine in remove_shine
+_REMOVE_SIGMA = 3
+
+def _resize(img, shape):
+    """Convert an image (array or PIL Image) to a grayscale uint8 array of a given (height, width)"""
+    if isinstance(img, Image.Image):
+        img = img.convert('L')
+    else:
+        img = np.asarray(img)
+        if img.shape == tuple(shape) and img.dtype == np.uint8:
+            return img
+        img = Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).convert('L')
+    if img.size != (shape[1], shape[0]):
+        img = img.resize((shape[1], shape[0]), Image.LANCZOS)
+    return np.asarray(img, dtype=np.uint8)
 
 class UnShineyModel:
     """
@@ -29,6 +59,9 @@ class UnShineyModel:
             'val_loss': []
         }
         
+        # Trained network, replaces the procedural processing once set
+        self.network = None
+        
         # Default model architecture parameters
         self.architecture = self._get_default_architecture()
         
@@ -36,8 +69,20 @@ class UnShineyModel:
         if config and 'layers' in config:
             self.architecture = config['layers']
         
-        # Processing parameters
+        # Processing parameters, compiled once into an execution plan
         self.processing_params = self.config.get('processing_params', {})
+        self.processing_plan = ProcessingPlan(self.processing_params)
+        
+        # Edge preserving filter of the hybrid model: 'exact' (skimage) or
+        # 'fast' (piecewise-linear approximation of the symmetric bilateral
+        # filter, whose output differs from skimage's, see model/bilateral.py)
+        self.bilateral_method = self.config.get('bilateral_method', 'exact')
+        self.bilateral_accuracy = float(self.config.get('bilateral_accuracy', 1.0))
+        if self.bilateral_method not in ('exact', 'fast'):
+            raise ValueError(f"Unknown bilateral_method: {self.bilateral_method}")
+        
+        # Iteration and time budget of the custom model's TV denoising
+        self.denoise_options = tv_options(self.config)
         
         # Initialize metrics
         self.metrics = {
@@ -81,194 +126,219 @@ class UnShineyModel:
                 {'type': 'dense', 'name': 'Output', 'units': self.img_size*self.img_size, 'activation': 'sigmoid'}
             ]
     
-    def process_image(self, img_array):
+    def process_image(self, img_array, scale_space=None):
         """
         Process an image through the model
         
         Args:
             img_array: Numpy array of grayscale image
+            scale_space: Optional ScaleSpace of img_array, shared with other
+                stages that blur it, such as remove_shine
             
         Returns:
             Processed numpy array
         """
         start_time = time.time()
         
-        # Apply different processing based on model type and custom parameters
-        if self.processing_params:
-            processed = self._apply_custom_processing(img_array)
-        else:
-            processed = self._apply_default_processing(img_array)
+        # A single image is processed as a stack of one
+        processed = self._process_stack(img_array[np.newaxis], scale_space)[0]
         
         # Update metrics
-        processing_time = time.time() - start_time
-        self.metrics['processed_images'] += 1
+        self._update_metrics(1, time.time() - start_time)
+            
+        return processed
+    
+    def process_batch(self, img_stack):
+        """
+        Process a stack of images through the model in one call
         
-        # Update average processing time using a running average
+        Every image in the stack is processed exactly as process_image would
+        process it on its own; filters only run along the spatial axes so
+        neighbouring images never bleed into each other.
+        
+        Args:
+            img_stack: Numpy uint8 array of shape (N, H, W)
+            
+        Returns:
+            Processed numpy array of shape (N, H, W)
+        """
+        img_stack = np.ascontiguousarray(img_stack)
+        if img_stack.ndim != 3:
+            raise ValueError(f"Expected an N×H×W stack, got shape {img_stack.shape}")
+        
+        start_time = time.time()
+        
+        if len(img_stack) == 0:
+            return img_stack.copy()
+        
+        processed = self._process_stack(img_stack)
+        
+        # Update metrics
+        self._update_metrics(len(img_stack), time.time() - start_time)
+        
+        return processed
+    
+    def _process_stack(self, img_stack, scale_space=None):
+        """Apply the model's processing to an N×H×W stack"""
+        if self.network is not None:
+            return self._apply_network(img_stack)
+        
+        # Apply different processing based on model type and custom parameters
+        if self.processing_params:
+            return self._apply_custom_processing(img_stack)
+        return self._apply_default_processing(img_stack, scale_space)
+    
+    def _update_metrics(self, count, processing_time):
+        """Fold the processing time of ``count`` images into the running metrics"""
         prev_avg = self.metrics['avg_processing_time']
-        prev_count = self.metrics['processed_images'] - 1
+        prev_count = self.metrics['processed_images']
+        self.metrics['processed_images'] += count
         
+        # Update average processing time using a running average
         if prev_count > 0:
             self.metrics['avg_processing_time'] = (prev_avg * prev_count + processing_time) / self.metrics['processed_images']
         else:
-            self.metrics['avg_processing_time'] = processing_time
-            
-        return processed
+            self.metrics['avg_processing_time'] = processing_time / count
     
-    def _apply_default_processing(self, img_array):
-        """Apply default processing based on model type"""
+    def _apply_default_processing(self, img_stack, scale_space=None):
+        """Apply default processing based on model type to an N×H×W stack"""
+        # Every path works in place on float32 buffers of this thread's workspace.
+        # The dense and conv paths keep the whole gray levels of their
+        # intermediate results, and take their blurs from a ScaleSpace of
+        # the image they blur
+        workspace = get_workspace()
+        if scale_space is None:
+            scale_space = ScaleSpace(img_stack)
+        
         if self.model_type == 'dense':
-            # Fully connected approach: Contrast and brightness adjustments
-            processed = np.clip((img_array.astype(float) * 1.2), 0, 255).astype(np.uint8)
+            # Fully connected approach: Contrast and brightness adjustments, as one table lookup
+            index = workspace.get('lut_index', img_stack.shape, np.intp)
+            np.copyto(index, img_stack)
+            processed = apply_lut(_DENSE_GAIN, index, out=workspace.get('image', img_stack.shape))
             
-            # Add a bit of sharpening
-            blurred = ndimage.gaussian_filter(processed, sigma=1.0)
-            highpass = processed - blurred
-            processed = np.clip(processed + highpass * 0.3, 0, 255).astype(np.uint8)
+            # Add a bit of sharpening, blurring the adjusted image
+            unsharp_mask(processed, 1.0, 0.3, workspace, ScaleSpace(processed))
             
         elif self.model_type == 'conv':
             # Convolutional approach: Edge enhancement and noise reduction
             # Apply Gaussian blur for noise reduction
-            processed = ndimage.gaussian_filter(img_array, sigma=1)
+            processed = truncated_blur(workspace.load(img_stack), 1, workspace, scale_space)
             
-            # Edge enhancement using Sobel filter
-            edge_h = ndimage.sobel(processed, axis=0)
-            edge_v = ndimage.sobel(processed, axis=1)
-            magnitude = np.sqrt(edge_h**2 + edge_v**2)
-            
-            # Blend original with edge enhancement
-            processed = np.clip(processed.astype(float) * 0.8 + magnitude * 0.2, 0, 255).astype(np.uint8)
+            # Blend original with edge enhancement using Sobel filter
+            edge_blend(processed, workspace)
             
         elif self.model_type == 'hybrid':
             # Hybrid approach: Combine multiple techniques
-            # Histogram equalization to improve contrast
-            processed = exposure.equalize_hist(img_array) * 255
+            # Histogram equalization to improve contrast (per image histogram, one bincount)
+            processed = workspace.get('image', img_stack.shape)
+            for img, hist, equalized in zip(img_stack, histogram(img_stack), processed):
+                apply_lut(equalize_lut(hist).astype(np.float32), img, out=equalized)
             
             # Edge preservation
-            processed = restoration.denoise_bilateral(
-                processed.astype(np.float32) / 255.0, 
-                sigma_color=0.1, 
-                sigma_spatial=1
-            )
-            
-            # Convert back to uint8
-            processed = (processed * 255).astype(np.uint8)
+            if self.bilateral_method == 'fast':
+                # Approximation that filters the whole stack at once
+                processed = bilateral_filter(processed, sigma_color=0.1, sigma_spatial=1,
+                                             accuracy=self.bilateral_accuracy)
+            else:
+                # The exact bilateral filter is inherently 2-D
+                for img in processed:
+                    img[...] = restoration.denoise_bilateral(img, sigma_color=0.1, sigma_spatial=1)
+            processed *= 255
             
         else:  # custom or fallback
             # Apply a sequence of image processing techniques
-            processed = img_array.copy()
+            processed = workspace.load(img_stack)
+            processed /= 255
             
-            # Denoise
-            processed = restoration.denoise_tv_chambolle(
-                processed.astype(np.float32) / 255.0,
-                weight=0.1
-            )
+            # Denoise with the configured budget, each image on its own
+            processed, iterations = denoise_tv(processed, weight=0.1, **self.denoise_options)
+            self.metrics['denoise_iterations'] = iterations
             
             # Adjust gamma
-            processed = exposure.adjust_gamma(processed, gamma=0.9)
+            np.power(processed, 0.9, out=processed)
             
             # Enhance edges
-            edges = feature.canny(processed, sigma=2)
-            processed = processed.copy() * 0.9
+            edges = np.stack([feature.canny(img, sigma=2) for img in processed])
+            processed *= 0.9
             processed[edges] = 1.0
-            
-            # Convert back to uint8
-            processed = (processed * 255).astype(np.uint8)
+            processed *= 255
         
-        return processed
+        # Convert back to uint8 once
+        return workspace.to_uint8(processed)
     
-    def _apply_custom_processing(self, img_array):
-        """Apply custom processing based on processing_params"""
-        processed = img_array.copy().astype(np.float32)
-        
-        # Apply each processing step in sequence
-        if 'contrast' in self.processing_params:
-            contrast = float(self.processing_params['contrast'])
-            # Convert to float, adjust contrast, then clip
-            mean = np.mean(processed)
-            processed = (processed - mean) * contrast + mean
-        
-        if 'brightness' in self.processing_params:
-            brightness = float(self.processing_params['brightness'])
-            processed += brightness
-        
-        if 'blur' in self.processing_params:
-            blur = float(self.processing_params['blur'])
-            processed = ndimage.gaussian_filter(processed, sigma=blur)
-        
-        if 'sharpen' in self.processing_params:
-            sharpen = float(self.processing_params['sharpen'])
-            if sharpen > 0:
-                blurred = ndimage.gaussian_filter(processed, sigma=1.0)
-                highpass = processed - blurred
-                processed = processed + highpass * sharpen
-        
-        if 'equalize' in self.processing_params and self.processing_params['equalize']:
-            # Convert to 0-1 range, equalize, then back to original range
-            min_val, max_val = processed.min(), processed.max()
-            if max_val > min_val:
-                normalized = (processed - min_val) / (max_val - min_val)
-                equalized = exposure.equalize_hist(normalized)
-                processed = equalized * (max_val - min_val) + min_val
-        
-        if 'denoise' in self.processing_params:
-            denoise = float(self.processing_params['denoise'])
-            if denoise > 0:
-                # Scale to 0-1 for denoising algorithms
-                min_val, max_val = processed.min(), processed.max()
-                if max_val > min_val:
-                    normalized = (processed - min_val) / (max_val - min_val)
-                    denoised = restoration.denoise_tv_chambolle(normalized, weight=denoise)
-                    processed = denoised * (max_val - min_val) + min_val
-        
-        if 'edge_enhance' in self.processing_params:
-            edge_enhance = float(self.processing_params['edge_enhance'])
-            if edge_enhance > 0:
-                edges = feature.canny(
-                    processed / np.max(processed), 
-                    sigma=1.0
-                )
-                processed[edges] = np.max(processed)
-        
-        # Clip and convert back to uint8
-        processed = np.clip(processed, 0, 255).astype(np.uint8)
-        
+    def _apply_custom_processing(self, img_stack):
+        """Apply custom processing based on processing_params to an N×H×W stack"""
+        processed = self.processing_plan.run(img_stack)
+        denoise_step = self.processing_plan.find('denoise')
+        if denoise_step is not None:
+            self.metrics['denoise_iterations'] = denoise_step.iterations
         return processed
     
-    def train(self, dataset, epochs=10, batch_size=32, learning_rate=0.001, validation_split=0.2):
+    def _apply_network(self, img_stack):
+        """Run an N×H×W stack through the trained network at the model's image size"""
+        size = (self.img_size, self.img_size)
+        if img_stack.shape[1:] == size:
+            return self.network.predict(img_stack)
+        
+        # Resize to the network's input size and back
+        resized = np.stack([_resize(img, size) for img in img_stack])
+        predicted = self.network.predict(resized)
+        return np.stack([_resize(img, img_stack.shape[1:]) for img in predicted])
+    
+    def _training_arrays(self, dataset):
+        """Stack (input, target) pairs into two uint8 arrays at the model's image size"""
+        size = (self.img_size, self.img_size)
+        inputs = np.empty((len(dataset),) + size, dtype=np.uint8)
+        targets = np.empty((len(dataset),) + size, dtype=np.uint8)
+        for i, (input_img, target_img) in enumerate(dataset):
+            inputs[i] = _resize(input_img, size)
+            targets[i] = _resize(target_img, size)
+        return inputs, targets
+    
+    def train(self, dataset, epochs=10, batch_size=32, learning_rate=0.001, validation_split=0.2,
+              on_epoch_end=None, should_stop=None, seed=None):
         """
-        Simulate training on a dataset
+        Train the model's architecture on a dataset
+        
+        Builds the layers of the architecture as a NumPy network and trains it
+        with mini-batch Adam on mean absolute error. Once trained, the network
+        is used to process images.
         
         Args:
-            dataset: List of image pairs (input, target)
+            dataset: List of image pairs (input, target) as arrays or PIL Images
             epochs: Number of epochs to train
             batch_size: Batch size
             learning_rate: Learning rate
             validation_split: Fraction of data to use for validation
+            on_epoch_end: Optional callback(epoch, stats) called after every epoch
+            should_stop: Optional callable that stops training when it returns True
+            seed: Optional random seed for initialization and shuffling
             
         Returns:
             Training history dictionary
         """
-        # Reset training history
-        self.training_history = {
-            'loss': [],
-            'val_loss': []
-        }
-        
-        # Simulate training for each epoch
-        for epoch in range(epochs):
-            # Simulate decreasing loss over time
-            train_loss = 0.5 * (1 - (epoch / epochs)) + 0.05 * np.random.random()
-            val_loss = train_loss * (1.2 - 0.2 * (epoch / epochs)) + 0.08 * np.random.random()
-            
-            # Add to history
-            self.training_history['loss'].append(round(train_loss, 4))
-            self.training_history['val_loss'].append(round(val_loss, 4))
-            
-            # Simulate improving model as training progresses
-            # This would update the model's internal parameters in a real system
-            
-        # Mark model as trained
-        self.trained = True
+        inputs, targets = self._training_arrays(dataset)
+        network = Network(self.architecture, (self.img_size, self.img_size), seed=seed)
+        
+        history = train_network(
+            network, inputs, targets,
+            epochs=epochs,
+            batch_size=batch_size,
+            learning_rate=learning_rate,
+            validation_split=validation_split,
+            seed=seed,
+            on_epoch_end=on_epoch_end,
+            should_stop=should_stop
+        )
+        
+        self.training_history = history
+        self.metrics['samples_per_sec'] = history['samples_per_sec']
+        self.metrics['peak_memory_mb'] = history['peak_memory_mb']
+        
+        # Only a network that finished at least one epoch replaces the processing
+        if history['epochs_completed'] > 0:
+            self.network = network
+            self.trained = True
         
         return self.training_history
     
@@ -277,48 +347,52 @@ class UnShineyModel:
         Detect shine/glare in an image
         
         Args:
-            img_array: Numpy array of grayscale image
+            img_array: Numpy array of grayscale image, or N×H×W stack of images
             threshold: Percentile threshold for brightness detection
             
         Returns:
-            Binary mask where 1 indicates shine
+            Boolean mask (or stack of masks) where True indicates shine
         """
-        # Apply a threshold to find bright areas
-        threshold_value = np.percentile(img_array, threshold)
-        shine_mask = (img_array > threshold_value).astype(np.uint8)
-        
-        # Clean up the mask
-        shine_mask = morphology.binary_closing(shine_mask, morphology.disk(3))
-        shine_mask = morphology.binary_opening(shine_mask, morphology.disk(1))
+        # Apply a threshold to find bright areas, per image for stacks
+        img_array = np.asarray(img_array)
+        if img_array.dtype == np.uint8:
+            # Read the percentile off the histogram instead of sorting the image
+            threshold_value = np.reshape(percentile(histogram(img_array), threshold),
+                                         img_array.shape[:-2] + (1, 1))
+        else:
+            threshold_value = np.percentile(img_array, threshold, axis=(-2, -1), keepdims=True)
+        shine_mask = img_array > threshold_value
         
-        return shine_mask
+        # Clean up the mask: closing with disk(3), then opening with disk(1)
+        return close_open(shine_mask, 3, 1)
     
-    def remove_shine(self, img_array, shine_mask):
+    def remove_shine(self, img_array, shine_mask, scale_space=None):
         """
         Remove shine from an image
         
         Args:
             img_array: Numpy array of grayscale image
             shine_mask: Binary mask where 1 indicates shine
+            scale_space: Optional ScaleSpace of img_array, shared with other
+                stages that blur it; a blur it already holds is reused
             
         Returns:
             Processed image with shine removed
         """
-        # Create a copy of the image
-        result = img_array.copy()
+        # Only padded boxes around the shine regions are blurred
+        shine = np.asarray(shine_mask) == 1
+        pad = blur_radius(_REMOVE_SIGMA)
+        replace = lambda box: blurred_box(img_array, box, _REMOVE_SIGMA, scale_space)
         
-        # For each shine region, replace with local average
-        labels, num_regions = ndimage.label(shine_mask)
-        
-        if num_regions == 0:
-            return result
-            
-        # Create a blurred version of the image
-        blurred = ndimage.gaussian_filter(img_array, sigma=3)
-        
-        # Replace shine areas with blurred version
-        result[shine_mask == 1] = blurred[shine_mask == 1]
+        if img_array.dtype == np.uint8:
+            weights = shine.astype(np.uint8) * 255
+            return replace_regions(img_array, weights, pad, replace)
         
+        # Other dtypes replace the pixels directly
+        result = img_array.copy()
+        for box, region in region_boxes(shine, pad):
+            blurred = replace(box)[region]
+            result[box][region] = np.rint(blurred) if np.issubdtype(result.dtype, np.integer) else blurred
         return result
     
     def get_model_info(self):
@@ -340,6 +414,12 @@ class UnShineyModel:
             'img_size': self.img_size,
             'architecture': self.architecture,
             'processing_params': self.processing_params,
+            'bilateral_method': self.bilateral_method,
+            'bilateral_accuracy': self.bilateral_accuracy,
+            'denoise_method': self.denoise_options['method'],
+            'denoise_max_iterations': self.denoise_options['max_iterations'],
+            'denoise_tolerance': self.denoise_options['tolerance'],
+            'denoise_time_budget': self.denoise_options['time_budget'],
             'created_at': self.created_at
         }
         
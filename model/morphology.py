@@ -0,0 +1,204 @@
+import numpy as np
+from functools import lru_cache
+from model.kernels import disk_footprint
+
+# Pixels per packed word
+_WORD_BITS = 64
+
+@lru_cache(maxsize=32)
+def disk_rows(radius):
+    """
+    Decompose a disk into horizontal line segments
+
+    Args:
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Tuple of (row offset, half width) pairs, one per row of
+        morphology.disk(radius)
+    """
+    footprint = disk_footprint(radius)
+    return tuple((dy - radius, int(row.sum()) // 2) for dy, row in enumerate(footprint))
+
+def pack_mask(mask):
+    """
+    Pack the rows of a binary mask into 64-bit words
+
+    Pixel x of a row is bit x % 64 of word x // 64; bits past the width
+    are zero.
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack of masks
+
+    Returns:
+        uint64 array of shape (..., H, ceil(W / 64))
+    """
+    mask = np.asarray(mask, dtype=bool)
+    width = mask.shape[-1]
+    words = -(-width // _WORD_BITS)
+    if width != words * _WORD_BITS:
+        padded = np.zeros(mask.shape[:-1] + (words * _WORD_BITS,), dtype=bool)
+        padded[..., :width] = mask
+        mask = padded
+    packed = np.packbits(mask, axis=-1, bitorder='little')
+    return np.ascontiguousarray(packed).view('<u8')
+
+def unpack_mask(packed, width):
+    """
+    Unpack words from pack_mask back into a boolean mask
+
+    Args:
+        packed: uint64 array from pack_mask
+        width: Width of the original mask
+
+    Returns:
+        Boolean array of shape (..., H, width)
+    """
+    as_bytes = np.ascontiguousarray(packed).view(np.uint8)
+    return np.unpackbits(as_bytes, axis=-1, count=width, bitorder='little').astype(bool)
+
+def _shift_columns(packed, offset):
+    """Packed rows with out[x] = in[x + offset], zero filled at the ends"""
+    shifted = np.zeros_like(packed)
+    words, bits = divmod(abs(offset), _WORD_BITS)
+    count = packed.shape[-1] - words
+    if count <= 0:
+        return shifted
+    if offset > 0:
+        # Towards lower x: bits move down within a word and in from the next word
+        source = packed[..., words:]
+        shifted[..., :count] = source >> np.uint64(bits)
+        if bits:
+            shifted[..., :count - 1] |= source[..., 1:] << np.uint64(_WORD_BITS - bits)
+    else:
+        source = packed[..., :count]
+        shifted[..., words:] = source << np.uint64(bits)
+        if bits:
+            shifted[..., words + 1:] |= source[..., :-1] >> np.uint64(_WORD_BITS - bits)
+    return shifted
+
+def _dilate_packed(packed, width, radius):
+    """Dilate packed masks with a disk, pixels outside the image counting as False"""
+    rows = disk_rows(radius)
+
+    # Horizontal dilations for every half width the disk needs
+    lines = [packed]
+    for half_width in range(1, max(w for _, w in rows) + 1):
+        line = lines[-1].copy()
+        line |= _shift_columns(packed, half_width)
+        line |= _shift_columns(packed, -half_width)
+        lines.append(line)
+
+    # OR the line dilations at their row offsets
+    output = np.zeros_like(packed)
+    height = packed.shape[-2]
+    for dy, half_width in rows:
+        if abs(dy) >= height:
+            continue
+        line = lines[half_width]
+        if dy >= 0:
+            output[..., :height - dy, :] |= line[..., dy:, :]
+        else:
+            output[..., -dy:, :] |= line[..., :height + dy, :]
+
+    # Clear what spilled into the padding past the width
+    output &= _valid_bits(width, packed.shape[-1])
+    return output
+
+def _valid_bits(width, words):
+    """Word mask with the bits of real pixels set"""
+    valid = np.full(words, np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64)
+    tail = width - (words - 1) * _WORD_BITS
+    if tail < _WORD_BITS:
+        valid[-1] = np.uint64((1 << tail) - 1)
+    return valid
+
+def _erode_packed(packed, width, radius):
+    """Erode packed masks with a disk, pixels outside the image counting as True"""
+    # Erosion is the complement of dilating the complement (the disk is symmetric)
+    valid = _valid_bits(width, packed.shape[-1])
+    eroded = _dilate_packed(~packed & valid, width, radius)
+    eroded ^= valid
+    return eroded
+
+def binary_dilation(mask, radius):
+    """
+    Dilate binary masks with a disk
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack, images never mix
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Boolean array of the same shape
+    """
+    width = np.shape(mask)[-1]
+    return unpack_mask(_dilate_packed(pack_mask(mask), width, radius), width)
+
+def binary_erosion(mask, radius):
+    """
+    Erode binary masks with a disk
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack, images never mix
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Boolean array of the same shape
+    """
+    width = np.shape(mask)[-1]
+    return unpack_mask(_erode_packed(pack_mask(mask), width, radius), width)
+
+def binary_closing(mask, radius):
+    """
+    Close binary masks with a disk
+
+    Same result as skimage.morphology.binary_closing(mask, disk(radius))
+    on each image, computed on bit-packed rows with the disk split into
+    one horizontal line dilation per row.
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack, images never mix
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Boolean array of the same shape
+    """
+    width = np.shape(mask)[-1]
+    packed = _dilate_packed(pack_mask(mask), width, radius)
+    return unpack_mask(_erode_packed(packed, width, radius), width)
+
+def binary_opening(mask, radius):
+    """
+    Open binary masks with a disk
+
+    Same result as skimage.morphology.binary_opening(mask, disk(radius))
+    on each image.
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack, images never mix
+        radius: Radius of the disk in pixels
+
+    Returns:
+        Boolean array of the same shape
+    """
+    width = np.shape(mask)[-1]
+    packed = _erode_packed(pack_mask(mask), width, radius)
+    return unpack_mask(_dilate_packed(packed, width, radius), width)
+
+def close_open(mask, close_radius, open_radius):
+    """
+    Closing followed by opening, staying packed in between
+
+    Args:
+        mask: Binary H×W mask or N×H×W stack, images never mix
+        close_radius: Radius of the closing disk
+        open_radius: Radius of the opening disk
+
+    Returns:
+        Boolean array of the same shape
+    """
+    width = np.shape(mask)[-1]
+    packed = _erode_packed(_dilate_packed(pack_mask(mask), width, close_radius), width, close_radius)
+    packed = _dilate_packed(_erode_packed(packed, width, open_radius), width, open_radius)
+    return unpack_mask(packed, width)
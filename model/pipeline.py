@@ -0,0 +1,262 @@
+import numpy as np
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from model.model import UnShineyModel
+from model.kernels import edge_blend, gaussian_blur, truncated_blur, unsharp_mask
+from model.scale_space import ScaleSpace
+from model.lut import gain_lut, offset_lut, gamma_lut, compose, equalize_lut
+from model.workspace import get_workspace
+
+def config_hash(model_config):
+    """
+    Get a canonical hash of a model configuration
+
+    Two configurations that only differ in key order hash the same.
+
+    Args:
+        model_config: Model configuration dictionary or None
+
+    Returns:
+        Hex digest string ('' when there is no configuration)
+    """
+    if not model_config:
+        return ''
+    canonical = json.dumps(model_config, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def _lut_stage(lut):
+    """Stage applying a 256 entry lookup table to the truncated pixel values"""
+    table = lut.astype(np.float32)
+    table.setflags(write=False)
+
+    def apply_lut(img_array, workspace, scale_space):
+        # np.take converts smaller index types to intp, so index with intp up front
+        index = workspace.get('lut_index', img_array.shape, np.intp)
+        np.clip(img_array, 0, 255, out=img_array)
+        np.copyto(index, img_array, casting='unsafe')
+        return np.take(table, index, out=img_array, mode='clip')
+
+    # Lets Pipeline.run index the table straight from the uint8 input
+    apply_lut.table = table
+    return apply_lut
+
+def _blur_stage(sigma):
+    """Stage applying a Gaussian blur with a cached kernel, truncated like the uint8 blur"""
+    def blur(img_array, workspace, scale_space):
+        return truncated_blur(img_array, sigma, workspace, scale_space)
+    return blur
+
+def _edge_blend_stage(img_array, workspace, scale_space):
+    """Stage blending an image with its Sobel edge magnitude"""
+    edge_blend(img_array[np.newaxis], workspace)
+    return img_array
+
+def _equalize_blur_stage(sigma):
+    """Stage applying histogram equalization scaled to 0-255, then a Gaussian blur"""
+    def equalize_blur(img_array, workspace, scale_space):
+        index = workspace.get('lut_index', img_array.shape, np.intp)
+        np.clip(img_array, 0, 255, out=img_array)
+        np.copyto(index, img_array, casting='unsafe')
+
+        # Same table as exposure.equalize_hist, from a single bincount. The
+        # levels are fractional, so they are blurred in float64 as before:
+        # float32 sums would truncate to a different level now and then
+        table = equalize_lut(np.bincount(index.ravel(), minlength=256)) * 255
+        equalized = np.take(table, index, out=workspace.get('equalized', img_array.shape, np.float64), mode='clip')
+        gaussian_blur(equalized, sigma, output=equalized)
+        np.trunc(equalized, out=equalized)
+        np.copyto(img_array, equalized, casting='unsafe')
+        return img_array
+    return equalize_blur
+
+def _sharpen_stage(sigma, amount):
+    """Stage adding back a scaled high-pass of the image"""
+    def sharpen(img_array, workspace, scale_space):
+        if scale_space is None:
+            scale_space = ScaleSpace(img_array)
+        return unsharp_mask(img_array, sigma, amount, workspace, scale_space)
+    return sharpen
+
+class Pipeline:
+    """
+    Prebuilt processing pipeline for a model type and configuration
+
+    Holds everything process_with_model needs (lookup tables, Gaussian
+    sigmas and the ordered stage list) so a request only runs the stages.
+    """
+    def __init__(self, model_type, model_config=None):
+        """
+        Build the pipeline
+
+        Args:
+            model_type: Type of model (dense, conv, hybrid, custom)
+            model_config: Optional custom model configuration
+        """
+        self.model_type = model_type
+        self.model_config = model_config
+        self.stages = self._build_stages()
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _build_stages(self):
+        """Compile the model type and configuration into an ordered stage list"""
+        stages = []
+
+        # If model_config is provided and has custom processing parameters
+        if self.model_config and 'processing_params' in self.model_config:
+            params = self.model_config['processing_params']
+
+            # Contrast and brightness are point operations, fold them into one table
+            tables = []
+            if 'contrast' in params:
+                tables.append(gain_lut(float(params['contrast'])))
+            if 'brightness' in params:
+                tables.append(offset_lut(float(params['brightness'])))
+            if tables:
+                stages.append(_lut_stage(compose(*tables)))
+
+            if 'blur' in params:
+                stages.append(_blur_stage(float(params['blur'])))
+
+        elif self.model_type == 'dense':
+            # Simulate dense model by adjusting contrast
+            stages.append(_lut_stage(gain_lut(1.2)))
+
+        elif self.model_type == 'conv':
+            # Simulate conv model with edge enhancement and slight blur
+            stages.append(_blur_stage(1))
+            stages.append(_edge_blend_stage)
+
+        elif self.model_type == 'hybrid':
+            # Histogram equalization followed by edge preservation
+            stages.append(_equalize_blur_stage(0.5))
+
+        elif self.model_type == 'custom':
+            # Blur, gamma and a slight sharpening
+            stages.append(_blur_stage(0.8))
+            stages.append(_lut_stage(gamma_lut(0.8)))
+            stages.append(_sharpen_stage(1.0, 0.5))
+
+        return stages
+
+    @property
+    def model(self):
+        """UnShineyModel for this type and configuration, built on first use"""
+        with self._model_lock:
+            if self._model is None:
+                self._model = UnShineyModel(model_type=self.model_type, config=self.model_config)
+            return self._model
+
+    def run(self, img_array, scale_space=None):
+        """
+        Run every stage on an image
+
+        Stages work in place on a float32 buffer of the calling thread's
+        workspace and keep the whole gray levels of the uint8 stages they
+        replace; the image is converted back to uint8 once at the end.
+        Each stage is passed a ScaleSpace of its input while that is still
+        the unchanged image, and None after an earlier stage changed it.
+
+        Args:
+            img_array: Numpy uint8 array of grayscale image
+            scale_space: Optional ScaleSpace of img_array, shared with other
+                stages that blur it
+
+        Returns:
+            Processed uint8 numpy array
+        """
+        if not self.stages:
+            return img_array
+
+        workspace = get_workspace()
+        if scale_space is None:
+            scale_space = ScaleSpace(img_array)
+        stages = self.stages
+        table = getattr(stages[0], 'table', None)
+        if table is not None:
+            # A leading lookup table reads the uint8 input directly
+            index = workspace.get('lut_index', img_array.shape, np.intp)
+            np.copyto(index, img_array)
+            processed = np.take(table, index, out=workspace.get('image', img_array.shape), mode='clip')
+            stages = stages[1:]
+            scale_space = None
+        else:
+            processed = workspace.load(img_array)
+
+        for stage in stages:
+            processed = stage(processed, workspace, scale_space)
+            scale_space = None
+        return workspace.to_uint8(processed)
+
+class PipelineCache:
+    """
+    Bounded LRU cache of Pipelines keyed by model type and config hash
+    """
+    def __init__(self, max_size=64):
+        """
+        Initialize the cache
+
+        Args:
+            max_size: Maximum number of pipelines to keep
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pipelines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_type, model_config=None):
+        """
+        Get the pipeline for a model type and configuration, building it on a miss
+
+        Args:
+            model_type: Type of model (dense, conv, hybrid, custom)
+            model_config: Optional custom model configuration
+
+        Returns:
+            Pipeline
+        """
+        key = (model_type, config_hash(model_config))
+
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is not None:
+                self._pipelines.move_to_end(key)
+                self.hits += 1
+                return pipeline
+            self.misses += 1
+
+        # Build outside the lock so a slow build does not stall cache hits
+        pipeline = Pipeline(model_type, model_config)
+
+        with self._lock:
+            # Another thread may have built the same pipeline meanwhile
+            pipeline = self._pipelines.setdefault(key, pipeline)
+            self._pipelines.move_to_end(key)
+            while len(self._pipelines) > self.max_size:
+                self._pipelines.popitem(last=False)
+                self.evictions += 1
+
+        return pipeline
+
+    def clear(self):
+        """Drop every cached pipeline and reset the counters"""
+        with self._lock:
+            self._pipelines.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Get cache statistics as a dictionary"""
+        with self._lock:
+            return {
+                'size': len(self._pipelines),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,226 @@
+import numpy as np
+from scipy import fft
+from skimage import exposure, feature
+from model.kernels import gaussian_blur, gaussian_dct_response
+from model.tv import denoise_tv, tv_options
+from model.workspace import get_workspace
+
+class LinearStep:
+    """
+    Contrast, brightness, blur and sharpen fused into two in-place passes
+
+    Contrast and brightness map each gray level to a new value. The step
+    runs first on whole gray levels, so the map is evaluated for the 256
+    levels of each image with the same float32 operations as the sequential
+    passes and applied as one table lookup: the result is exactly theirs.
+
+    Blur followed by sharpen is the single linear filter
+    ((1 + s)·δ - s·G_1) ∗ G_blur. It is not separable (it is a difference of
+    two separable Gaussians), but with reflected borders it is diagonal in
+    the DCT-II basis, so its response is precomputed per image size and
+    applied as one multiply between a 2-D DCT and its inverse. This matches
+    the sequential blurs to float32 rounding, within 1e-3 gray levels.
+    """
+    name = 'linear'
+
+    def __init__(self, contrast=1.0, brightness=0.0, blur=0.0, sharpen=0.0):
+        """
+        Compile the step
+
+        Args:
+            contrast: Contrast gain around each image's mean
+            brightness: Value added to every pixel
+            blur: Sigma of the blur (0 for none)
+            sharpen: Amount of sigma 1.0 unsharp masking (0 for none)
+        """
+        self.contrast = contrast
+        self.brightness = brightness
+        self.blur = blur if blur > 0 else 0.0
+        self.sharpen = sharpen if sharpen > 0 else 0.0
+        self._responses = {}
+
+    def __call__(self, img_stack, workspace):
+        """Apply the step in place to a float32 N×H×W stack of whole gray levels"""
+        if self.contrast != 1.0 or self.brightness:
+            self._map_levels(img_stack, workspace)
+
+        if self.sharpen:
+            self._filter(img_stack)
+        elif self.blur:
+            gaussian_blur(img_stack, self.blur, output=img_stack)
+
+        return img_stack
+
+    def _map_levels(self, img_stack, workspace):
+        """Apply contrast and brightness through one lookup table per image"""
+        # Row i holds image i's (level - mean) * contrast + mean + brightness
+        table = workspace.get('linear_table', (len(img_stack), 256))
+        table[...] = _LEVELS
+        if self.contrast != 1.0:
+            mean = img_stack.reshape(len(img_stack), -1).mean(axis=1)[:, np.newaxis]
+            table -= mean
+            table *= self.contrast
+            table += mean
+        if self.brightness:
+            table += self.brightness
+
+        # Flat index of each pixel's entry in its image's row
+        index = workspace.get('lut_index', img_stack.shape, np.intp)
+        np.copyto(index, img_stack, casting='unsafe')
+        index += _row_offsets(len(img_stack))
+        np.take(table, index, out=img_stack)
+
+    def _filter(self, img_stack):
+        """Apply the blur and sharpen filter in the DCT-II domain"""
+        shape = img_stack.shape[-2:]
+        response = self._responses.get(shape)
+        if response is None:
+            rows, cols = shape
+            response = (1 + self.sharpen) - self.sharpen * np.outer(
+                gaussian_dct_response(rows, 1.0), gaussian_dct_response(cols, 1.0))
+            response *= np.outer(gaussian_dct_response(rows, self.blur), gaussian_dct_response(cols, self.blur))
+            response = response.astype(np.float32)
+            self._responses[shape] = response
+
+        coefficients = fft.dctn(img_stack, type=2, axes=(-2, -1))
+        coefficients *= response
+        img_stack[...] = fft.idctn(coefficients, type=2, axes=(-2, -1), overwrite_x=True)
+
+_LEVELS = np.arange(256, dtype=np.float32)
+
+def _row_offsets(count):
+    """Offsets of each image's row in a flattened count×256 table"""
+    return (np.arange(count) * 256)[:, np.newaxis, np.newaxis]
+
+class EqualizeStep:
+    """Histogram equalization within each image's own value range"""
+    name = 'equalize'
+
+    def __call__(self, img_stack, workspace):
+        for img in img_stack:
+            min_val, max_val = img.min(), img.max()
+            if max_val > min_val:
+                normalized = (img - min_val) / (max_val - min_val)
+                img[...] = exposure.equalize_hist(normalized) * (max_val - min_val) + min_val
+        return img_stack
+
+class DenoiseStep:
+    """
+    Total variation denoising within each image's own value range
+
+    All images of the stack are denoised in one budgeted call; the number
+    of iterations of the last call is kept in ``iterations``.
+    """
+    name = 'denoise'
+
+    def __init__(self, weight, options=None):
+        """
+        Compile the step
+
+        Args:
+            weight: TV weight
+            options: Keyword arguments for denoise_tv from tv_options()
+        """
+        self.weight = weight
+        self.options = options or {}
+        self.iterations = 0
+
+    def __call__(self, img_stack, workspace):
+        # Flat images are left untouched
+        min_val = img_stack.min(axis=(1, 2))
+        max_val = img_stack.max(axis=(1, 2))
+        varying = max_val > min_val
+        if not varying.any():
+            self.iterations = 0
+            return img_stack
+
+        low = min_val[varying][:, np.newaxis, np.newaxis]
+        span = (max_val - min_val)[varying][:, np.newaxis, np.newaxis]
+        normalized = (img_stack[varying] - low) / span
+        denoised, self.iterations = denoise_tv(normalized, weight=self.weight, **self.options)
+        img_stack[varying] = denoised * span + low
+        return img_stack
+
+class EdgeEnhanceStep:
+    """Paint Canny edges at each image's maximum value"""
+    name = 'edge_enhance'
+
+    def __call__(self, img_stack, workspace):
+        for img in img_stack:
+            max_val = np.max(img)
+            edges = feature.canny(img / max_val, sigma=1.0)
+            img[edges] = max_val
+        return img_stack
+
+class ProcessingPlan:
+    """
+    Execution plan compiled from a model's processing_params
+
+    The params are read once, no-op steps are dropped and adjacent linear
+    steps are merged, so processing runs the fewest full-image passes.
+    """
+    def __init__(self, processing_params=None):
+        """
+        Compile the plan
+
+        Args:
+            processing_params: Dictionary of custom processing parameters
+        """
+        self.steps = self._compile(processing_params or {})
+
+    @staticmethod
+    def _compile(params):
+        """Turn processing params into an ordered list of steps"""
+        steps = []
+
+        contrast = float(params.get('contrast', 1.0))
+        brightness = float(params.get('brightness', 0.0))
+        blur = float(params.get('blur', 0.0))
+        sharpen = float(params.get('sharpen', 0.0))
+        if contrast != 1.0 or brightness != 0.0 or blur > 0 or sharpen > 0:
+            steps.append(LinearStep(contrast, brightness, blur, sharpen))
+
+        if params.get('equalize'):
+            steps.append(EqualizeStep())
+
+        denoise = float(params.get('denoise', 0.0))
+        if denoise > 0:
+            steps.append(DenoiseStep(denoise, tv_options(params)))
+
+        if float(params.get('edge_enhance', 0.0)) > 0:
+            steps.append(EdgeEnhanceStep())
+
+        return steps
+
+    def find(self, name):
+        """Get the compiled step with the given name, or None"""
+        for step in self.steps:
+            if step.name == name:
+                return step
+        return None
+
+    def describe(self):
+        """Get the names of the steps in execution order"""
+        return [step.name for step in self.steps]
+
+    def run(self, img_stack):
+        """
+        Run the plan on a stack of images
+
+        Args:
+            img_stack: Numpy uint8 array of shape (N, H, W)
+
+        Returns:
+            Processed uint8 array of shape (N, H, W)
+        """
+        if not self.steps:
+            return img_stack.copy()
+
+        # Steps work in place on a float32 buffer of this thread's workspace
+        workspace = get_workspace()
+        processed = workspace.load(img_stack)
+        for step in self.steps:
+            processed = step(processed, workspace)
+
+        # Clip and convert back to uint8
+        return workspace.to_uint8(processed)
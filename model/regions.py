@@ -0,0 +1,180 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import ndimage
+from model.kernels import gaussian_kernel
+from model.scale_space import ScaleSpace
+
+# Fixed point blending: weights count in 1/256, values carry 8 fraction bits
+_WEIGHT_BITS = 8
+_FRACTION_BITS = 8
+
+# Side of the square cells regions are located on
+_CELL = 16
+
+# Thread pool of the replace_regions calls given no executor, started on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+def blur_radius(sigma):
+    """Pixels on each side a Gaussian blur of sigma reads"""
+    return len(gaussian_kernel(sigma)) // 2
+
+def region_boxes(mask, pad):
+    """
+    Padded bounding boxes around the connected regions of a mask
+
+    Regions are located on a grid of 16×16 cells: the cells holding masked
+    pixels are grown by pad pixels, and every connected group of grown
+    cells gives one box. Only the small cell grid is labeled, so the full
+    resolution mask is read just once, and regions whose padded boxes
+    overlap share one box, so no pixel is filtered twice for neighbouring
+    highlights.
+
+    Args:
+        mask: Binary H×W mask
+        pad: Context in pixels a filter needs around each region pixel
+
+    Returns:
+        List of (box, region) pairs: box is a tuple of slices into the
+        image, at least pad pixels larger than its region on every side
+        not at the image edge, and region the boolean mask of the box's
+        pixels to replace
+    """
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    if mask.size == 0:
+        return []
+
+    # Cells holding any masked pixel, zero padding the mask to whole cells
+    rows, cols = -(-height // _CELL), -(-width // _CELL)
+    if (rows * _CELL, cols * _CELL) != mask.shape:
+        padded = np.zeros((rows * _CELL, cols * _CELL), dtype=bool)
+        padded[:height, :width] = mask
+    else:
+        padded = mask
+    cells = padded.reshape(rows, _CELL, cols * _CELL).any(axis=1)
+    cells = cells.reshape(rows, cols, _CELL).any(axis=2)
+
+    # Grow by the padding and group the cells
+    reach = -(-pad // _CELL)
+    if reach:
+        cells = ndimage.maximum_filter(cells, size=2 * reach + 1, mode='constant')
+    groups, _ = ndimage.label(cells)
+
+    regions = []
+    for index, cell_box in enumerate(ndimage.find_objects(groups), 1):
+        box = tuple(slice(s.start * _CELL, min(s.stop * _CELL, size)) for s, size in zip(cell_box, mask.shape))
+        # Pixels of this group's cells, which another group's box may overlap
+        owned = groups[cell_box] == index
+        owned = np.repeat(np.repeat(owned, _CELL, axis=0), _CELL, axis=1)
+        owned = owned[:box[0].stop - box[0].start, :box[1].stop - box[1].start]
+        region = mask[box] & owned
+        if region.any():
+            regions.append((box, region))
+    return regions
+
+def blend_fixed(original, replacement, weights, rounding='nearest'):
+    """
+    Blend uint8 pixels towards a replacement in integer arithmetic
+
+    Computes original * (1 - w) + replacement * w with w = weights / 255,
+    the weights rescaled to 1/256 steps (0 and 255 stay exact) and the
+    replacement rounded to 1/256, so the blend is one multiply-add and a
+    shift in int32 instead of float64 arithmetic.
+
+    Args:
+        original: uint8 array
+        replacement: Float array of the same shape
+        weights: uint8 array of the same shape, 255 takes the replacement
+        rounding: 'nearest' to round the result, 'truncate' to truncate it
+            like astype(np.uint8)
+
+    Returns:
+        uint8 array of the same shape
+    """
+    one = 1 << _WEIGHT_BITS
+    weight = (weights.astype(np.int32) * 257 + 128) >> 8
+    value = np.rint(np.clip(replacement, 0, 255) * (1 << _FRACTION_BITS)).astype(np.int32)
+
+    total = original.astype(np.int32) << _FRACTION_BITS
+    total *= one - weight
+    total += value * weight
+    if rounding == 'nearest':
+        total += 1 << (_WEIGHT_BITS + _FRACTION_BITS - 1)
+    total >>= _WEIGHT_BITS + _FRACTION_BITS
+    return total.astype(np.uint8)
+
+def blurred_box(img_array, box, sigma, scale_space=None):
+    """
+    Gaussian blur of one box of an image
+
+    Equal to the blur of the whole image on every pixel at least
+    blur_radius(sigma) from the box's inner edges. A blur already held
+    by scale_space is sliced instead of recomputed.
+
+    Args:
+        img_array: 2-D image
+        box: Tuple of slices into the image
+        sigma: Standard deviation, or (row sigma, column sigma)
+        scale_space: Optional ScaleSpace of the whole image
+
+    Returns:
+        float32 array of the box's shape
+    """
+    if scale_space is not None:
+        level = scale_space.cached(sigma)
+        if level is not None:
+            return level[box]
+    return ScaleSpace(img_array[box]).blur(sigma)
+
+def replace_regions(img_array, weights, pad, replace, rounding='nearest', executor=None):
+    """
+    Blend a replacement into the masked regions of an image, box by box
+
+    Only padded boxes around the regions where weights are nonzero are
+    processed, so the cost follows the masked area rather than the image
+    size. Boxes are processed in parallel on the executor and never write
+    the same pixel.
+
+    Args:
+        img_array: 2-D uint8 image
+        weights: uint8 array of the image's shape, 255 takes the replacement
+            and 0 keeps the image
+        pad: Context in pixels replace needs around each masked pixel
+        replace: Callable replace(box) returning the float replacement for
+            img_array[box]
+        rounding: Rounding of blend_fixed
+        executor: Optional concurrent.futures executor for the boxes (a
+            thread pool shared by all calls otherwise)
+
+    Returns:
+        New uint8 array with the regions replaced
+    """
+    result = img_array.copy()
+    regions = region_boxes(weights > 0, pad)
+
+    def run(item):
+        box, region = item
+        replacement = replace(box)
+        result[box][region] = blend_fixed(img_array[box][region], replacement[region],
+                                          weights[box][region], rounding)
+
+    if len(regions) < 2:
+        for item in regions:
+            run(item)
+        return result
+
+    if executor is None:
+        executor = _shared_executor()
+    # Consume the iterator so errors of any box are raised here
+    list(executor.map(run, regions))
+    return result
+
+def _shared_executor():
+    """Get the thread pool shared by replace_regions calls, starting it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix='regions')
+        return _executor
@@ -0,0 +1,214 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from model.pipeline import config_hash
+
+# Part of every key. Bump it when processing output changes, so results of
+# older code in the disk tier are never served again.
+CACHE_VERSION = 1
+
+class ResultCache:
+    """
+    Content-addressed cache of processed images
+
+    Results are keyed by a hash of CACHE_VERSION, the uploaded bytes, the
+    model type and the canonical model configuration, so an identical request never gets
+    decoded or processed twice. Recent results live in an in-memory LRU
+    bounded by size; an optional disk tier, also bounded by size, keeps
+    results across restarts and after they drop out of memory.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_path=None, disk_max_bytes=1024 * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Maximum total size of the results kept in memory
+            disk_path: Optional directory for the disk tier
+            disk_max_bytes: Maximum total size of the disk tier
+        """
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def key(data, model_type, model_config=None, variant=''):
+        """
+        Get the cache key of a request
+
+        Args:
+            data: Uploaded image bytes, or a seekable binary file that is
+                hashed in chunks and rewound
+            model_type: Type of model
+            model_config: Optional custom model configuration
+            variant: Optional name of the processing mode
+
+        Returns:
+            Hex digest string
+        """
+        digest = hashlib.sha256(f"v{CACHE_VERSION}\0".encode('utf-8'))
+        if hasattr(data, 'read'):
+            for chunk in iter(lambda: data.read(1024 * 1024), b''):
+                digest.update(chunk)
+            data.seek(0)
+        else:
+            digest.update(data)
+        digest.update(b'\0' + str(model_type).encode('utf-8'))
+        digest.update(b'\0' + config_hash(model_config).encode('utf-8'))
+        if variant:
+            digest.update(b'\0' + str(variant).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _disk_file(self, key):
+        """Get the path of a result in the disk tier"""
+        return os.path.join(self.disk_path, key[:2], f"{key}.npy")
+
+    def _scan_disk(self):
+        """Index the results already on disk, least recently used first"""
+        entries = []
+        for folder in os.listdir(self.disk_path):
+            folder_path = os.path.join(self.disk_path, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for file in os.listdir(folder_path):
+                if not file.endswith('.npy'):
+                    continue
+                stat = os.stat(os.path.join(folder_path, file))
+                entries.append((stat.st_mtime_ns, file[:-len('.npy')], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._trim_disk()
+
+    def _remember(self, key, result):
+        """Add a result to the memory tier, evicting the least recently used (lock held)"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = result
+        self._memory_bytes += result.nbytes
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _trim_disk(self):
+        """Delete the least recently used results beyond the disk size cap (lock held)"""
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_file(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        """
+        Get a cached result
+
+        Returns:
+            Read-only uint8 numpy array, or None on a miss
+        """
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._disk_file(key)
+            try:
+                result = np.load(path)
+                # Mark as recently used for the next scan
+                os.utime(path)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                result.setflags(write=False)
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._remember(key, result)
+                    self.disk_hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """
+        Cache a result
+
+        Args:
+            key: Cache key from key()
+            result: uint8 numpy array
+        """
+        result = np.array(result, dtype=np.uint8)
+        result.setflags(write=False)
+
+        with self._lock:
+            self._remember(key, result)
+            if not self.disk_path or key in self._disk:
+                return
+
+        # Write to a temporary file first so readers never see half a result
+        path = self._disk_file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, result)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+                self._trim_disk()
+
+    def clear(self):
+        """Drop every cached result, on disk too, and reset the counters"""
+        with self._lock:
+            for key in self._disk:
+                try:
+                    os.remove(self._disk_file(key))
+                except FileNotFoundError:
+                    pass
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Get cache counters"""
+        with self._lock:
+            return {
+                'items': len(self._memory),
+                'bytes': self._memory_bytes,
+                'max_bytes': self.max_bytes,
+                'disk_items': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes if self.disk_path else 0,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses
+            }
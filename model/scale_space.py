@@ -0,0 +1,126 @@
+import numpy as np
+from scipy import ndimage
+from model.kernels import gaussian_blur, gaussian_kernel
+
+def _scale_key(sigma):
+    """Normalize a sigma to a (row sigma, column sigma) key"""
+    if np.isscalar(sigma):
+        sigma_y = sigma_x = float(sigma)
+    else:
+        sigma_y, sigma_x = (float(s) for s in sigma)
+    if sigma_y < 0 or sigma_x < 0:
+        raise ValueError('sigma must not be negative')
+    return (round(sigma_y, 6), round(sigma_x, 6))
+
+class ScaleSpace:
+    """
+    Gaussian scale space of one image, built on demand
+
+    Every requested sigma is computed once and kept. Gaussian blurs
+    compose (G_a * G_b = G_sqrt(a² + b²)), so a larger sigma starts from
+    the closest smaller blur already computed and only adds the missing
+    part, with a smaller kernel than a blur from scratch. Stages that
+    blur the same image share one ScaleSpace instead of each filtering
+    the full image again.
+
+    Stages that keep whole gray levels need the blur truncated after each
+    1-D pass, as ndimage blurs uint8 images. Those levels do not compose,
+    so truncated() computes each one from the image, also once per sigma.
+
+    Only the last two axes are blurred, so an N×H×W stack works too.
+    """
+    def __init__(self, img_array):
+        """
+        Initialize the scale space
+
+        Args:
+            img_array: 2-D image or N×H×W stack. It is only copied when a
+                float blur is first requested, so it must not change while
+                the scale space is in use
+        """
+        self._source = img_array
+        self._levels = {}
+        self._truncated = {}
+        # Number of 1-D filter passes run so far
+        self.passes = 0
+
+    @property
+    def image(self):
+        """The unblurred image as a read-only float32 array"""
+        image = self._levels.get((0.0, 0.0))
+        if image is None:
+            image = np.array(self._source, dtype=np.float32)
+            image.setflags(write=False)
+            self._levels[(0.0, 0.0)] = image
+        return image
+
+    def _closest(self, key):
+        """Get the cached level needing the least extra blurring to reach key"""
+        # The unblurred image, which may not be converted yet, is always a candidate
+        best, best_cost = (0.0, 0.0), sum(key)
+        for level in self._levels:
+            if level[0] > key[0] or level[1] > key[1]:
+                continue
+            # Kernel length grows with sigma, so the cost is the sum of the missing sigmas
+            cost = sum(np.sqrt(target * target - have * have) for target, have in zip(key, level))
+            if cost < best_cost:
+                best, best_cost = level, cost
+        return best
+
+    def cached(self, sigma):
+        """Get a blur computed earlier, or None without computing it"""
+        key = _scale_key(sigma)
+        if key == (0.0, 0.0):
+            return self.image
+        return self._levels.get(key)
+
+    def blur(self, sigma):
+        """
+        Get the image blurred with a Gaussian
+
+        Args:
+            sigma: Standard deviation, or (row sigma, column sigma) for an
+                anisotropic blur (0 leaves that axis unfiltered)
+
+        Returns:
+            Read-only float32 array of the image's shape
+        """
+        key = _scale_key(sigma)
+        level = self.cached(key)
+        if level is not None:
+            return level
+
+        base = self._closest(key)
+        level = self.cached(base).copy()
+        for axis, target, have in zip((-2, -1), key, base):
+            extra = np.sqrt(max(target * target - have * have, 0.0))
+            if extra > 1e-6:
+                ndimage.correlate1d(level, gaussian_kernel(extra), axis, level)
+                self.passes += 1
+
+        level.setflags(write=False)
+        self._levels[key] = level
+        return level
+
+    def truncated(self, sigma):
+        """
+        Get the image blurred the way ndimage blurs a uint8 image
+
+        Args:
+            sigma: Standard deviation of the Gaussian
+
+        Returns:
+            Read-only uint8 array of the image's shape
+        """
+        key = round(float(sigma), 6)
+        level = self._truncated.get(key)
+        if level is None:
+            level = gaussian_blur(self._source, key, output=np.empty(np.shape(self._source), np.uint8))
+            level.setflags(write=False)
+            self._truncated[key] = level
+            self.passes += 2
+        return level
+
+    def sigmas(self):
+        """Get the (row, column) sigmas computed so far, smallest first"""
+        return sorted(self._levels)
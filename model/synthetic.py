@@ -0,0 +1,270 @@
+import os
+import multiprocessing
+import numpy as np
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+# Kinds of synthetic pairs, in the order generate_sample_images rotates through them
+KINDS = ('gradient', 'circle', 'grid', 'text', 'pattern')
+
+# Pairs rendered together, bounding the float temporaries (about 8MB each at 256×256)
+_BATCH = 32
+
+# Pairs each worker process renders per task
+DEFAULT_CHUNK_SIZE = 256
+
+def _coordinates(size):
+    """Row and column coordinates that broadcast against an N×H×W stack"""
+    coords = np.arange(size, dtype=np.float32)
+    return coords[np.newaxis, :, np.newaxis], coords[np.newaxis, np.newaxis, :]
+
+def _column(values):
+    """Per-pair parameters shaped to broadcast against an N×H×W stack"""
+    return np.asarray(values, dtype=np.float32)[:, np.newaxis, np.newaxis]
+
+def _smoothstep(t):
+    """Smooth 0 to 1 ramp of t over [0, 1], computed in place"""
+    np.clip(t, 0, 1, out=t)
+    ramp = t * t
+    t *= -2
+    t += 3
+    t *= ramp
+    return t
+
+def _soft_edge(inside, sigma):
+    """
+    Blurred step from a signed distance to an edge (positive inside)
+
+    A smoothstep over ±2 sigma: close to the Gaussian blurred edge it
+    replaces at a fraction of the cost of erf.
+    """
+    width = 2.0 * sigma
+    t = np.asarray(inside, dtype=np.float32) + np.float32(width)
+    t *= np.float32(0.5 / width)
+    return _smoothstep(t)
+
+@lru_cache(maxsize=256)
+def _disc_window(radius, sigma, reach):
+    """
+    A soft disc of a radius in a (2 reach + 1)² window, peak 1 for large discs
+
+    The peak of a disc not much larger than sigma is lowered to its blurred
+    value 1 - exp(-radius² / 2sigma²).
+    """
+    offsets = np.arange(-reach, reach + 1, dtype=np.float32)
+    distance = np.sqrt(offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2)
+    window = _soft_edge(radius - distance, sigma)
+    window *= np.float32(1 - np.exp(-radius * radius / (2.0 * sigma * sigma)))
+    window.setflags(write=False)
+    return window
+
+def _spots(rng, n, size, count, radius_range, intensity_range, sigma):
+    """
+    Random soft discs, combined with max, on an n×size×size stack
+
+    Every disc is one window from _disc_window, shared by all discs of
+    the same radius, scaled by the disc's intensity and pasted onto a
+    canvas with a margin for discs that cross the image edge. Only the
+    pixels a disc reaches are touched.
+    """
+    reach = int(np.ceil(radius_range[1] + 2 * sigma))
+    canvas = np.zeros((n, size + 2 * reach, size + 2 * reach), dtype=np.float32)
+    ys = rng.integers(0, size, (n, count))
+    xs = rng.integers(0, size, (n, count))
+    radii = rng.integers(radius_range[0], radius_range[1] + 1, (n, count))
+    intensities = rng.integers(intensity_range[0], intensity_range[1] + 1, (n, count))
+
+    box = 2 * reach + 1
+    for i in range(n):
+        for y, x, radius, intensity in zip(ys[i], xs[i], radii[i], intensities[i]):
+            # Window centre y, x lands at canvas y + reach, x + reach
+            view = canvas[i, y:y + box, x:x + box]
+            np.maximum(view, _disc_window(int(radius), sigma, reach) * np.float32(intensity), out=view)
+    return canvas[:, reach:reach + size, reach:reach + size]
+
+def _gradient(rng, n, size):
+    """Product gradient with a Gaussian shine spot"""
+    ys, xs = _coordinates(size)
+    scale = np.float32(max(size - 1, 1))
+    yy, xx = ys / scale, xs / scale
+    target = xx * yy * 255
+    shine = np.exp(-((xx - 0.7) ** 2 + (yy - 0.3) ** 2) / 0.05) * 200
+    return target, shine
+
+def _circle(rng, n, size):
+    """Bright disc on a dark background with an oval reflection"""
+    ys, xs = _coordinates(size)
+    center = size // 2
+    radius = size // 3
+    dy, dx = ys - center, xs - center
+    target = np.where(dy * dy + dx * dx <= radius * radius, np.float32(180), np.float32(20))
+
+    # Signed distance to the ellipse edge from the first-order expansion of its implicit function
+    height, width = max(radius / 1.5, 1), max(radius // 2, 1)
+    u = (xs - (center + radius // 2)) / width
+    v = (ys - (center - radius // 2)) / height
+    rho = np.sqrt(u * u + v * v)
+    gradient = np.maximum(np.sqrt((u / width) ** 2 + (v / height) ** 2), 1e-6)
+    shine = _soft_edge((1 - rho) * rho / gradient, max(size // 30, 1)) * 200
+    return target, shine
+
+def _grid(rng, n, size):
+    """Grid of lines with three random soft shine spots"""
+    ys, xs = _coordinates(size)
+    spacing = max(size // 10, 1)
+    lines = ((ys % spacing) < 2) | ((xs % spacing) < 2)
+    target = np.where(lines, np.float32(160), np.float32(20))
+    shine = _spots(rng, n, size, 3, (size // 10, size // 5), (100, 100), max(size // 20, 1))
+    return target, shine
+
+def _text(rng, n, size):
+    """Dark bars like lines of text with a diagonal glare band"""
+    ys, xs = _coordinates(size)
+    margin = size // 8
+    line_height = max(size // 10, 1)
+    line_width = size - 2 * margin
+    pitch = line_height + 5
+
+    # Bars start every pitch rows, each with its own random length
+    starts = np.arange(margin, size - margin, pitch)
+    lengths = (line_width * (0.7 + 0.3 * rng.random((n, len(starts))))).astype(np.int64)
+    row = np.arange(size)
+    line = np.clip((row - margin) // pitch, 0, max(len(starts) - 1, 0))
+    in_line = (row >= margin) & (row < size - margin) & ((row - margin) % pitch <= line_height)
+    if len(starts):
+        right = np.where(in_line, margin + lengths[:, line], -1)[:, :, np.newaxis]
+    else:
+        right = np.full((n, size, 1), -1)
+    target = np.where((xs >= margin) & (xs <= right), np.float32(50), np.float32(220))
+
+    # Band of width size / 3 through the centre at a random angle, with the
+    # smoothstep scaling of _soft_edge folded into the distance
+    angle = np.radians(rng.uniform(20, 70, n))
+    width = 2.0 * max(size // 15, 1)
+    scale = 0.5 / width
+    t = (ys - size // 2) * _column(np.cos(angle) * scale) - (xs - size // 2) * _column(np.sin(angle) * scale)
+    np.abs(t, out=t)
+    np.subtract(np.float32((size // 3 / 2 + width) * scale), t, out=t)
+    shine = _smoothstep(t)
+    shine *= 150
+    return target, shine
+
+def _pattern(rng, n, size):
+    """Grid of circles with five random soft shine spots"""
+    ys, xs = _coordinates(size)
+    circle_size = size // 12
+    spacing = max(size // 6, 1)
+    first = spacing // 2
+    last = first + (len(range(first, size, spacing)) - 1) * spacing
+
+    # Offsets to the nearest circle centre
+    dy = ys - np.clip(first + np.round((ys - first) / spacing) * spacing, first, last)
+    dx = xs - np.clip(first + np.round((xs - first) / spacing) * spacing, first, last)
+    target = np.where(dy * dy + dx * dx <= circle_size * circle_size, np.float32(100), np.float32(200))
+    shine = _spots(rng, n, size, 5, (size // 20, size // 10), (100, 200), max(size // 25, 1))
+    return target, shine
+
+_RENDERERS = {
+    'gradient': _gradient,
+    'circle': _circle,
+    'grid': _grid,
+    'text': _text,
+    'pattern': _pattern
+}
+
+def render_pairs(count, size=256, seed=None, start=0, kinds=KINDS, out=None):
+    """
+    Render synthetic (with shine, clean) image pairs straight into arrays
+
+    Every kind is drawn with vectorized NumPy geometry for a whole batch
+    of pairs at once: analytic discs, ellipses, grids, gradients, bars and
+    glare bands, with soft edges computed from distances instead of a
+    blur. Pair i has kind kinds[(start + i) % len(kinds)].
+    The shine is added with saturation.
+
+    Args:
+        count: Number of pairs
+        size: Width and height of the images
+        seed: Optional seed; the same (seed, start, count) always gives
+            the same pairs
+        start: Index of the first pair, which picks its kind and seed
+        kinds: Kinds to rotate through, from KINDS
+        out: Optional (originals, cleans) N×size×size uint8 arrays to
+            write to
+
+    Returns:
+        Tuple (originals, cleans) of count×size×size uint8 arrays
+    """
+    unknown = set(kinds) - set(_RENDERERS)
+    if unknown:
+        raise ValueError(f"Unknown synthetic image kinds: {', '.join(sorted(unknown))}")
+    if out is None:
+        out = (np.empty((count, size, size), dtype=np.uint8),
+               np.empty((count, size, size), dtype=np.uint8))
+    originals, cleans = out
+
+    rng = np.random.default_rng(None if seed is None else [seed, start])
+    positions = (start + np.arange(count)) % len(kinds)
+    for number, kind in enumerate(kinds):
+        indices = np.flatnonzero(positions == number)
+        for batch in range(0, len(indices), _BATCH):
+            index = indices[batch:batch + _BATCH]
+            target, shine = _RENDERERS[kind](rng, len(index), size)
+            shine = shine + target
+            np.clip(shine, 0, 255, out=shine)
+            originals[index] = shine
+            cleans[index] = target
+    return originals, cleans
+
+def _render_chunk(args):
+    """Render one chunk of pairs in a worker process"""
+    count, size, seed, start = args
+    return render_pairs(count, size, seed, start)
+
+def write_pairs(writer, count, seed=None, processes=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Render synthetic pairs into a dataset store
+
+    Pairs are rendered in chunks of chunk_size and appended with one write
+    per shard. With processes, chunks are rendered in that many spawned
+    worker processes while the calling process writes them in order; at
+    most two chunks per worker are in flight, so memory stays bounded
+    however many pairs are generated. Chunks are seeded by their position,
+    so the pairs do not depend on the number of processes.
+
+    Args:
+        writer: Open DatasetWriter of square images
+        count: Number of pairs to append
+        seed: Optional seed for reproducible pairs
+        processes: Worker processes (0 renders in the calling process,
+            None uses one per CPU)
+        chunk_size: Pairs rendered per task
+
+    Returns:
+        Number of pairs appended
+    """
+    height, width = writer.shape
+    if height != width:
+        raise ValueError('Synthetic pairs are square')
+    first = len(writer)
+    tasks = [(min(chunk_size, count - start), height, seed, first + start)
+             for start in range(0, count, chunk_size)]
+
+    if processes == 0 or len(tasks) < 2:
+        for task in tasks:
+            writer.append_batch(*_render_chunk(task))
+        return count
+
+    workers = processes or os.cpu_count() or 1
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        window = 2 * workers
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_render_chunk, task))
+            if len(pending) >= window:
+                writer.append_batch(*pending.popleft().result())
+        while pending:
+            writer.append_batch(*pending.popleft().result())
+    return count
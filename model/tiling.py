@@ -0,0 +1,143 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_OVERLAP = 32
+
+def tile_positions(length, tile_size, overlap):
+    """
+    Get the start offsets of overlapping tiles along one axis
+
+    Tiles are tile_size long, consecutive tiles share at least overlap
+    pixels, and the last tile ends exactly at the edge.
+
+    Args:
+        length: Length of the axis
+        tile_size: Length of a tile
+        overlap: Minimum number of pixels shared by neighbouring tiles
+
+    Returns:
+        List of start offsets
+    """
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    positions = list(range(0, length - tile_size + 1, step))
+    if positions[-1] + tile_size < length:
+        positions.append(length - tile_size)
+    return positions
+
+def _feather(length, start, end, total, overlap):
+    """
+    1-D blending weights of a tile covering [start, end) of an axis of size total
+
+    Weights ramp up over the overlap on sides shared with a neighbour and
+    stay at 1 on sides at the image edge.
+    """
+    weights = np.ones(length, dtype=np.float32)
+    ramp = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+    ramp_length = min(overlap, length)
+    if start > 0 and ramp_length:
+        weights[:ramp_length] = np.minimum(weights[:ramp_length], ramp[:ramp_length])
+    if end < total and ramp_length:
+        weights[-ramp_length:] = np.minimum(weights[-ramp_length:], ramp[:ramp_length][::-1])
+    return weights
+
+def iter_tiled_rows(read_rows, shape, run_tile, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP,
+                    executor=None):
+    """
+    Process a large grayscale image in overlapping tiles, one row of tiles at a time
+
+    Every tile of a row is processed in parallel on the executor and
+    feathered into a float32 band accumulator; rows that no later tile
+    touches are normalized and yielded right away. Only the band being
+    assembled is held in float, so memory stays bounded by the tile size
+    and image width however tall the image is.
+
+    Args:
+        read_rows: Callable read_rows(top, bottom) returning the uint8 rows [top, bottom) of the input
+        shape: (height, width) of the image
+        run_tile: Callable processing one uint8 tile into a same-shaped array
+        tile_size: Side of a square tile
+        overlap: Pixels shared by neighbouring tiles, blended at the seams
+        executor: Optional concurrent.futures executor for the tiles of a row
+
+    Yields:
+        Tuples (top, rows) of finished uint8 output rows starting at row top
+    """
+    height, width = shape
+    if overlap >= tile_size:
+        raise ValueError('overlap must be smaller than tile_size')
+
+    ys = tile_positions(height, tile_size, overlap)
+    xs = tile_positions(width, tile_size, overlap)
+    tile_h = min(tile_size, height)
+    tile_w = min(tile_size, width)
+
+    # Column weights are the same for every row of tiles
+    column_weights = [_feather(tile_w, x, x + tile_w, width, overlap) for x in xs]
+
+    # Band accumulators start at the current row of tiles
+    acc = np.zeros((tile_h, width), dtype=np.float32)
+    weight_sum = np.zeros((tile_h, width), dtype=np.float32)
+    carried = 0
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor()
+
+    try:
+        for row, y in enumerate(ys):
+            band = read_rows(y, y + tile_h)
+            row_weights = _feather(tile_h, y, y + tile_h, height, overlap)
+
+            # Rows below the carried over part start empty
+            acc[carried:] = 0
+            weight_sum[carried:] = 0
+
+            tiles = [band[:, x:x + tile_w] for x in xs]
+            for x, col_weights, result in zip(xs, column_weights, executor.map(run_tile, tiles)):
+                weights = np.outer(row_weights, col_weights)
+                acc[:, x:x + tile_w] += np.asarray(result, dtype=np.float32) * weights
+                weight_sum[:, x:x + tile_w] += weights
+
+            # Emit the rows the next row of tiles does not reach
+            done = ys[row + 1] - y if row + 1 < len(ys) else tile_h
+            finished = acc[:done] / weight_sum[:done]
+            np.clip(finished, 0, 255, out=finished)
+            yield y, np.rint(finished).astype(np.uint8)
+
+            # Move the overlapping rows to the top of the band
+            carried = tile_h - done
+            if carried:
+                acc[:carried] = acc[done:]
+                weight_sum[:carried] = weight_sum[done:]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def process_tiled(img, run_tile, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP, executor=None):
+    """
+    Process a grayscale image at full resolution in overlapping tiles
+
+    Args:
+        img: PIL Image in mode 'L' or 2-D uint8 numpy array
+        run_tile: Callable processing one uint8 tile into a same-shaped array
+        tile_size: Side of a square tile
+        overlap: Pixels shared by neighbouring tiles, blended at the seams
+        executor: Optional concurrent.futures executor for the tiles of a row
+
+    Returns:
+        uint8 numpy array of the same size as the input
+    """
+    if isinstance(img, np.ndarray):
+        shape = img.shape
+        read_rows = lambda top, bottom: img[top:bottom]
+    else:
+        shape = (img.height, img.width)
+        read_rows = lambda top, bottom: np.asarray(img.crop((0, top, img.width, bottom)))
+
+    output = np.empty(shape, dtype=np.uint8)
+    for top, rows in iter_tiled_rows(read_rows, shape, run_tile, tile_size, overlap, executor):
+        output[top:top + len(rows)] = rows
+    return output
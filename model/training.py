@@ -0,0 +1,511 @@
+import sys
+import time
+import numpy as np
+
+# SELU constants
+_SELU_ALPHA = 1.6732632423543772
+_SELU_SCALE = 1.0507009873554805
+
+def peak_memory_mb():
+    """Get the peak resident memory of this process in MB (None if unknown)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _activate(name, z):
+    """Apply an activation to z in place and return it"""
+    if name == 'relu':
+        np.maximum(z, 0, out=z)
+    elif name == 'sigmoid':
+        with np.errstate(over='ignore'):
+            np.negative(z, out=z)
+            np.exp(z, out=z)
+            z += 1
+            np.reciprocal(z, out=z)
+    elif name == 'tanh':
+        np.tanh(z, out=z)
+    elif name == 'selu':
+        negative = z < 0
+        z[negative] = _SELU_ALPHA * np.expm1(z[negative])
+        z *= _SELU_SCALE
+    elif name not in (None, 'linear'):
+        raise ValueError(f"Unknown activation: {name}")
+    return z
+
+def _activation_grad(name, out, grad):
+    """Multiply grad in place by the activation derivative, expressed through its output"""
+    if name == 'relu':
+        grad *= out > 0
+    elif name == 'sigmoid':
+        grad *= out
+        grad *= 1 - out
+    elif name == 'tanh':
+        grad *= 1 - out * out
+    elif name == 'selu':
+        grad *= np.where(out > 0, _SELU_SCALE, out + _SELU_SCALE * _SELU_ALPHA)
+    return grad
+
+class Layer:
+    """Base class of the training engine's layers"""
+    params = ()
+
+    def __init__(self):
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        """Get a float32 buffer that is reused between batches of the same size"""
+        key = (name, shape)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = np.empty(shape, dtype=np.float32)
+            self._buffers[key] = buf
+        return buf
+
+    def forward(self, x, training=False):
+        raise NotImplementedError
+
+    def backward(self, grad):
+        raise NotImplementedError
+
+class Flatten(Layer):
+    """Flatten everything but the batch axis"""
+    def output_shape(self, input_shape):
+        return (int(np.prod(input_shape)),)
+
+    def forward(self, x, training=False):
+        self.input_shape = x.shape
+        return x.reshape(len(x), -1)
+
+    def backward(self, grad):
+        return grad.reshape(self.input_shape)
+
+class Dense(Layer):
+    """Fully connected layer; inputs with more than one axis are flattened"""
+    def __init__(self, input_size, units, activation, rng):
+        super().__init__()
+        self.activation = activation
+        # He initialization for rectifiers, Glorot for saturating activations
+        if activation in ('relu', 'selu'):
+            scale = np.sqrt(2.0 / input_size)
+        else:
+            scale = np.sqrt(2.0 / (input_size + units))
+        self.W = (rng.standard_normal((input_size, units)) * scale).astype(np.float32)
+        self.b = np.zeros(units, dtype=np.float32)
+
+        # Gradient buffers are allocated once and written in place
+        self.dW = np.zeros_like(self.W)
+        self.db = np.zeros_like(self.b)
+        self.params = ((self.W, self.dW), (self.b, self.db))
+
+    def output_shape(self, input_shape):
+        return (self.W.shape[1],)
+
+    def forward(self, x, training=False):
+        self.input_shape = x.shape
+        self.x = x.reshape(len(x), -1)
+        out = self._buffer('out', (len(x), self.W.shape[1]))
+        np.matmul(self.x, self.W, out=out)
+        out += self.b
+        self.out = _activate(self.activation, out)
+        return self.out
+
+    def backward(self, grad):
+        dz = _activation_grad(self.activation, self.out, grad)
+        np.matmul(self.x.T, dz, out=self.dW)
+        np.sum(dz, axis=0, out=self.db)
+        dx = self._buffer('dx', self.x.shape)
+        np.matmul(dz, self.W.T, out=dx)
+        return dx.reshape(self.input_shape)
+
+class Conv2D(Layer):
+    """
+    2-D convolution with 'same' padding and stride 1 on NHWC inputs
+
+    Implemented as im2col followed by one BLAS matrix multiply.
+    """
+    def __init__(self, input_shape, filters, kernel_size, activation, rng):
+        super().__init__()
+        if kernel_size % 2 == 0:
+            raise ValueError('Conv2D kernel_size must be odd')
+        self.kernel_size = kernel_size
+        self.activation = activation
+        self.channels = input_shape[-1]
+        fan_in = kernel_size * kernel_size * self.channels
+        if activation in ('relu', 'selu'):
+            scale = np.sqrt(2.0 / fan_in)
+        else:
+            scale = np.sqrt(2.0 / (fan_in + filters))
+        self.W = (rng.standard_normal((fan_in, filters)) * scale).astype(np.float32)
+        self.b = np.zeros(filters, dtype=np.float32)
+
+        self.dW = np.zeros_like(self.W)
+        self.db = np.zeros_like(self.b)
+        self.params = ((self.W, self.dW), (self.b, self.db))
+
+        # The first layer never needs the gradient of its input
+        self.needs_input_grad = True
+
+    def output_shape(self, input_shape):
+        return input_shape[:2] + (self.W.shape[1],)
+
+    def forward(self, x, training=False):
+        n, h, w, c = x.shape
+        k = self.kernel_size
+        pad = k // 2
+        self.input_shape = x.shape
+
+        padded = self._buffer('padded', (n, h + 2 * pad, w + 2 * pad, c))
+        padded.fill(0)
+        padded[:, pad:pad + h, pad:pad + w, :] = x
+
+        # cols[n, y, x, i, j, c] = padded[n, y + i, x + j, c]
+        cols = self._buffer('cols', (n, h, w, k, k, c))
+        for i in range(k):
+            for j in range(k):
+                cols[:, :, :, i, j, :] = padded[:, i:i + h, j:j + w, :]
+        self.cols = cols.reshape(n * h * w, k * k * c)
+
+        out = self._buffer('out', (n * h * w, self.W.shape[1]))
+        np.matmul(self.cols, self.W, out=out)
+        out += self.b
+        self.out = _activate(self.activation, out)
+        return self.out.reshape(n, h, w, -1)
+
+    def backward(self, grad):
+        n, h, w, c = self.input_shape
+        k = self.kernel_size
+        pad = k // 2
+
+        dz = _activation_grad(self.activation, self.out, grad.reshape(self.out.shape))
+        np.matmul(self.cols.T, dz, out=self.dW)
+        np.sum(dz, axis=0, out=self.db)
+        if not self.needs_input_grad:
+            return None
+
+        dcols = self._buffer('dcols', self.cols.shape)
+        np.matmul(dz, self.W.T, out=dcols)
+        dcols = dcols.reshape(n, h, w, k, k, c)
+
+        # col2im: scatter every patch position back onto the padded input
+        dpadded = self._buffer('dpadded', (n, h + 2 * pad, w + 2 * pad, c))
+        dpadded.fill(0)
+        for i in range(k):
+            for j in range(k):
+                dpadded[:, i:i + h, j:j + w, :] += dcols[:, :, :, i, j, :]
+        return dpadded[:, pad:pad + h, pad:pad + w, :]
+
+class MaxPool(Layer):
+    """Non-overlapping max pooling; trailing rows and columns that do not fill a window are dropped"""
+    def __init__(self, pool_size):
+        super().__init__()
+        self.pool_size = pool_size
+
+    def output_shape(self, input_shape):
+        p = self.pool_size
+        return (input_shape[0] // p, input_shape[1] // p, input_shape[2])
+
+    def forward(self, x, training=False):
+        n, h, w, c = x.shape
+        p = self.pool_size
+        self.input_shape = x.shape
+        hp, wp = h // p, w // p
+
+        # Gather every window into the last axis
+        windows = x[:, :hp * p, :wp * p, :].reshape(n, hp, p, wp, p, c)
+        windows = windows.transpose(0, 1, 3, 5, 2, 4).reshape(n, hp, wp, c, p * p)
+        self.argmax = windows.argmax(axis=-1)[..., np.newaxis]
+        return np.take_along_axis(windows, self.argmax, axis=-1)[..., 0]
+
+    def backward(self, grad):
+        n, h, w, c = self.input_shape
+        p = self.pool_size
+        hp, wp = h // p, w // p
+
+        # Route each gradient to the position that won the max
+        dwindows = np.zeros((n, hp, wp, c, p * p), dtype=np.float32)
+        np.put_along_axis(dwindows, self.argmax, grad[..., np.newaxis], axis=-1)
+        dwindows = dwindows.reshape(n, hp, wp, c, p, p).transpose(0, 1, 4, 2, 5, 3)
+
+        dx = self._buffer('dx', self.input_shape)
+        dx.fill(0)
+        dx[:, :hp * p, :wp * p, :] = dwindows.reshape(n, hp * p, wp * p, c)
+        return dx
+
+class Dropout(Layer):
+    """Inverted dropout, only active while training"""
+    def __init__(self, rate, rng):
+        super().__init__()
+        self.rate = rate
+        self.rng = rng
+
+    def output_shape(self, input_shape):
+        return input_shape
+
+    def forward(self, x, training=False):
+        if not training or self.rate <= 0:
+            self.mask = None
+            return x
+        self.mask = (self.rng.random(x.shape, dtype=np.float32) >= self.rate) / np.float32(1 - self.rate)
+        return x * self.mask
+
+    def backward(self, grad):
+        return grad if self.mask is None else grad * self.mask
+
+class Network:
+    """
+    Feed-forward network built from an UnShineyModel architecture
+
+    The input is a batch of H×W grayscale images scaled to 0-1 and the last
+    layer must be a dense layer with H*W units, read back as an image.
+    """
+    def __init__(self, architecture, image_shape, seed=None):
+        """
+        Build the layers
+
+        Args:
+            architecture: List of layer dictionaries (flatten, dense, conv2d, maxpool, dropout)
+            image_shape: (height, width) of input and output images
+            seed: Optional random seed for weight initialization
+        """
+        self.image_shape = tuple(image_shape)
+        self.rng = np.random.default_rng(seed)
+        self.layers = []
+
+        shape = self.image_shape + (1,)
+        for config in architecture:
+            layer = self._build_layer(config, shape)
+            shape = layer.output_shape(shape)
+            self.layers.append(layer)
+
+        if shape != (self.image_shape[0] * self.image_shape[1],):
+            raise ValueError(
+                f"The last layer must be a dense layer with {self.image_shape[0] * self.image_shape[1]} units"
+            )
+
+        # Nothing upstream of the first convolution needs its gradient
+        if self.layers and isinstance(self.layers[0], Conv2D):
+            self.layers[0].needs_input_grad = False
+
+        self.params = [pair for layer in self.layers for pair in layer.params]
+
+    def _build_layer(self, config, input_shape):
+        """Build one layer from its configuration"""
+        layer_type = config.get('type')
+        activation = config.get('activation')
+        if layer_type == 'dense':
+            return Dense(int(np.prod(input_shape)), int(config['units']), activation, self.rng)
+        if layer_type == 'conv2d':
+            if len(input_shape) != 3:
+                raise ValueError('conv2d layers must come before flatten and dense layers')
+            return Conv2D(input_shape, int(config['filters']), int(config.get('kernel_size', 3)), activation, self.rng)
+        if layer_type == 'maxpool':
+            if len(input_shape) != 3:
+                raise ValueError('maxpool layers must come before flatten and dense layers')
+            return MaxPool(int(config.get('pool_size', 2)))
+        if layer_type == 'flatten':
+            return Flatten()
+        if layer_type == 'dropout':
+            return Dropout(float(config.get('rate', 0.5)), self.rng)
+        raise ValueError(f"Unknown layer type: {layer_type}")
+
+    @property
+    def parameter_count(self):
+        return sum(param.size for param, _ in self.params)
+
+    def forward(self, x, training=False):
+        """Run a float32 (N, H, W, 1) batch through the network"""
+        for layer in self.layers:
+            x = layer.forward(x, training)
+        return x
+
+    def backward(self, grad):
+        """Backpropagate the loss gradient, filling every layer's gradient buffers"""
+        for layer in reversed(self.layers):
+            grad = layer.backward(grad)
+            if grad is None:
+                break
+
+    def predict(self, img_stack, batch_size=64):
+        """
+        Run uint8 images through the network
+
+        Args:
+            img_stack: Numpy uint8 array of shape (N, H, W)
+            batch_size: Number of images per forward pass
+
+        Returns:
+            Numpy uint8 array of shape (N, H, W)
+        """
+        output = np.empty(img_stack.shape, dtype=np.uint8)
+        for start in range(0, len(img_stack), batch_size):
+            batch = img_stack[start:start + batch_size].astype(np.float32)[..., np.newaxis]
+            batch /= 255.0
+            pred = self.forward(batch)
+            pred *= 255.0
+            np.clip(pred, 0, 255, out=pred)
+            output[start:start + batch_size] = pred.reshape((-1,) + self.image_shape)
+        return output
+
+class Adam:
+    """Adam optimizer updating parameters in place with preallocated moment buffers"""
+    def __init__(self, params, learning_rate=0.001, beta1=0.9, beta2=0.999, epsilon=1e-7):
+        self.params = params
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.iterations = 0
+        self.m = [np.zeros_like(param) for param, _ in params]
+        self.v = [np.zeros_like(param) for param, _ in params]
+        self.scratch = [np.empty_like(param) for param, _ in params]
+
+    def step(self):
+        """Apply one update from the current gradient buffers"""
+        self.iterations += 1
+        t = self.iterations
+        lr_t = self.learning_rate * np.sqrt(1 - self.beta2 ** t) / (1 - self.beta1 ** t)
+
+        for (param, grad), m, v, scratch in zip(self.params, self.m, self.v, self.scratch):
+            # m = beta1 * m + (1 - beta1) * grad
+            m *= self.beta1
+            np.multiply(grad, 1 - self.beta1, out=scratch)
+            m += scratch
+            # v = beta2 * v + (1 - beta2) * grad^2
+            v *= self.beta2
+            np.multiply(grad, grad, out=scratch)
+            scratch *= 1 - self.beta2
+            v += scratch
+            # param -= lr_t * m / (sqrt(v) + epsilon)
+            np.sqrt(v, out=scratch)
+            scratch += self.epsilon
+            np.divide(m, scratch, out=scratch)
+            scratch *= lr_t
+            param -= scratch
+
+def _mae(pred, target, diff=None, grad=None):
+    """
+    Mean absolute error and its gradient with respect to pred
+
+    Args:
+        pred: float32 predictions
+        target: float32 targets of the same shape
+        diff: Optional scratch buffer of that shape
+        grad: Optional buffer of that shape to write the gradient to
+
+    Returns:
+        Tuple (loss, grad)
+    """
+    diff = np.subtract(pred, target, out=diff)
+    grad = np.sign(diff, out=grad)
+    grad /= diff.size
+    np.abs(diff, out=diff)
+    return float(diff.mean()), grad
+
+def train_network(network, inputs, targets, epochs=10, batch_size=32, learning_rate=0.001,
+                  validation_split=0.2, seed=None, on_epoch_end=None, should_stop=None):
+    """
+    Train a network with mini-batch Adam on mean absolute error
+
+    Args:
+        network: Network to train
+        inputs: uint8 array (N, H, W) of images with shine
+        targets: uint8 array (N, H, W) of clean images
+        epochs: Number of epochs to train
+        batch_size: Batch size
+        learning_rate: Adam learning rate
+        validation_split: Fraction of the pairs held out for validation
+        seed: Optional random seed for the split and shuffling
+        on_epoch_end: Optional callback(epoch, stats) called after every epoch
+        should_stop: Optional callable; training stops after the current batch once it returns True
+
+    Returns:
+        History dictionary with per-epoch 'loss' and 'val_loss' lists,
+        'epochs_completed', 'samples_per_sec' and 'peak_memory_mb'
+    """
+    rng = np.random.default_rng(seed)
+    count = len(inputs)
+    if count == 0:
+        raise ValueError('Cannot train on an empty dataset')
+
+    # Hold out a validation set (none for a single pair)
+    order = rng.permutation(count)
+    val_count = max(1, int(count * validation_split)) if validation_split > 0 and count > 1 else 0
+    val_idx, train_idx = order[:val_count], order[val_count:]
+
+    batch_size = max(1, min(batch_size, len(train_idx)))
+    height, width = network.image_shape
+    optimizer = Adam(network.params, learning_rate=learning_rate)
+
+    # Preallocated float32 batch buffers, and the loss's scratch and gradient
+    x_buf = np.empty((batch_size, height, width, 1), dtype=np.float32)
+    t_buf = np.empty((batch_size, height * width), dtype=np.float32)
+    diff_buf = np.empty_like(t_buf)
+    grad_buf = np.empty_like(t_buf)
+
+    def load_batch(idx):
+        n = len(idx)
+        x, t = x_buf[:n], t_buf[:n]
+        np.multiply(inputs[idx].reshape(n, height, width, 1), 1 / 255.0, out=x)
+        np.multiply(targets[idx].reshape(n, height * width), 1 / 255.0, out=t)
+        return x, t
+
+    def loss(pred, t):
+        n = len(t)
+        return _mae(pred, t, diff_buf[:n], grad_buf[:n])
+
+    history = {'loss': [], 'val_loss': []}
+    samples_seen = 0
+    train_time = 0.0
+    stopped = False
+
+    for epoch in range(epochs):
+        epoch_start = time.perf_counter()
+        rng.shuffle(train_idx)
+        loss_sum = 0.0
+        for start in range(0, len(train_idx), batch_size):
+            idx = np.sort(train_idx[start:start + batch_size])
+            x, t = load_batch(idx)
+            pred = network.forward(x, training=True)
+            batch_loss, grad = loss(pred, t)
+            network.backward(grad)
+            optimizer.step()
+            loss_sum += batch_loss * len(idx)
+            samples_seen += len(idx)
+            if should_stop is not None and should_stop():
+                stopped = True
+                break
+        train_time += time.perf_counter() - epoch_start
+
+        if stopped:
+            break
+
+        train_loss = loss_sum / len(train_idx)
+        if val_count:
+            val_sum = 0.0
+            for start in range(0, val_count, batch_size):
+                idx = np.sort(val_idx[start:start + batch_size])
+                x, t = load_batch(idx)
+                val_sum += loss(network.forward(x), t)[0] * len(idx)
+            val_loss = val_sum / val_count
+        else:
+            val_loss = train_loss
+
+        history['loss'].append(round(train_loss, 4))
+        history['val_loss'].append(round(val_loss, 4))
+
+        if on_epoch_end is not None:
+            on_epoch_end(epoch, {
+                'loss': history['loss'][-1],
+                'val_loss': history['val_loss'][-1],
+                'epoch_time': time.perf_counter() - epoch_start,
+                'samples_per_sec': samples_seen / train_time if train_time > 0 else 0.0
+            })
+
+    history['epochs_completed'] = len(history['loss'])
+    history['samples_per_sec'] = round(samples_seen / train_time, 1) if train_time > 0 else 0.0
+    history['peak_memory_mb'] = peak_memory_mb()
+    return history
@@ -0,0 +1,238 @@
+import time
+import numpy as np
+from scipy import fft
+
+TV_METHODS = ('chambolle', 'bregman')
+
+# Defaults of skimage's denoise_tv_chambolle
+DEFAULT_MAX_ITERATIONS = 200
+DEFAULT_TOLERANCE = 2e-4
+
+def _gradient(img, out):
+    """Forward differences along the last two axes, zero on the far edge"""
+    out[0, ..., :-1, :] = img[..., 1:, :] - img[..., :-1, :]
+    out[0, ..., -1, :] = 0
+    out[1, ..., :, :-1] = img[..., :, 1:] - img[..., :, :-1]
+    out[1, ..., :, -1] = 0
+    return out
+
+def _divergence(field, out):
+    """Negative adjoint of _gradient"""
+    np.copyto(out, field[0])
+    out[..., 1:, :] -= field[0, ..., :-1, :]
+    out += field[1]
+    out[..., :, 1:] -= field[1, ..., :, :-1]
+    return out
+
+class _Stack:
+    """
+    Images of a stack that are still being iterated
+
+    Converged images are written to the result and dropped from the working
+    arrays, so the remaining iterations only touch images that need them.
+    """
+    def __init__(self, img_stack, result, **arrays):
+        self.index = np.arange(len(img_stack))
+        self.image = img_stack
+        self.result = result
+        self.arrays = arrays
+
+    def retire(self, done, current):
+        """Store the images flagged in done and keep iterating the rest"""
+        self.result[self.index[done]] = current[done]
+        keep = ~done
+        self.index = self.index[keep]
+        self.image = self.image[keep]
+        for name, array in self.arrays.items():
+            # Gradient fields (2×N×H×W) have the image axis second
+            self.arrays[name] = array[:, keep] if array.ndim == 4 else array[keep]
+        return keep
+
+    def __len__(self):
+        return len(self.index)
+
+def _chambolle(img_stack, weight, max_iterations, tolerance, deadline):
+    """Chambolle's projection algorithm, iterated on every image at once"""
+    result = np.empty_like(img_stack)
+    n = len(img_stack)
+    # The energies are kept in the image dtype, as skimage keeps them
+    state = _Stack(img_stack, result,
+                   p=np.zeros((2,) + img_stack.shape, dtype=img_stack.dtype),
+                   g=np.zeros((2,) + img_stack.shape, dtype=img_stack.dtype),
+                   e_init=np.zeros(n, dtype=img_stack.dtype), e_previous=np.zeros(n, dtype=img_stack.dtype))
+    pixels = float(img_stack[0].size)
+    tau = 0.25
+    out = img_stack
+    iterations = 0
+
+    while iterations < max_iterations and len(state):
+        p, g = state.arrays['p'], state.arrays['g']
+        count = len(state)
+        if iterations > 0:
+            # out = image + d with d = -div(p), in skimage's order of operations
+            d = np.add(p[0], p[1])
+            np.negative(d, out=d)
+            d[..., 1:, :] += p[0, ..., :-1, :]
+            d[..., :, 1:] += p[1, ..., :, :-1]
+            out = state.image + d
+            energy = (d * d).reshape(count, -1).sum(axis=1)
+        else:
+            out = state.image
+            energy = np.zeros(count, dtype=img_stack.dtype)
+
+        _gradient(out, g)
+        norm = np.sqrt(g[0] * g[0] + g[1] * g[1])
+        energy += weight * norm.reshape(count, -1).sum(axis=1)
+        norm *= tau / weight
+        norm += 1.0
+        g *= tau
+        p -= g
+        p /= norm
+        energy /= pixels
+
+        iterations += 1
+        if iterations == 1:
+            state.arrays['e_init'][:] = energy
+            state.arrays['e_previous'][:] = energy
+        else:
+            # Same stopping rule as skimage: |E(n-1) - E(n)| < tolerance * E(0)
+            done = np.abs(state.arrays['e_previous'] - energy) < tolerance * state.arrays['e_init']
+            state.arrays['e_previous'][:] = energy
+            if done.any():
+                keep = state.retire(done, out)
+                out = out[keep]
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+
+    if len(state):
+        state.result[state.index] = out
+    return result, iterations
+
+def _bregman(img_stack, weight, max_iterations, tolerance, deadline):
+    """
+    Split Bregman iterations for the same problem as _chambolle
+
+    Minimizes |u - f|² / 2 + weight * TV(u) with isotropic TV. The
+    quadratic subproblem is solved exactly with a cosine transform, which
+    diagonalizes the Neumann Laplacian, so a few iterations are enough.
+    """
+    mu = 1.0 / weight
+    lam = 2.0 * mu
+    height, width = img_stack.shape[-2:]
+
+    # Eigenvalues of mu - lam * Laplacian in the DCT-II basis
+    ky = 2.0 - 2.0 * np.cos(np.pi * np.arange(height) / height)
+    kx = 2.0 - 2.0 * np.cos(np.pi * np.arange(width) / width)
+    denominator = (mu + lam * (ky[:, np.newaxis] + kx[np.newaxis, :])).astype(img_stack.dtype)
+
+    result = np.empty_like(img_stack)
+    state = _Stack(img_stack, result,
+                   u=img_stack.copy(),
+                   d=np.zeros((2,) + img_stack.shape, dtype=img_stack.dtype),
+                   b=np.zeros((2,) + img_stack.shape, dtype=img_stack.dtype))
+    iterations = 0
+
+    while iterations < max_iterations and len(state):
+        u, d, b = state.arrays['u'], state.arrays['d'], state.arrays['b']
+
+        # u = (mu - lam * Laplacian)^-1 (mu * f - lam * div(d - b))
+        rhs = _divergence(d - b, np.empty_like(u))
+        rhs *= -lam
+        rhs += mu * state.image
+        spectrum = fft.dctn(rhs, type=2, axes=(-2, -1), norm='ortho')
+        spectrum /= denominator
+        new_u = fft.idctn(spectrum, type=2, axes=(-2, -1), norm='ortho').astype(u.dtype, copy=False)
+
+        # Shrink the gradient plus Bregman variable
+        grad = _gradient(new_u, np.empty_like(d))
+        s = grad + b
+        magnitude = np.sqrt(s[0] * s[0] + s[1] * s[1])
+        shrink = np.maximum(magnitude - 1.0 / lam, 0)
+        np.divide(shrink, magnitude, out=shrink, where=magnitude > 0)
+        np.multiply(s, shrink, out=d)
+        b += grad
+        b -= d
+
+        # Relative change of the image
+        change = np.sqrt(np.einsum('nij,nij->n', new_u - u, new_u - u))
+        size = np.sqrt(np.einsum('nij,nij->n', new_u, new_u))
+        state.arrays['u'] = new_u
+        iterations += 1
+
+        done = change <= tolerance * np.maximum(size, 1e-12)
+        if done.any():
+            state.retire(done, new_u)
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+
+    if len(state):
+        state.result[state.index] = state.arrays['u']
+    return result, iterations
+
+def denoise_tv(img_stack, weight=0.1, method='chambolle', max_iterations=DEFAULT_MAX_ITERATIONS,
+               tolerance=DEFAULT_TOLERANCE, time_budget=None):
+    """
+    Total variation denoising with an iteration and time budget
+
+    Every image of the stack is denoised on its own, but all of them are
+    iterated together. An image stops as soon as its relative change drops
+    below the tolerance, and the whole call stops at max_iterations or once
+    time_budget seconds have passed, returning the current estimate.
+
+    With the defaults, method 'chambolle' gives the same result as
+    skimage's denoise_tv_chambolle on each image, bit for bit: it runs
+    the same float operations in the same order. Method 'bregman' solves
+    the same problem with split Bregman iterations, which usually need far
+    fewer iterations; its tolerance applies to the relative change of the
+    image rather than of the energy.
+
+    Args:
+        img_stack: Float image (H×W) or stack (N×H×W)
+        weight: Denoising weight, higher removes more
+        method: 'chambolle' or 'bregman'
+        max_iterations: Maximum number of iterations
+        tolerance: Relative change below which an image has converged
+        time_budget: Optional maximum number of seconds to iterate
+
+    Returns:
+        Tuple (denoised float array of the same shape, iterations run)
+    """
+    if method not in TV_METHODS:
+        raise ValueError(f"Unknown TV method: {method}")
+    if weight <= 0:
+        raise ValueError('weight must be positive')
+
+    img = np.asarray(img_stack)
+    if not np.issubdtype(img.dtype, np.floating):
+        img = img.astype(np.float64)
+    shape = img.shape
+    img = img.reshape((-1,) + shape[-2:])
+    if img.size == 0 or max_iterations <= 0:
+        return img.reshape(shape).copy(), 0
+
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    solver = _chambolle if method == 'chambolle' else _bregman
+    result, iterations = solver(img, weight, max_iterations, tolerance, deadline)
+    return result.reshape(shape), iterations
+
+def tv_options(params):
+    """
+    Read the denoise budget settings of a configuration dictionary
+
+    Args:
+        params: Dictionary with optional denoise_method, denoise_max_iterations,
+            denoise_tolerance and denoise_time_budget keys
+
+    Returns:
+        Keyword arguments for denoise_tv
+    """
+    method = params.get('denoise_method', 'chambolle')
+    if method not in TV_METHODS:
+        raise ValueError(f"Unknown denoise_method: {method}")
+    time_budget = params.get('denoise_time_budget')
+    return {
+        'method': method,
+        'max_iterations': int(params.get('denoise_max_iterations', DEFAULT_MAX_ITERATIONS)),
+        'tolerance': float(params.get('denoise_tolerance', DEFAULT_TOLERANCE)),
+        'time_budget': None if time_budget is None else float(time_budget)
+    }
@@ -1,53 +1,196 @@
 import numpy as np
-from PIL import Image, ImageDraw, ImageFilter, ImageEnhance
+from PIL import Image, ImageFilter, ImageEnhance
 import io
 import base64
-import random
-import math
+import time
+from model.inpaint import pyramid_inpaint
+from model.lut import histogram, percentile
+from model.regions import blur_radius, blurred_box, replace_regions
+from model.synthetic import render_pairs
 
-def preprocess_image(img, target_size=64):
+# Largest image, in pixels, that is decoded at all
+DEFAULT_MAX_PIXELS = 50 * 1000 * 1000
+
+# Unmasked pixels the pyramid fill sees around each masked region
+_PYRAMID_CONTEXT = 32
+
+class ImageTooLarge(ValueError):
+    """Raised when an image has more pixels than allowed"""
+
+def open_image(source, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Open an image, reading only its header
+    
+    The pixel count is checked before any pixel is decoded.
+    
+    Args:
+        source: File path or file object
+        max_pixels: Maximum width * height (None for no limit)
+        
+    Returns:
+        PIL Image that has not been decoded yet
+    """
+    img = Image.open(source)
+    if max_pixels is not None and img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"Image has {img.width}x{img.height} pixels, the limit is {max_pixels}")
+    return img
+
+def resize_for_model(img, size, mode='L', reducing_gap=3.0):
+    """
+    Convert an image to grayscale or YCbCr at a target size, decoding as little as possible
+    
+    On an image that has not been decoded yet, JPEGs are decoded straight
+    to the target mode at a reduced DCT scale with draft(). The result is
+    then shrunk by an integer factor with reduce() while staying at least
+    reducing_gap times larger than the target, and only the last step uses
+    the LANCZOS filter.
+    
+    Args:
+        img: PIL Image
+        size: (width, height) of the result
+        mode: 'L' or 'YCbCr'
+        reducing_gap: How much larger than the target the image stays before LANCZOS
+        
+    Returns:
+        PIL Image in the requested mode and size
+    """
+    width, height = size
+    
+    # A no-op for anything but a JPEG that has not been decoded yet
+    img.draft(mode, (int(width * reducing_gap), int(height * reducing_gap)))
+    img = img.convert(mode)
+    
+    factor_x = max(1, int(img.width // (width * reducing_gap)))
+    factor_y = max(1, int(img.height // (height * reducing_gap)))
+    if factor_x > 1 or factor_y > 1:
+        img = img.reduce((factor_x, factor_y))
+    
+    if img.size != (width, height):
+        img = img.resize((width, height), Image.LANCZOS)
+    return img
+
+def preprocess_image(img, target_size=64, max_pixels=DEFAULT_MAX_PIXELS, color=False):
     """
     Preprocess an image for the UnShiney model
     
     Args:
         img: PIL Image or file path
         target_size: Size to resize image to (square)
+        max_pixels: Maximum width * height of an image read from a file
+        color: Keep color as YCbCr, the model then only processes channel 0 (luminance)
         
     Returns:
-        numpy array of resized grayscale image
+        numpy array of resized grayscale image, or of shape (H, W, 3) in YCbCr with color
     """
     if isinstance(img, str):
-        img = Image.open(img)
-        
-    # Convert to grayscale
-    img = img.convert('L')
+        img = open_image(img, max_pixels)
     
-    # Resize
-    img = img.resize((target_size, target_size), Image.LANCZOS)
+    # Convert to grayscale (or YCbCr) and resize
+    img = resize_for_model(img, (target_size, target_size), mode='YCbCr' if color else 'L')
     
     # Convert to numpy array
     return np.array(img)
 
-def image_to_base64(img):
+def luminance(img):
+    """Get the luminance of an image as a mode 'L' image"""
+    if img.mode == 'L':
+        return img
+    if img.mode == 'YCbCr':
+        # Already split out, no conversion needed
+        return img.getchannel(0)
+    return img.convert('L')
+
+def process_luminance(img, process):
+    """
+    Process only the luminance of a color image
+    
+    The image is converted to YCbCr once, the luminance goes through the
+    grayscale processing and the untouched chroma is merged back, so color
+    costs a single grayscale pass.
+    
+    Args:
+        img: PIL Image (converted to YCbCr if needed)
+        process: Callable turning a 2-D uint8 array into a same-shaped uint8 array
+        
+    Returns:
+        PIL Image in RGB mode
+    """
+    if img.mode != 'YCbCr':
+        img = img.convert('YCbCr')
+    y, cb, cr = img.split()
+    y = Image.fromarray(np.asarray(process(np.asarray(y)), dtype=np.uint8))
+    return Image.merge('YCbCr', (y, cb, cr)).convert('RGB')
+
+def process_for_model(img, process, size=(64, 64), color=False):
+    """
+    Resize an image to the model's input size and process it
+    
+    Args:
+        img: PIL Image, ideally not decoded yet so resize_for_model can draft it
+        process: Callable turning a 2-D uint8 array into a same-shaped uint8 array
+        size: (width, height) the image is processed at
+        color: Keep color by processing only the luminance
+        
+    Returns:
+        Processed PIL Image (grayscale, or RGB with color)
+    """
+    img = resize_for_model(img, size, mode='YCbCr' if color else 'L')
+    if color:
+        return process_luminance(img, process)
+    return Image.fromarray(process(np.array(img)))
+
+# MIME types of the formats encode_image supports
+IMAGE_MIMETYPES = {
+    'PNG': 'image/png',
+    'WEBP': 'image/webp'
+}
+
+def encode_image(img, format='PNG', compress_level=6, optimize=False, webp_method=4):
+    """
+    Encode a PIL Image losslessly
+    
+    Args:
+        img: PIL Image
+        format: 'PNG' or 'WEBP'
+        compress_level: PNG zlib level, 0 (fastest) to 9 (smallest)
+        optimize: Let the PNG encoder search for the smallest output (slow)
+        webp_method: WebP effort, 0 (fastest) to 6 (smallest)
+        
+    Returns:
+        Encoded bytes
+    """
+    format = format.upper()
+    buffer = io.BytesIO()
+    if format == 'PNG':
+        img.save(buffer, format='PNG', compress_level=compress_level, optimize=optimize)
+    elif format == 'WEBP':
+        # Lossless WebP uses quality as compression effort
+        img.save(buffer, format='WEBP', lossless=True, quality=100, method=webp_method)
+    else:
+        raise ValueError(f"Unsupported image format: {format}")
+    return buffer.getvalue()
+
+def image_to_base64(img, format='PNG', **options):
     """
     Convert PIL Image to base64 string
     
     Args:
         img: PIL Image
+        format: 'PNG' or 'WEBP'
+        **options: Encoder options passed to encode_image
         
     Returns:
         base64 encoded string
     """
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return base64.b64encode(encode_image(img, format, **options)).decode('utf-8')
 
-def base64_to_image(base64_str):
+def base64_to_image(base64_str, max_pixels=None):
     """
     Convert base64 string to PIL Image
     
     Args:
         base64_str: base64 encoded string
+        max_pixels: Maximum width * height, checked before decoding (None for no limit)
         
     Returns:
         PIL Image
@@ -57,257 +200,99 @@ def base64_to_image(base64_str):
         base64_str = base64_str.split(',')[1]
         
     img_data = base64.b64decode(base64_str)
-    return Image.open(io.BytesIO(img_data))
+    return open_image(io.BytesIO(img_data), max_pixels)
+
+def decode_mask_rle(runs, size):
+    """
+    Decode a run-length encoded mask
+    
+    Runs alternate between unmasked and masked pixels, starting with an
+    unmasked run (which may be 0), over the pixels in row-major order.
+    
+    Args:
+        runs: Run lengths as a sequence of integers or a string of
+            integers separated by commas or whitespace
+        size: (width, height) of the mask
+        
+    Returns:
+        uint8 numpy array of shape (height, width), 255 where masked
+    """
+    if isinstance(runs, str):
+        runs = runs.replace(',', ' ').split()
+    try:
+        runs = np.asarray(runs, dtype=np.int64)
+    except (TypeError, ValueError):
+        raise ValueError('Mask runs must be integers')
+    if runs.ndim != 1:
+        raise ValueError('Mask runs must be a flat list')
+    if (runs < 0).any():
+        raise ValueError('Mask runs must not be negative')
+    
+    width, height = size
+    if runs.sum() != width * height:
+        raise ValueError(f"Mask runs cover {runs.sum()} pixels, the image has {width * height}")
+    
+    # Even runs are unmasked, odd runs masked
+    values = np.zeros(len(runs), dtype=np.uint8)
+    values[1::2] = 255
+    return np.repeat(values, runs).reshape(height, width)
 
-def generate_sample_images(count=5, size=256):
+def generate_sample_images(count=5, size=256, seed=None):
     """
     Generate sample images with simulated shine/glare for testing
     
     Args:
         count: Number of image pairs to generate
         size: Size of each image in pixels
+        seed: Optional seed for reproducible samples
         
     Returns:
         List of tuples (input_image, target_image)
     """
-    samples = []
-    
-    # Generate different types of samples
-    generators = [
-        generate_gradient_with_shine,
-        generate_circle_with_shine,
-        generate_grid_with_shine,
-        generate_text_with_shine,
-        generate_pattern_with_shine
-    ]
-    
-    # Generate sample pairs
-    for i in range(count):
-        generator = generators[i % len(generators)]
-        input_img, target_img = generator(size)
-        samples.append((input_img, target_img))
-    
-    return samples
+    # Rendered as one batch, rotating through the kinds of samples
+    originals, cleans = render_pairs(count, size, seed=seed)
+    return [(Image.fromarray(original), Image.fromarray(clean)) for original, clean in zip(originals, cleans)]
+
+def _generate_one(kind, size):
+    """Generate one sample pair of a kind as PIL Images"""
+    originals, cleans = render_pairs(1, size, kinds=(kind,))
+    return Image.fromarray(originals[0]), Image.fromarray(cleans[0])
 
 def generate_gradient_with_shine(size=256):
     """Generate a gradient image with a simulated shine spot"""
-    # Create a smaller size for efficiency then resize
-    small_size = min(size, 64)
-    scale_factor = size / small_size
-    
-    # Generate gradient
-    x = np.linspace(0, 1, small_size)
-    y = np.linspace(0, 1, small_size)
-    xx, yy = np.meshgrid(x, y)
-    
-    # Create target (clean gradient)
-    target_img = (xx * yy * 255).astype(np.uint8)
-    
-    # Create input (gradient with shine)
-    # Add a shine spot
-    shine_x = 0.7
-    shine_y = 0.3
-    shine_radius = 0.05
-    shine_intensity = 200
-    
-    shine = np.exp(-((xx-shine_x)**2 + (yy-shine_y)**2)/shine_radius) * shine_intensity
-    input_img = np.clip(target_img + shine.astype(np.uint8), 0, 255).astype(np.uint8)
-    
-    # Convert to PIL Images and resize
-    input_pil = Image.fromarray(input_img).resize((size, size), Image.LANCZOS)
-    target_pil = Image.fromarray(target_img).resize((size, size), Image.LANCZOS)
-    
-    return input_pil, target_pil
+    return _generate_one('gradient', size)
 
 def generate_circle_with_shine(size=256):
     """Generate a circle with simulated shine or reflection"""
-    # Create image with a circle
-    target_img = Image.new('L', (size, size), color=20)
-    draw = ImageDraw.Draw(target_img)
-    
-    # Draw a circle in the middle
-    center = size // 2
-    radius = size // 3
-    draw.ellipse((center-radius, center-radius, center+radius, center+radius), fill=180)
-    
-    # Create a copy for input image
-    input_img = target_img.copy()
-    
-    # Add shine to the input image
-    shine = Image.new('L', (size, size), color=0)
-    shine_draw = ImageDraw.Draw(shine)
-    
-    # Draw an oval shine
-    shine_center_x = center + radius // 2
-    shine_center_y = center - radius // 2
-    shine_width = radius // 2
-    shine_height = radius // 1.5
-    
-    shine_draw.ellipse(
-        (shine_center_x-shine_width, shine_center_y-shine_height, 
-         shine_center_x+shine_width, shine_center_y+shine_height), 
-        fill=200
-    )
-    
-    # Blur the shine
-    shine = shine.filter(ImageFilter.GaussianBlur(radius=size//30))
-    
-    # Compose the input image with shine
-    input_array = np.array(input_img)
-    shine_array = np.array(shine)
-    
-    input_array = np.clip(input_array + shine_array, 0, 255).astype(np.uint8)
-    input_img = Image.fromarray(input_array)
-    
-    return input_img, target_img
+    return _generate_one('circle', size)
 
 def generate_grid_with_shine(size=256):
     """Generate a grid pattern with simulated shine"""
-    # Create a grid pattern
-    target_img = Image.new('L', (size, size), color=20)
-    draw = ImageDraw.Draw(target_img)
-    
-    # Draw a grid
-    line_spacing = size // 10
-    line_color = 160
-    
-    # Vertical lines
-    for x in range(0, size, line_spacing):
-        draw.line([(x, 0), (x, size)], fill=line_color, width=2)
-    
-    # Horizontal lines
-    for y in range(0, size, line_spacing):
-        draw.line([(0, y), (size, y)], fill=line_color, width=2)
-    
-    # Create a copy for input image
-    input_img = target_img.copy()
-    
-    # Create shine mask
-    shine = Image.new('L', (size, size), color=0)
-    shine_draw = ImageDraw.Draw(shine)
-    
-    # Draw multiple shine spots
-    for _ in range(3):
-        x = random.randint(0, size)
-        y = random.randint(0, size)
-        radius = random.randint(size//10, size//5)
-        
-        shine_draw.ellipse((x-radius, y-radius, x+radius, y+radius), fill=100)
-    
-    # Blur the shine
-    shine = shine.filter(ImageFilter.GaussianBlur(radius=size//20))
-    
-    # Compose the input image with shine
-    input_array = np.array(input_img)
-    shine_array = np.array(shine)
-    
-    input_array = np.clip(input_array + shine_array, 0, 255).astype(np.uint8)
-    input_img = Image.fromarray(input_array)
-    
-    return input_img, target_img
+    return _generate_one('grid', size)
 
 def generate_text_with_shine(size=256):
     """Generate an image with text and simulated glare"""
-    # Create base image
-    target_img = Image.new('L', (size, size), color=220)
-    draw = ImageDraw.Draw(target_img)
-    
-    # Draw text (simulating text without actual font dependency)
-    # Just draw some rectangles to look like text lines
-    margin = size // 8
-    line_height = size // 10
-    line_width = size - 2 * margin
-    
-    for i in range(margin, size - margin, line_height + 5):
-        # Vary line lengths
-        this_width = int(line_width * (0.7 + 0.3 * random.random()))
-        draw.rectangle((margin, i, margin + this_width, i + line_height), fill=50)
-    
-    # Create a copy for input image
-    input_img = target_img.copy()
-    
-    # Create a diagonal glare
-    shine = Image.new('L', (size, size), color=0)
-    shine_draw = ImageDraw.Draw(shine)
-    
-    # Draw a diagonal line of shine
-    line_width = size // 3
-    angle = random.uniform(20, 70)
-    x1 = size // 2 - (size * math.cos(math.radians(angle)))
-    y1 = size // 2 - (size * math.sin(math.radians(angle)))
-    x2 = size // 2 + (size * math.cos(math.radians(angle)))
-    y2 = size // 2 + (size * math.sin(math.radians(angle)))
-    
-    for i in range(-line_width//2, line_width//2):
-        dx = i * math.sin(math.radians(angle))
-        dy = -i * math.cos(math.radians(angle))
-        shine_draw.line([(x1+dx, y1+dy), (x2+dx, y2+dy)], fill=150, width=3)
-    
-    # Blur the shine
-    shine = shine.filter(ImageFilter.GaussianBlur(radius=size//15))
-    
-    # Compose the input image with shine
-    input_array = np.array(input_img)
-    shine_array = np.array(shine)
-    
-    input_array = np.clip(input_array + shine_array, 0, 255).astype(np.uint8)
-    input_img = Image.fromarray(input_array)
-    
-    return input_img, target_img
+    return _generate_one('text', size)
 
 def generate_pattern_with_shine(size=256):
     """Generate a pattern with simulated shine spots"""
-    # Create a pattern with circles
-    target_img = Image.new('L', (size, size), color=200)
-    draw = ImageDraw.Draw(target_img)
-    
-    # Draw a pattern of circles
-    circle_size = size // 12
-    spacing = size // 6
-    
-    for x in range(spacing // 2, size, spacing):
-        for y in range(spacing // 2, size, spacing):
-            draw.ellipse(
-                (x - circle_size, y - circle_size, x + circle_size, y + circle_size), 
-                fill=100
-            )
-    
-    # Create a copy for input image
-    input_img = target_img.copy()
-    
-    # Create shine mask with scattered shine spots
-    shine = Image.new('L', (size, size), color=0)
-    shine_draw = ImageDraw.Draw(shine)
-    
-    # Add several shine spots
-    for _ in range(5):
-        x = random.randint(0, size)
-        y = random.randint(0, size)
-        radius = random.randint(size//20, size//10)
-        intensity = random.randint(100, 200)
-        
-        shine_draw.ellipse((x-radius, y-radius, x+radius, y+radius), fill=intensity)
-    
-    # Blur the shine
-    shine = shine.filter(ImageFilter.GaussianBlur(radius=size//25))
-    
-    # Compose the input image with shine
-    input_array = np.array(input_img)
-    shine_array = np.array(shine)
-    
-    input_array = np.clip(input_array + shine_array, 0, 255).astype(np.uint8)
-    input_img = Image.fromarray(input_array)
-    
-    return input_img, target_img
+    return _generate_one('pattern', size)
 
-def remove_shine_from_image(image, mask, method='inpainting'):
+def remove_shine_from_image(image, mask, method='inpainting', scale_space=None, executor=None,
+                            levels=None, time_budget=None):
     """
     Remove shine from an image using the provided mask
     
     Args:
         image: PIL Image with shine
         mask: PIL Image mask where white (255) indicates shine
-        method: Removal method ('inpainting', 'blend', 'filter')
+        method: Removal method ('inpainting', 'blend', 'pyramid', 'filter')
+        scale_space: Optional ScaleSpace of the grayscale image, shared with
+            other stages that blur it; blurs it already holds are reused
+        executor: Optional concurrent.futures executor for the masked regions
+        levels: Pyramid levels of the 'pyramid' method (None for automatic)
+        time_budget: Optional maximum number of seconds the 'pyramid'
+            method spends relaxing its fill
         
     Returns:
         PIL Image with shine removed
@@ -316,72 +301,73 @@ def remove_shine_from_image(image, mask, method='inpainting'):
     img_array = np.array(image)
     mask_array = np.array(mask)
     
-    # Normalize mask to range 0-1
-    if mask_array.max() > 1:
-        mask_array = mask_array / 255.0
-    
     # Method 1: Simple inpainting (replace shine with local average)
-    if method == 'inpainting':
-        # Convert to grayscale if needed
-        if len(img_array.shape) > 2:
-            gray_img = np.mean(img_array, axis=2).astype(np.uint8)
-        else:
-            gray_img = img_array.copy()
-        
-        # Blur the image to get local averages
-        from scipy import ndimage
-        blurred = ndimage.gaussian_filter(gray_img, sigma=3)
-        
-        # Create result by combining original and blurred based on mask
-        result = gray_img * (1 - mask_array) + blurred * mask_array
-        
     # Method 2: Content-aware fill simulation
-    elif method == 'blend':
+    # Method 4: Coarse to fine harmonic fill on an image pyramid
+    if method in ('inpainting', 'blend', 'pyramid'):
         # Convert to grayscale if needed
         if len(img_array.shape) > 2:
             gray_img = np.mean(img_array, axis=2).astype(np.uint8)
         else:
-            gray_img = img_array.copy()
-        
-        # Create horizontally and vertically blurred versions
-        from scipy import ndimage
-        h_blurred = ndimage.gaussian_filter1d(gray_img, sigma=5, axis=1)
-        v_blurred = ndimage.gaussian_filter1d(gray_img, sigma=5, axis=0)
-        
-        # Combine them for a direction-aware blur
-        blurred = (h_blurred + v_blurred) / 2
+            gray_img = img_array.astype(np.uint8)
         
-        # Create result by combining original and blurred based on mask
-        result = gray_img * (1 - mask_array) + blurred * mask_array
-        
-    # Method 3: Filter-based approach
-    else:
-        # Convert image to PIL for filtering
-        if len(img_array.shape) > 2:
-            pil_img = Image.fromarray(img_array)
-            pil_img = pil_img.convert('L')  # Convert to grayscale
+        # Blending weights in 0-255, a 0/1 mask counting as fully masked
+        if mask_array.max() > 1:
+            weights = np.clip(mask_array, 0, 255).astype(np.uint8)
         else:
-            pil_img = Image.fromarray(img_array)
-        
-        # Apply various filters
-        blurred = pil_img.filter(ImageFilter.GaussianBlur(radius=2))
-        sharpened = pil_img.filter(ImageFilter.SHARPEN)
+            weights = np.rint(mask_array * 255.0).astype(np.uint8)
         
-        # Convert filtered images back to numpy
-        blurred_array = np.array(blurred)
-        sharpened_array = np.array(sharpened)
+        if method == 'inpainting':
+            # Blur the image to get local averages
+            pad = blur_radius(3)
+            replace = lambda box: blurred_box(gray_img, box, 3, scale_space)
+        elif method == 'blend':
+            # Combine horizontal and vertical blurs for a direction-aware blur
+            pad = blur_radius(5)
+            replace = lambda box: (blurred_box(gray_img, box, (0, 5), scale_space) +
+                                   blurred_box(gray_img, box, (5, 0), scale_space)) / 2
+        else:
+            # Fill every masked pixel of a box from the unmasked ones around it
+            pad = _PYRAMID_CONTEXT
+            deadline = None if time_budget is None else time.perf_counter() + time_budget
+            replace = lambda box: pyramid_inpaint(gray_img[box], weights[box] > 0, levels=levels, deadline=deadline)
         
-        # Adjust contrast in shine areas
-        contrast = ImageEnhance.Contrast(pil_img)
-        contrast_img = contrast.enhance(0.8)  # Reduce contrast
-        contrast_array = np.array(contrast_img)
+        # Only padded boxes around the masked regions are processed and blended
+        rounding = 'nearest' if method == 'pyramid' else 'truncate'
+        result = replace_regions(gray_img, weights, pad, replace, rounding=rounding, executor=executor)
+        return Image.fromarray(result)
         
-        # Create result by combining filtered images based on mask
-        result = (
-            contrast_array * mask_array +
-            sharpened_array * (1 - mask_array) * 0.5 +
-            blurred_array * (1 - mask_array) * 0.5
-        )
+    # Method 3: Filter-based approach, blending the whole frame
+    # Normalize mask to range 0-1
+    if mask_array.max() > 1:
+        mask_array = mask_array / 255.0
+    
+    # Convert image to PIL for filtering
+    if len(img_array.shape) > 2:
+        pil_img = Image.fromarray(img_array)
+        pil_img = pil_img.convert('L')  # Convert to grayscale
+    else:
+        pil_img = Image.fromarray(img_array)
+    
+    # Apply various filters
+    blurred = pil_img.filter(ImageFilter.GaussianBlur(radius=2))
+    sharpened = pil_img.filter(ImageFilter.SHARPEN)
+    
+    # Convert filtered images back to numpy
+    blurred_array = np.array(blurred)
+    sharpened_array = np.array(sharpened)
+    
+    # Adjust contrast in shine areas
+    contrast = ImageEnhance.Contrast(pil_img)
+    contrast_img = contrast.enhance(0.8)  # Reduce contrast
+    contrast_array = np.array(contrast_img)
+    
+    # Create result by combining filtered images based on mask
+    result = (
+        contrast_array * mask_array +
+        sharpened_array * (1 - mask_array) * 0.5 +
+        blurred_array * (1 - mask_array) * 0.5
+    )
     
     # Convert result back to uint8
     result = np.clip(result, 0, 255).astype(np.uint8)
@@ -399,14 +385,11 @@ def analyze_shine(image):
     Returns:
         PIL Image mask where white (255) indicates probable shine
     """
-    # Convert to grayscale and numpy array
-    if image.mode != 'L':
-        image = image.convert('L')
-    
-    img_array = np.array(image)
+    # Shine lives in the luminance, color is not needed
+    img_array = np.array(luminance(image))
     
-    # Apply a threshold to find bright areas
-    threshold = np.percentile(img_array, 90)  # Adjust percentile as needed
+    # Apply a threshold to find bright areas, read off the histogram
+    threshold = percentile(histogram(img_array), 90)  # Adjust percentile as needed
     
     # Create initial mask of bright pixels
     bright_mask = (img_array > threshold).astype(np.uint8) * 255
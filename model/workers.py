@@ -0,0 +1,300 @@
+import io
+import os
+import queue
+import threading
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+
+# Bytes of shared memory each worker starts with (in and out buffers of a 1024×1024 image)
+DEFAULT_SLOT_BYTES = 2 * 1024 * 1024
+
+class WorkerTimeout(Exception):
+    """Raised when a job does not finish within the pool's timeout"""
+
+class WorkerError(Exception):
+    """Raised when processing fails inside a worker"""
+
+def _run_job(buf, source, pipeline):
+    """
+    Run one job on the input at the start of a shared memory buffer
+
+    Args:
+        buf: Shared memory buffer
+        source: ('array', shape) for raw uint8 pixels, or
+            ('encoded', nbytes, size, color) for encoded image bytes that are
+            decoded and resized to size here
+        pipeline: Pipeline to run
+
+    Returns:
+        uint8 result array
+    """
+    if source[0] == 'array':
+        img_array = np.ndarray(source[1], dtype=np.uint8, buffer=buf)
+        try:
+            return pipeline.run(img_array)
+        finally:
+            del img_array
+
+    from model.utils import open_image, process_for_model
+
+    _, nbytes, size, color = source
+    img = open_image(io.BytesIO(bytes(buf[:nbytes])), max_pixels=None)
+    return np.asarray(process_for_model(img, pipeline.run, size, color))
+
+def _worker_main(conn, preload, cache_size):
+    """
+    Entry point of a worker process
+
+    Receives (segment_name, source, model_type, model_config) jobs over a
+    pipe, see _run_job for source. The input is read from the start of the
+    shared memory segment and the result written right after it, so pixels
+    never go through pickle; the pipe only carries the result's shape.
+    """
+    from model.pipeline import PipelineCache
+
+    pipeline_cache = PipelineCache(max_size=cache_size)
+
+    # Start warm: build and run every preloaded pipeline once
+    warmup = np.full((64, 64), 128, dtype=np.uint8)
+    for model_type in preload:
+        pipeline_cache.get(model_type).run(warmup)
+    conn.send(('ready', os.getpid()))
+
+    segment = None
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        segment_name, source, model_type, model_config = job
+        try:
+            if segment is None or segment.name != segment_name:
+                if segment is not None:
+                    segment.close()
+                segment = shared_memory.SharedMemory(name=segment_name)
+
+            result = _run_job(segment.buf, source, pipeline_cache.get(model_type, model_config))
+            offset = _input_bytes(source)
+            if offset + result.nbytes > segment.size:
+                raise ValueError(f"Result of shape {result.shape} does not fit in shared memory")
+            output = np.ndarray(result.shape, dtype=np.uint8, buffer=segment.buf, offset=offset)
+            output[...] = result
+            del output
+            conn.send(('ok', result.shape))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+    if segment is not None:
+        segment.close()
+
+def _input_bytes(source):
+    """Get the size of a job's input, where its result starts in shared memory"""
+    if source[0] == 'array':
+        return int(np.prod(source[1]))
+    return source[1]
+
+class _Worker:
+    """Parent-side handle of one worker process and its shared memory"""
+    def __init__(self, context, preload, cache_size, slot_bytes):
+        self.segment = shared_memory.SharedMemory(create=True, size=slot_bytes)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, preload, cache_size),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        """Wait for the worker to finish warming up"""
+        if not self.conn.poll(timeout):
+            raise WorkerTimeout('Worker did not start in time')
+        self.conn.recv()
+
+    def ensure_capacity(self, nbytes):
+        """Grow the shared memory segment to hold nbytes"""
+        if self.segment.size < nbytes:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = shared_memory.SharedMemory(create=True, size=nbytes)
+
+    def close(self, kill=False):
+        """Stop the process and release the shared memory"""
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.segment.close()
+        try:
+            self.segment.unlink()
+        except FileNotFoundError:
+            pass
+
+class ProcessPool:
+    """
+    Pool of warm worker processes that run processing pipelines
+
+    Every worker owns a shared memory segment that images are copied into
+    and results read back from, and a pipe that only carries the job
+    description. A worker that misses the timeout is killed and replaced,
+    so one hung job never takes a slot out of the pool for good.
+    """
+    def __init__(self, workers=None, timeout=30.0, preload=('dense', 'conv', 'hybrid', 'custom'),
+                 cache_size=64, slot_bytes=DEFAULT_SLOT_BYTES, start_method='spawn'):
+        """
+        Start the workers
+
+        Args:
+            workers: Number of worker processes (defaults to the CPU count)
+            timeout: Seconds a job may take before its worker is replaced
+            preload: Model types every worker builds and runs once at start
+            cache_size: Size of each worker's pipeline cache
+            slot_bytes: Initial shared memory size of each worker
+            start_method: multiprocessing start method
+        """
+        self.size = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._preload = tuple(preload)
+        self._cache_size = cache_size
+        self._slot_bytes = slot_bytes
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.replaced = 0
+
+        workers = [self._start_worker() for _ in range(self.size)]
+        for worker in workers:
+            worker.wait_ready(max(timeout, 60.0))
+            self._idle.put(worker)
+
+    def _start_worker(self):
+        """Start a worker process and track it"""
+        worker = _Worker(self._context, self._preload, self._cache_size, self._slot_bytes)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker):
+        """Kill a worker and put a fresh one in the pool"""
+        with self._lock:
+            self._workers.remove(worker)
+            self.replaced += 1
+        worker.close(kill=True)
+        if not self._closed:
+            replacement = self._start_worker()
+            # The replacement warms up in the background of its first job
+            self._idle.put(replacement)
+
+    def run(self, img_array, model_type, model_config=None):
+        """
+        Process an image in a worker
+
+        Args:
+            img_array: 2-D uint8 numpy array
+            model_type: Type of model (dense, conv, hybrid, custom)
+            model_config: Optional custom model configuration
+
+        Returns:
+            Processed uint8 numpy array of the same shape
+        """
+        img_array = np.ascontiguousarray(img_array, dtype=np.uint8)
+        if img_array.ndim != 2:
+            raise ValueError(f"Expected a 2-D image, got shape {img_array.shape}")
+        return self._submit(img_array.reshape(-1), ('array', img_array.shape), img_array.size,
+                            model_type, model_config)
+
+    def run_encoded(self, data, model_type, model_config=None, size=(64, 64), color=False):
+        """
+        Decode, resize and process an encoded image in a worker
+
+        Only the encoded bytes are copied to the worker, and decoding and
+        resizing run there instead of on the calling thread.
+
+        Args:
+            data: Encoded image bytes
+            model_type: Type of model (dense, conv, hybrid, custom)
+            model_config: Optional custom model configuration
+            size: (width, height) the image is processed at
+            color: Keep color by processing only the luminance
+
+        Returns:
+            Processed uint8 numpy array, H×W or H×W×3 (RGB) with color
+        """
+        width, height = size
+        return self._submit(np.frombuffer(data, dtype=np.uint8), ('encoded', len(data), (width, height), color),
+                            width * height * (3 if color else 1), model_type, model_config)
+
+    def _submit(self, data, source, result_bytes, model_type, model_config):
+        """
+        Copy a job's input to an idle worker, run it and read back the result
+
+        Args:
+            data: Flat uint8 array of input bytes
+            source: Description of the input, see _run_job
+            result_bytes: Size of the largest result
+            model_type: Type of model
+            model_config: Optional custom model configuration
+
+        Returns:
+            uint8 result array
+        """
+        if self._closed:
+            raise RuntimeError('Process pool is closed')
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise WorkerTimeout('No worker became available in time') from None
+
+        try:
+            try:
+                worker.ensure_capacity(data.size + result_bytes)
+                np.ndarray(data.shape, dtype=np.uint8, buffer=worker.segment.buf)[...] = data
+                worker.conn.send((worker.segment.name, source, model_type, model_config))
+
+                # A fresh replacement first reports that it is ready
+                while True:
+                    if not worker.conn.poll(self.timeout):
+                        raise WorkerTimeout(f"Processing took longer than {self.timeout} seconds")
+                    status, message = worker.conn.recv()
+                    if status != 'ready':
+                        break
+            except (WorkerTimeout, EOFError, OSError) as e:
+                # The worker hung or died: replace it
+                dead, worker = worker, None
+                self._replace(dead)
+                if isinstance(e, WorkerTimeout):
+                    raise
+                raise WorkerError('Worker process died') from e
+
+            if status == 'error':
+                raise WorkerError(message)
+            return np.ndarray(message, dtype=np.uint8, buffer=worker.segment.buf, offset=data.size).copy()
+        finally:
+            # Whatever went wrong, a live worker goes back to the pool
+            if worker is not None:
+                self._idle.put(worker)
+
+    def close(self):
+        """Stop every worker"""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
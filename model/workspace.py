@@ -0,0 +1,100 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+
+# Scratch memory each thread may keep between images
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+class Workspace:
+    """
+    Arena of reusable scratch buffers
+
+    Processing stages ask for a buffer by name and shape instead of
+    allocating full-size temporaries, and write into it with out=. A
+    buffer is allocated once per (name, shape, dtype) and handed out again
+    for every later image of that size; the least recently used buffers
+    are freed beyond max_bytes. Buffers are only valid until the next
+    request for the same name, so a workspace must not be shared between
+    threads (see get_workspace).
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize the workspace
+
+        Args:
+            max_bytes: Maximum total size of the buffers kept
+        """
+        self.max_bytes = max_bytes
+        self.allocations = 0
+        self._buffers = OrderedDict()
+        self._bytes = 0
+
+    def get(self, name, shape, dtype=np.float32):
+        """
+        Get a scratch buffer, allocating it on first use
+
+        Args:
+            name: Name of the buffer, distinct for buffers used at the same time
+            shape: Shape of the buffer
+            dtype: Data type of the buffer
+
+        Returns:
+            Uninitialized numpy array
+        """
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            self._buffers.move_to_end(key)
+            return buffer
+
+        buffer = np.empty(shape, dtype=dtype)
+        self.allocations += 1
+        self._buffers[key] = buffer
+        self._bytes += buffer.nbytes
+        # Keep the buffer just handed out even if it alone exceeds the cap
+        while self._bytes > self.max_bytes and len(self._buffers) > 1:
+            _, evicted = self._buffers.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return buffer
+
+    def load(self, img_array, name='image'):
+        """Copy an image into a float32 buffer"""
+        buffer = self.get(name, img_array.shape)
+        np.copyto(buffer, img_array, casting='unsafe')
+        return buffer
+
+    @staticmethod
+    def to_uint8(array):
+        """
+        Clip a float buffer to 0-255 in place and convert it to a new uint8 array
+
+        Values are truncated like astype(np.uint8). The result never
+        aliases the workspace, so it can be returned to callers.
+        """
+        np.clip(array, 0, 255, out=array)
+        output = np.empty(array.shape, dtype=np.uint8)
+        np.copyto(output, array, casting='unsafe')
+        return output
+
+    def clear(self):
+        """Free every buffer"""
+        self._buffers.clear()
+        self._bytes = 0
+
+    def stats(self):
+        """Get workspace counters"""
+        return {
+            'buffers': len(self._buffers),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'allocations': self.allocations
+        }
+
+_local = threading.local()
+
+def get_workspace():
+    """Get the calling thread's workspace, creating it on first use"""
+    workspace = getattr(_local, 'workspace', None)
+    if workspace is None:
+        workspace = _local.workspace = Workspace()
+    return workspace
@@ -1,7 +1,10 @@
 import os
 import sys
+import shutil
+import tempfile
 import unittest
 import json
+import base64
 from io import BytesIO
 from PIL import Image
 import numpy as np
@@ -9,12 +12,25 @@ import numpy as np
 # Add the parent directory to sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
+import app as app_module
 from app import app
 
 class TestApp(unittest.TestCase):
     def setUp(self):
         app.config['TESTING'] = True
         self.client = app.test_client()
+
+        # Datasets, model configs and the catalog go to a scratch folder
+        self.tmp_dir = tempfile.mkdtemp()
+        self.saved_config = {key: app.config[key] for key in ('DATASET_FOLDER', 'MODEL_CONFIG_FOLDER', 'CATALOG_PATH')}
+        self.saved_catalog = app_module.catalog
+        app.config['DATASET_FOLDER'] = os.path.join(self.tmp_dir, 'datasets')
+        app.config['MODEL_CONFIG_FOLDER'] = os.path.join(self.tmp_dir, 'model_configs')
+        app.config['CATALOG_PATH'] = os.path.join(self.tmp_dir, 'catalog.db')
+        os.makedirs(app.config['DATASET_FOLDER'])
+        os.makedirs(app.config['MODEL_CONFIG_FOLDER'])
+        app_module._open_stores.clear()
+        app_module.init_catalog()
         
         # Create a test image in memory
         img = Image.new('L', (64, 64), color=128)  # Gray image
@@ -22,6 +38,13 @@ class TestApp(unittest.TestCase):
         img.save(self.test_img_io, 'PNG')
         self.test_img_io.seek(0)
 
+    def tearDown(self):
+        app.config.update(self.saved_config)
+        app_module.catalog = self.saved_catalog
+        app_module._open_stores.clear()
+        # Background training jobs may still be writing
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
     def test_index_route(self):
         """Test the index route returns 200 status"""
         response = self.client.get('/')
@@ -44,6 +67,116 @@ class TestApp(unittest.TestCase):
         self.assertIn('processed_image', response_data)
         self.assertTrue(response_data['processed_image'].startswith('data:image/png;base64,'))
     
+    def test_process_image_binary(self):
+        """Test the process endpoint returns raw image bytes when asked to"""
+        for accept, mimetype, image_format in (('image/png', 'image/png', 'PNG'),
+                                               ('image/webp', 'image/webp', 'WEBP')):
+            response = self.client.post(
+                '/process?compress_level=1',
+                data={'image': (BytesIO(self.test_img_io.getvalue()), 'test_image.png'), 'model_type': 'dense'},
+                content_type='multipart/form-data',
+                headers={'Accept': accept}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, mimetype)
+            self.assertIn('Accept', response.headers['Vary'])
+            processed = Image.open(BytesIO(response.data))
+            self.assertEqual(processed.format, image_format)
+            self.assertEqual(processed.size, (64, 64))
+
+        # Formats that cannot be produced are refused
+        response = self.client.post(
+            '/process',
+            data={'image': (self.test_img_io, 'test_image.png')},
+            content_type='multipart/form-data',
+            headers={'Accept': 'image/gif'}
+        )
+        self.assertEqual(response.status_code, 406)
+
+    def test_process_image_etag(self):
+        """Test repeated uploads are served from the result cache with ETags"""
+        from app import result_cache
+
+        img = Image.new('L', (64, 64))
+        img.putpixel((10, 10), 255)
+        buffer = BytesIO()
+        img.save(buffer, 'PNG')
+
+        def post(headers):
+            return self.client.post(
+                '/process',
+                data={'image': (BytesIO(buffer.getvalue()), 'test_image.png'), 'model_type': 'conv'},
+                content_type='multipart/form-data',
+                headers=headers
+            )
+
+        response = post({'Accept': 'image/png'})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        # A repeat is a cache hit with the same bytes and ETag
+        hits = result_cache.stats()['hits']
+        repeat = post({'Accept': 'image/png'})
+        self.assertEqual(repeat.data, response.data)
+        self.assertEqual(repeat.headers['ETag'], etag)
+        self.assertEqual(result_cache.stats()['hits'], hits + 1)
+
+        # A client that has the result gets a 304 without a body
+        response = post({'Accept': 'image/png', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # Other representations have other ETags
+        response = post({'Accept': 'image/webp', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_process_image_tiled(self):
+        """Test full resolution processing in tiles"""
+        img = Image.new('RGB', (300, 200), color=(200, 120, 40))
+        buffer = BytesIO()
+        img.save(buffer, 'PNG')
+        buffer.seek(0)
+
+        response = self.client.post(
+            '/process',
+            data={'image': (buffer, 'test_image.png'), 'model_type': 'conv', 'mode': 'tiled'},
+            content_type='multipart/form-data',
+            headers={'Accept': 'image/png'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (300, 200))
+
+        # Unknown modes are rejected
+        response = self.client.post(
+            '/process',
+            data={'image': (self.test_img_io, 'test_image.png'), 'mode': 'huge'},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_process_image_color(self):
+        """Test color output from processing the luminance only"""
+        for mode, size in (('resize', (64, 64)), ('tiled', (300, 200))):
+            buffer = BytesIO()
+            Image.new('RGB', (300, 200), color=(200, 120, 40)).save(buffer, 'PNG')
+            buffer.seek(0)
+            response = self.client.post(
+                '/process',
+                data={'image': (buffer, 'test_image.png'), 'model_type': 'dense', 'mode': mode, 'color': '1'},
+                content_type='multipart/form-data',
+                headers={'Accept': 'image/png'}
+            )
+            self.assertEqual(response.status_code, 200)
+            processed = Image.open(BytesIO(response.data))
+            self.assertEqual(processed.mode, 'RGB')
+            self.assertEqual(processed.size, size)
+
+            # Still orange: red above green above blue
+            r, g, b = processed.getpixel((10, 10))
+            self.assertGreater(r, g)
+            self.assertGreater(g, b)
+
     def test_process_image_no_file(self):
         """Test process endpoint with no file returns error"""
         data = {'model_type': 'dense'}
@@ -76,6 +209,44 @@ class TestApp(unittest.TestCase):
         self.assertIn('status', response_data)
         self.assertIn('model_id', response_data)
         
+    def test_training_job(self):
+        """Test training in the background with polling, events and cancellation"""
+        data = {
+            'model_type': 'dense',
+            'epochs': 3,
+            'batch_size': 8,
+            'learning_rate': 0.001
+        }
+        response = self.client.post('/train/jobs', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = json.loads(response.data)
+        self.assertEqual(response.headers['Location'], job['status_url'])
+
+        # The event stream ends with the finished job
+        response = self.client.get(job['events_url'])
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = [chunk for chunk in response.get_data(as_text=True).split('\n\n') if chunk.startswith('id:')]
+        self.assertIn('event: done', events[-1])
+
+        response = self.client.get(job['status_url'])
+        status = json.loads(response.data)
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['epoch'], 3)
+        self.assertEqual(len(status['history']['loss']), 3)
+        self.assertEqual(status['result']['epochs_completed'], 3)
+        # The model is named after its job, so jobs started together never collide
+        self.assertEqual(status['result']['model_id'], f"model_dense_{job['job_id']}")
+
+        # Finished jobs cannot be cancelled
+        response = self.client.delete(job['status_url'])
+        self.assertEqual(response.status_code, 409)
+
+        # Unknown jobs and datasets are reported
+        self.assertEqual(self.client.get('/train/jobs/unknown').status_code, 404)
+        data['dataset_id'] = 'no_such_dataset'
+        response = self.client.post('/train/jobs', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
     def test_generate_synthetic_dataset(self):
         """Test generating a synthetic dataset"""
         response = self.client.post('/generate_synthetic_dataset')
@@ -84,6 +255,270 @@ class TestApp(unittest.TestCase):
         self.assertIn('status', response_data)
         self.assertIn('id', response_data)
         self.assertIn('item_count', response_data)
+
+        # The generated dataset can be previewed a page at a time
+        response = self.client.get(f"/datasets/{response_data['id']}?offset=1&limit=2&thumb_size=32")
+        self.assertEqual(response.status_code, 200)
+        dataset = json.loads(response.data)
+        self.assertEqual(dataset['item_count'], response_data['item_count'])
+        self.assertEqual([item['position'] for item in dataset['preview']], [1, 2])
+
+        # Previews are real thumbnails
+        import base64
+        thumbnail = dataset['preview'][0]['original']
+        self.assertTrue(thumbnail.startswith('data:image/png;base64,'))
+        thumb_img = Image.open(BytesIO(base64.b64decode(thumbnail.split(',')[1])))
+        self.assertLessEqual(max(thumb_img.size), 32)
+
+        # Count, size and seed can be chosen, and are validated
+        options = {'count': 12, 'size': 32, 'seed': 4}
+        response = self.client.post('/generate_synthetic_dataset', data=json.dumps(options),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['item_count'], 12)
+        for options in ({'count': 0}, {'size': 4}, {'seed': 'abc'}):
+            response = self.client.post('/generate_synthetic_dataset', data=json.dumps(options),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+        # Count and size together are limited, before anything is written
+        from app import app as flask_app
+        options = {'count': flask_app.config['SYNTHETIC_MAX_COUNT'], 'size': 1024}
+        response = self.client.post('/generate_synthetic_dataset', data=json.dumps(options),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_legacy_json_dataset(self):
+        """Test a legacy JSON dataset is previewed through a converted store"""
+        import base64
+        from app import app as flask_app
+        data_url = 'data:image/png;base64,' + base64.b64encode(self.test_img_io.getvalue()).decode('utf-8')
+        path = os.path.join(flask_app.config['DATASET_FOLDER'], 'test_legacy_dataset.json')
+        with open(path, 'w') as f:
+            json.dump([{'id': i, 'original': data_url, 'clean': data_url} for i in range(3)], f)
+
+        response = self.client.get('/datasets/test_legacy_dataset?limit=1')
+        self.assertEqual(response.status_code, 200)
+        dataset = json.loads(response.data)
+        self.assertEqual(dataset['item_count'], 3)
+        self.assertEqual(len(dataset['preview']), 1)
+
+        response = self.client.get('/datasets/test_missing_dataset')
+        self.assertEqual(response.status_code, 404)
+
+    def test_save_dataset(self):
+        """Test saving a dataset of base64 image pairs"""
+        import base64
+        data_url = 'data:image/png;base64,' + base64.b64encode(self.test_img_io.getvalue()).decode('utf-8')
+        items = [
+            {'id': 'a', 'original': data_url, 'clean': data_url},
+            {'id': 'b', 'original': 'data:image/png;base64,abc...', 'clean': 'data:image/png;base64,abc...'},
+            {'original': data_url, 'clean': data_url}
+        ]
+        response = self.client.post(
+            '/datasets?id=test_saved_dataset',
+            data=json.dumps(items),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual(response_data['item_count'], 2)
+        self.assertEqual(response_data['skipped'], 1)
+
+        response = self.client.get('/datasets')
+        listed = {d['id']: d for d in json.loads(response.data)}
+        self.assertEqual(listed['test_saved_dataset']['item_count'], 2)
+
+        # Items without an id are stored under their position in the upload
+        response = self.client.get('/datasets/test_saved_dataset')
+        self.assertEqual([item['id'] for item in json.loads(response.data)['preview']], ['a', '2'])
+
+    def test_save_dataset_invalid_id(self):
+        """Test dataset ids that could leave the dataset folder are refused"""
+        from app import app as flask_app
+        outside = os.path.join(os.path.dirname(os.path.abspath(flask_app.config['DATASET_FOLDER'])), 'outside')
+        for dataset_id in ('../outside', '..', 'a/b', 'a.b', ' '):
+            response = self.client.post(f"/datasets?id={dataset_id}", data='[]',
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post(f"/datasets?id={dataset_id}", data='',
+                                        content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(os.path.exists(outside))
+
+        response = self.client.get('/datasets/..')
+        self.assertEqual(response.status_code, 404)
+
+    def test_save_dataset_ndjson_stream(self):
+        """Test streaming NDJSON dataset upload and append"""
+        import base64
+        data_url = 'data:image/png;base64,' + base64.b64encode(self.test_img_io.getvalue()).decode('utf-8')
+        item = json.dumps({'original': data_url, 'clean': data_url})
+        body = '\n'.join([item, '{not json', item, ''])
+        response = self.client.post(
+            '/datasets?id=test_stream_dataset',
+            data=body,
+            content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual(response_data['appended'], 2)
+        self.assertEqual(response_data['failed'], 1)
+        self.assertEqual(response_data['errors'][0]['item'], 2)
+
+        # A second upload appends to the same dataset
+        response = self.client.post(
+            '/datasets?id=test_stream_dataset&append=1',
+            data=item,
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(json.loads(response.data)['item_count'], 3)
+
+        # Pairs of another size than the dataset's fail instead of being resized
+        small = BytesIO()
+        Image.new('L', (32, 32)).save(small, 'PNG')
+        small_url = 'data:image/png;base64,' + base64.b64encode(small.getvalue()).decode('utf-8')
+        response = self.client.post(
+            '/datasets?id=test_stream_dataset&append=1',
+            data='\n'.join([json.dumps({'original': small_url, 'clean': small_url}),
+                            json.dumps({'original': data_url, 'clean': small_url}), item]),
+            content_type='application/x-ndjson'
+        )
+        response_data = json.loads(response.data)
+        self.assertEqual((response_data['appended'], response_data['failed'], response_data['item_count']), (1, 2, 4))
+        self.assertIn('64x64', response_data['errors'][0]['error'])
+
+    def test_concurrent_dataset_writes(self):
+        """Test concurrent appends and uploads neither lose items nor share scratch space"""
+        import threading
+        data_url = 'data:image/png;base64,' + base64.b64encode(self.test_img_io.getvalue()).decode('utf-8')
+        line = json.dumps({'original': data_url, 'clean': data_url}) + '\n'
+        response = self.client.post('/datasets?id=test_concurrent', data=line, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        statuses = []
+        def upload(url):
+            with app.test_client() as client:
+                statuses.append(client.post(url, data=line * 3, content_type='application/x-ndjson').status_code)
+        threads = [threading.Thread(target=upload, args=('/datasets?id=test_concurrent&append=1',)) for _ in range(4)]
+        threads += [threading.Thread(target=upload, args=('/datasets',)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [200] * 8)
+
+        # Every append landed, every upload got its own id, and no scratch directory is left
+        listed = {d['id']: d for d in json.loads(self.client.get('/datasets').data)}
+        self.assertEqual(listed['test_concurrent']['item_count'], 13)
+        self.assertEqual(len(listed), 5)
+        self.assertEqual([entry for entry in os.listdir(app.config['DATASET_FOLDER']) if entry.startswith('.')], [])
+
+    def test_save_dataset_ndjson_stream_limit(self):
+        """Test streamed datasets follow their own size limit instead of MAX_CONTENT_LENGTH"""
+        from app import app as flask_app
+        data_url = 'data:image/png;base64,' + base64.b64encode(self.test_img_io.getvalue()).decode('utf-8')
+        body = (json.dumps({'original': data_url, 'clean': data_url}) + '\n') * 4
+        limits = (flask_app.config['MAX_CONTENT_LENGTH'], flask_app.config['MAX_DATASET_STREAM_LENGTH'])
+        flask_app.config['MAX_CONTENT_LENGTH'] = len(body) // 2
+        try:
+            flask_app.config['MAX_DATASET_STREAM_LENGTH'] = len(body)
+            response = self.client.post('/datasets?id=test_stream_limit', data=body,
+                                        content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data)['item_count'], 4)
+
+            flask_app.config['MAX_DATASET_STREAM_LENGTH'] = len(body) - 1
+            response = self.client.post('/datasets?id=test_stream_limit', data=body,
+                                        content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 413)
+        finally:
+            flask_app.config['MAX_CONTENT_LENGTH'], flask_app.config['MAX_DATASET_STREAM_LENGTH'] = limits
+
+    def test_process_marked_area(self):
+        """Test marked area removal with binary image and mask uploads"""
+        y, x = np.mgrid[:48, :64]
+        img_array = (60 + x + y).astype(np.uint8)
+        img_array[10:20, 20:30] = 250  # Marked glare
+        mask_array = np.zeros((48, 64), dtype=np.uint8)
+        mask_array[10:20, 20:30] = 255
+
+        def png(array):
+            buffer = BytesIO()
+            Image.fromarray(array).save(buffer, 'PNG')
+            buffer.seek(0)
+            return buffer
+
+        # Binary parts in, raw PNG out
+        response = self.client.post(
+            '/process_marked_area',
+            data={'image': (png(img_array), 'image.png'), 'mask': (png(mask_array), 'mask.png')},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        clean = np.array(Image.open(BytesIO(response.data)))
+        unmarked = mask_array == 0
+        np.testing.assert_array_equal(clean[unmarked], img_array[unmarked])
+        self.assertLess(np.abs(clean.astype(int) - (60 + x + y))[~unmarked].max(), 3)
+
+        # A run-length mask gives the same result
+        flat = mask_array.ravel()
+        edges = np.concatenate([[0], np.flatnonzero(np.diff(flat)) + 1, [flat.size]])
+        runs = ([0] if flat[0] else []) + np.diff(edges).tolist()
+        response = self.client.post(
+            '/process_marked_area',
+            data={'image': (png(img_array), 'image.png'), 'mask_rle': ','.join(map(str, runs))},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(response.status_code, 200)
+        np.testing.assert_array_equal(np.array(Image.open(BytesIO(response.data))), clean)
+
+        # JSON is still accepted
+        response = self.client.post('/process_marked_area', json={
+            'image': 'data:image/png;base64,' + base64.b64encode(png(img_array).getvalue()).decode(),
+            'mask': runs,
+            'method': 'inpainting'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['clean_image'].startswith('data:image/png;base64,'))
+
+        # JSON uploads are held to the same pixel limit
+        from app import app as flask_app
+        max_pixels = flask_app.config['MAX_IMAGE_PIXELS']
+        flask_app.config['MAX_IMAGE_PIXELS'] = 48 * 64 - 1
+        try:
+            response = self.client.post('/process_marked_area', json={
+                'image': 'data:image/png;base64,' + base64.b64encode(png(img_array).getvalue()).decode(),
+                'mask': runs
+            })
+            self.assertEqual(response.status_code, 413)
+        finally:
+            flask_app.config['MAX_IMAGE_PIXELS'] = max_pixels
+
+        # Bad masks are refused
+        for data in ({'image': (png(img_array), 'image.png')},
+                     {'image': (png(img_array), 'image.png'), 'mask_rle': '5,10'},
+                     {'image': (png(img_array), 'image.png'), 'mask': (png(mask_array[:10]), 'mask.png')},
+                     {'image': (png(img_array), 'image.png'), 'mask_rle': ','.join(map(str, runs)),
+                      'method': 'magic'}):
+            response = self.client.post('/process_marked_area', data=data, content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 400)
+
+    def test_list_paging(self):
+        """Test list endpoints support paging and field projection"""
+        response = self.client.get('/datasets?limit=1&fields=id,item_count')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Total-Count', response.headers)
+        records = json.loads(response.data)
+        self.assertLessEqual(len(records), 1)
+        for record in records:
+            self.assertEqual(set(record), {'id', 'item_count'})
+
+        response = self.client.get('/models?fields=secret')
+        self.assertEqual(response.status_code, 400)
         
 if __name__ == '__main__':
     unittest.main()
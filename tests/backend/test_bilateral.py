@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.bilateral import bilateral_filter
+from model.model import UnShineyModel
+
+def reference_bilateral(img, sigma_color, sigma_spatial, radius=3):
+    """Brute-force bilateral filter over a (2 * radius + 1)² window"""
+    img = img.astype(np.float64)
+    height, width = img.shape
+    padded = np.pad(img, radius, mode='symmetric')
+    num = np.zeros_like(img)
+    den = np.zeros_like(img)
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            neighbour = padded[radius + dy:radius + dy + height, radius + dx:radius + dx + width]
+            weight = (np.exp(-(dy * dy + dx * dx) / (2.0 * sigma_spatial ** 2)) *
+                      np.exp(-(neighbour - img) ** 2 / (2.0 * sigma_color ** 2)))
+            num += weight * neighbour
+            den += weight
+    return num / den
+
+class TestBilateral(unittest.TestCase):
+    def setUp(self):
+        # Noisy blocks with sharp edges between them
+        rng = np.random.RandomState(0)
+        yy, xx = np.mgrid[0:96, 0:80]
+        base = 0.5 + 0.3 * np.sign(np.sin(xx / 9.0)) * np.cos(yy / 13.0)
+        self.img = np.clip(base + rng.normal(0, 0.05, base.shape), 0, 1).astype(np.float32)
+        self.expected = reference_bilateral(self.img, 0.1, 1.0)
+
+    def test_close_to_exact_filter(self):
+        """Test the approximation converges to the brute-force filter as accuracy grows"""
+        errors = []
+        for accuracy in (0.5, 1.0, 2.0):
+            result = bilateral_filter(self.img, 0.1, 1.0, accuracy=accuracy)
+            self.assertEqual(result.shape, self.img.shape)
+            self.assertEqual(result.dtype, np.float32)
+            errors.append(np.abs(result - self.expected).mean())
+        self.assertLess(errors[1], 1.0 / 255)
+        self.assertLess(np.abs(bilateral_filter(self.img, 0.1, 1.0) - self.expected).max(), 8.0 / 255)
+        self.assertLess(errors[2], errors[1])
+        self.assertLess(errors[1], errors[0])
+
+    def test_blocks_and_stacks(self):
+        """Test banding and stacking never change the result"""
+        # Images with different intensity ranges, and a flat one
+        stack = np.stack([self.img, self.img[::-1] * 0.5, 0.2 + self.img[:, ::-1] * 0.3,
+                          np.full_like(self.img, 0.4)])
+        whole = bilateral_filter(stack, 0.1, 1.0)
+        for i in range(len(stack)):
+            alone = bilateral_filter(stack[i], 0.1, 1.0)
+            np.testing.assert_array_equal(whole[i], alone)
+            # Bands of a few rows with their halo give the same pixels
+            banded = bilateral_filter(stack[i], 0.1, 1.0, block_pixels=80 * 7)
+            np.testing.assert_allclose(banded, alone, atol=1e-5)
+        np.testing.assert_array_equal(whole[3], stack[3])
+
+    def test_edge_cases(self):
+        """Test flat and empty input and invalid accuracy"""
+        flat = np.full((4, 10, 10), 0.3, dtype=np.float32)
+        np.testing.assert_array_equal(bilateral_filter(flat), flat)
+        self.assertEqual(bilateral_filter(np.zeros((0, 5, 5))).shape, (0, 5, 5))
+        with self.assertRaises(ValueError):
+            bilateral_filter(self.img, accuracy=0)
+
+    def test_differs_from_skimage_window(self):
+        """Test the spatial weights are centred, which skimage's are not"""
+        from skimage.restoration import denoise_bilateral
+        impulse = np.zeros((15, 15), dtype=np.float32)
+        impulse[7, 7] = 1
+        # A huge sigma_color leaves only the spatial weights
+        fast = bilateral_filter(impulse, sigma_color=1e6, sigma_spatial=1.0, accuracy=0.5)
+        self.assertEqual(np.unravel_index(fast.argmax(), fast.shape), (7, 7))
+        np.testing.assert_allclose(fast, fast.T, atol=1e-6)
+        np.testing.assert_allclose(fast, fast[::-1, ::-1], atol=1e-6)
+
+        skimage_result = denoise_bilateral(impulse, sigma_color=1e6, sigma_spatial=1.0)
+        self.assertNotEqual(np.unravel_index(skimage_result.argmax(), impulse.shape), (7, 7))
+
+    def test_hybrid_model_option(self):
+        """Test the hybrid model switches to the fast filter on request"""
+        img_stack = np.clip(self.img * 255, 0, 255).astype(np.uint8)[None, :64, :64]
+        exact = UnShineyModel('hybrid')._process_stack(img_stack).astype(int)
+        fast_model = UnShineyModel('hybrid', config={'bilateral_method': 'fast', 'bilateral_accuracy': 2})
+        fast = fast_model._process_stack(img_stack).astype(int)
+        self.assertEqual(fast.shape, exact.shape)
+        self.assertLess(np.abs(fast - exact).mean(), 12)
+        with self.assertRaises(ValueError):
+            UnShineyModel('hybrid', config={'bilateral_method': 'grid'})
+
+        # A batch gives the same result as its images one at a time
+        # A dark half moves the bottom of the equalized range of the second image
+        shadowed = img_stack.copy()
+        shadowed[:, :, :32] = 0
+        batch = np.concatenate([img_stack, shadowed])
+        together = fast_model._process_stack(batch)
+        for i in range(len(batch)):
+            np.testing.assert_array_equal(together[i], fast_model._process_stack(batch[i:i + 1])[0])
+
+if __name__ == '__main__':
+    unittest.main()
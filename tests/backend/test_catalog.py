@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.catalog import Catalog
+from model.dataset_store import DatasetWriter
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.tmp_dir, 'catalog.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_paging_and_projection(self):
+        """Test limit/offset paging and field projection"""
+        for i in range(5):
+            self.catalog.upsert_model({
+                'id': f"model_{i}",
+                'name': f"Model {i}",
+                'type': 'dense',
+                'created_at': f"2024-01-0{i + 1}T00:00:00"
+            })
+
+        records, total = self.catalog.list('models', limit=2, offset=1, fields=['id'])
+        self.assertEqual(total, 5)
+        self.assertEqual(records, [{'id': 'model_3'}, {'id': 'model_2'}])
+
+        with self.assertRaises(ValueError):
+            self.catalog.list('models', fields=['id', 'path'])
+
+    def test_adds_mtime_to_old_catalogs(self):
+        """Test a catalog created without mtime columns can still be rebuilt"""
+        import sqlite3
+        from contextlib import closing
+        path = os.path.join(self.tmp_dir, 'old.db')
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute("CREATE TABLE models (id TEXT PRIMARY KEY, name TEXT, type TEXT, description TEXT, created_at TEXT)")
+        catalog = Catalog(path)
+        catalog.upsert_model({'id': 'm', 'name': 'm', 'mtime': 1.0})
+        self.assertEqual(catalog.list('models', fields=['id'])[0], [{'id': 'm'}])
+
+    def test_upsert_replaces(self):
+        """Test writing a record twice keeps one entry"""
+        record = {'id': 'ds', 'name': 'ds', 'item_count': 1, 'format': 'binary', 'created_at': 'x'}
+        self.catalog.upsert_dataset(record)
+        self.catalog.upsert_dataset(dict(record, item_count=7))
+
+        records, total = self.catalog.list('datasets')
+        self.assertEqual(total, 1)
+        self.assertEqual(records[0]['item_count'], 7)
+
+    def test_rebuild_from_disk(self):
+        """Test seeding the catalog from existing files"""
+        model_folder = os.path.join(self.tmp_dir, 'model_configs')
+        dataset_folder = os.path.join(self.tmp_dir, 'datasets')
+        os.makedirs(model_folder)
+        os.makedirs(dataset_folder)
+
+        with open(os.path.join(model_folder, 'model_a.json'), 'w') as f:
+            json.dump({'name': 'A', 'type': 'conv'}, f)
+        with open(os.path.join(dataset_folder, 'legacy.json'), 'w') as f:
+            json.dump([{}, {}, {}], f)
+        with DatasetWriter(os.path.join(dataset_folder, 'store'), shape=(4, 4)) as writer:
+            writer.append(np.zeros((4, 4), np.uint8), np.zeros((4, 4), np.uint8))
+
+        self.catalog.rebuild(model_folder, dataset_folder)
+
+        models, _ = self.catalog.list('models')
+        self.assertEqual(models[0]['type'], 'conv')
+        datasets = {d['id']: d for d in self.catalog.list('datasets')[0]}
+        # Legacy JSON is not parsed, its count is known once it is converted
+        self.assertEqual((datasets['legacy']['format'], datasets['legacy']['item_count']), ('json', None))
+        self.assertEqual((datasets['store']['format'], datasets['store']['item_count']), ('binary', 1))
+
+        # Unchanged files are not read again, changed ones are
+        path = os.path.join(model_folder, 'model_a.json')
+        mtime = os.path.getmtime(path)
+        with open(path, 'w') as f:
+            json.dump({'name': 'A', 'type': 'dense'}, f)
+        os.utime(path, (mtime, mtime))
+        self.catalog.rebuild(model_folder, dataset_folder)
+        self.assertEqual(self.catalog.list('models')[0][0]['type'], 'conv')
+        os.utime(path, (mtime + 10, mtime + 10))
+        self.catalog.rebuild(model_folder, dataset_folder)
+        self.assertEqual(self.catalog.list('models')[0][0]['type'], 'dense')
+
+        # Rebuilding again picks up changes made behind the catalog's back
+        os.remove(os.path.join(model_folder, 'model_a.json'))
+        with DatasetWriter(os.path.join(dataset_folder, 'legacy'), shape=(4, 4)) as writer:
+            writer.append(np.zeros((4, 4), np.uint8), np.zeros((4, 4), np.uint8))
+        shutil.rmtree(os.path.join(dataset_folder, 'store'))
+        self.catalog.rebuild(model_folder, dataset_folder)
+
+        self.assertEqual(self.catalog.list('models'), ([], 0))
+        datasets, total = self.catalog.list('datasets')
+        self.assertEqual(total, 1)
+        self.assertEqual((datasets[0]['id'], datasets[0]['format']), ('legacy', 'binary'))
+
+if __name__ == '__main__':
+    unittest.main()
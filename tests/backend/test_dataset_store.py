@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.dataset_store import DatasetStore, DatasetWriter, convert_json_dataset, is_store
+from model.utils import image_to_base64
+
+class TestDatasetStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.tmp_dir, 'store')
+
+        # Create distinct test pairs
+        rng = np.random.RandomState(0)
+        self.pairs = [
+            (rng.randint(0, 256, size=(16, 24)).astype(np.uint8),
+             rng.randint(0, 256, size=(16, 24)).astype(np.uint8))
+            for _ in range(7)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_and_random_access(self):
+        """Test pairs round-trip across several shards"""
+        with DatasetWriter(self.store_path, shape=(16, 24), shard_size=3) as writer:
+            for i, (original, clean) in enumerate(self.pairs):
+                writer.append(original, clean, item_id=f"item-{i}")
+
+        self.assertTrue(is_store(self.store_path))
+        store = DatasetStore(self.store_path)
+        self.assertEqual(len(store), 7)
+        self.assertEqual(len(store.index['shards']), 3)
+
+        # Random access by id, in any order
+        for i in (6, 0, 4):
+            original, clean = store.get(f"item-{i}")
+            np.testing.assert_array_equal(original, self.pairs[i][0])
+            np.testing.assert_array_equal(clean, self.pairs[i][1])
+
+        with self.assertRaises(KeyError):
+            store.get('missing')
+
+    def test_append_to_existing_store(self):
+        """Test reopening a store appends to it"""
+        with DatasetWriter(self.store_path, shape=(16, 24), shard_size=4) as writer:
+            for original, clean in self.pairs[:5]:
+                writer.append(original, clean)
+        with DatasetWriter(self.store_path) as writer:
+            for original, clean in self.pairs[5:]:
+                writer.append(original, clean)
+
+        store = DatasetStore(self.store_path)
+        self.assertEqual(store.ids, [str(i) for i in range(7)])
+        np.testing.assert_array_equal(store.get(6)[0], self.pairs[6][0])
+
+    def test_append_batch(self):
+        """Test a batch is split across shards and continues after single appends"""
+        originals = np.stack([original for original, _ in self.pairs])
+        cleans = np.stack([clean for _, clean in self.pairs])
+        with DatasetWriter(self.store_path, shape=(16, 24), shard_size=3) as writer:
+            writer.append(originals[0], cleans[0])
+            ids = writer.append_batch(originals[1:], cleans[1:])
+            self.assertEqual(ids, [str(i) for i in range(1, 7)])
+            with self.assertRaises(ValueError):
+                writer.append_batch(originals[:2], cleans[:2], item_ids=['a'])
+            with self.assertRaises(ValueError):
+                writer.append_batch(originals[:, :8], cleans[:, :8])
+
+        store = DatasetStore(self.store_path)
+        self.assertEqual(len(store), 7)
+        self.assertEqual([shard['count'] for shard in store.index['shards']], [3, 3, 1])
+        for i, (original, clean) in enumerate(self.pairs):
+            np.testing.assert_array_equal(store.get_at(i)[0], original)
+            np.testing.assert_array_equal(store.get_at(i)[1], clean)
+
+    def test_append_discards_interrupted_write(self):
+        """Test bytes written after the last index update are dropped on reopen"""
+        with DatasetWriter(self.store_path, shape=(16, 24)) as writer:
+            writer.append(*self.pairs[0])
+
+        # Simulate a writer that died before writing its index
+        with open(os.path.join(self.store_path, 'shard_00000.bin'), 'ab') as f:
+            f.write(b'\xff' * 100)
+
+        with DatasetWriter(self.store_path) as writer:
+            writer.append(*self.pairs[1])
+
+        store = DatasetStore(self.store_path)
+        np.testing.assert_array_equal(store.get_at(1)[0], self.pairs[1][0])
+
+    def test_thumbnail_cache(self):
+        """Test thumbnails are generated once and served from the cache"""
+        with DatasetWriter(self.store_path, shape=(16, 24)) as writer:
+            writer.append(*self.pairs[0])
+
+        store = DatasetStore(self.store_path)
+        png = store.thumbnail(0, 'clean', size=8)
+        thumb_img = Image.open(io.BytesIO(png))
+        self.assertEqual(thumb_img.size, (8, 5))
+
+        cached_path = os.path.join(self.store_path, 'thumbnails', '8', '0_clean.png')
+        self.assertTrue(os.path.exists(cached_path))
+        self.assertEqual(store.thumbnail(0, 'clean', size=8), png)
+
+    def test_rejects_wrong_shape(self):
+        """Test images must match the store's shape"""
+        with DatasetWriter(self.store_path, shape=(16, 24)) as writer:
+            with self.assertRaises(ValueError):
+                writer.append(np.zeros((8, 8), np.uint8), np.zeros((8, 8), np.uint8))
+
+            # PIL images of another size are refused too, unless resizing is asked for
+            small = Image.fromarray(np.zeros((8, 8), np.uint8))
+            right = Image.fromarray(self.pairs[0][0])
+            with self.assertRaises(ValueError):
+                writer.append_images(small, right)
+            with self.assertRaises(ValueError):
+                writer.append_images(right, small)
+            self.assertEqual(len(writer), 0)
+            writer.append_images(small, right, resize=True)
+
+            # Color images are stored as their luminance
+            color = Image.fromarray(np.dstack([self.pairs[1][0], self.pairs[1][1], self.pairs[1][0]]))
+            writer.append_images(color, right)
+
+        store = DatasetStore(self.store_path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get_at(0)[0].shape, (16, 24))
+        np.testing.assert_array_equal(store.get_at(1)[0], np.asarray(color.convert('L')))
+
+    def test_convert_json_dataset(self):
+        """Test converting a base64 JSON dataset"""
+        items = []
+        for i, (original, clean) in enumerate(self.pairs[:3]):
+            items.append({
+                'id': i,
+                'original': f'data:image/png;base64,{image_to_base64(Image.fromarray(original))}',
+                'clean': f'data:image/png;base64,{image_to_base64(Image.fromarray(clean))}'
+            })
+        items.append({'id': 'broken', 'original': 'data:image/png;base64,abc...', 'clean': ''})
+        small = f'data:image/png;base64,{image_to_base64(Image.fromarray(np.zeros((8, 8), np.uint8)))}'
+        items.append({'id': 'small', 'original': small, 'clean': small})
+
+        json_path = os.path.join(self.tmp_dir, 'legacy.json')
+        with open(json_path, 'w') as f:
+            json.dump(items, f)
+
+        count, skipped = convert_json_dataset(json_path, self.store_path)
+        self.assertEqual((count, skipped), (3, 2))
+
+        store = DatasetStore(self.store_path)
+        self.assertEqual(store.shape, (16, 24))
+        np.testing.assert_array_equal(store.get(2)[1], self.pairs[2][1])
+
+if __name__ == '__main__':
+    unittest.main()
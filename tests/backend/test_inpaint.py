@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import unittest
+import numpy as np
+from PIL import Image
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.inpaint import pyramid_inpaint, pyramid_levels
+from model.utils import remove_shine_from_image
+
+class TestPyramidInpaint(unittest.TestCase):
+    def setUp(self):
+        # A plane is harmonic, so the exact fill of any hole is the plane itself
+        y, x = np.mgrid[:120, :160]
+        self.plane = (40 + 0.5 * x + 0.3 * y).astype(np.float32)
+        self.mask = np.zeros(self.plane.shape, dtype=bool)
+        self.mask[30:90, 40:120] = True
+
+    def test_fills_harmonic(self):
+        """Test a large hole is filled with the harmonic fill of its boundary"""
+        filled = pyramid_inpaint(self.plane, self.mask)
+        np.testing.assert_array_equal(filled[~self.mask], self.plane[~self.mask])
+        self.assertLess(np.abs(filled - self.plane)[self.mask].max(), 0.2)
+
+        # Converged to the exact fill without a tolerance
+        filled = pyramid_inpaint(self.plane, self.mask, tolerance=0)
+        self.assertLess(np.abs(filled - self.plane)[self.mask].max(), 1e-3)
+
+    def test_levels(self):
+        """Test the pyramid makes few sweeps reach what plain diffusion cannot"""
+        self.assertEqual(pyramid_levels((60, 80)), 3)
+        self.assertEqual(pyramid_levels((3, 100)), 0)
+        coarse_to_fine = pyramid_inpaint(self.plane, self.mask, levels=3, iterations=10, tolerance=0)
+        single_level = pyramid_inpaint(self.plane, self.mask, levels=0, iterations=10, tolerance=0)
+        error = lambda filled: np.abs(filled - self.plane)[self.mask].max()
+        self.assertLess(error(coarse_to_fine), 1.0)
+        self.assertGreater(error(single_level), 10 * error(coarse_to_fine))
+        with self.assertRaises(ValueError):
+            pyramid_inpaint(self.plane, self.mask, levels=-1)
+
+    def test_time_budget(self):
+        """Test a spent budget still returns a complete fill"""
+        filled = pyramid_inpaint(self.plane, self.mask, time_budget=0)
+        self.assertTrue(np.isfinite(filled).all())
+        np.testing.assert_array_equal(filled[~self.mask], self.plane[~self.mask])
+        # The enlarged coarse levels alone keep the fill within the range of the known pixels
+        self.assertGreaterEqual(filled[self.mask].min(), self.plane[~self.mask].min())
+        self.assertLessEqual(filled[self.mask].max(), self.plane[~self.mask].max())
+
+        start = time.perf_counter()
+        pyramid_inpaint(self.plane, self.mask, deadline=start)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_edge_cases(self):
+        """Test empty, full and edge touching masks"""
+        np.testing.assert_array_equal(pyramid_inpaint(self.plane, np.zeros(self.plane.shape, dtype=bool)), self.plane)
+        full = pyramid_inpaint(self.plane, np.ones(self.plane.shape, dtype=bool))
+        np.testing.assert_allclose(full, self.plane.mean(), rtol=1e-5)
+
+        mask = np.zeros(self.plane.shape, dtype=bool)
+        mask[:20, 100:] = True
+        filled = pyramid_inpaint(self.plane, mask, tolerance=0)
+        # Image edges reflect, so the fill is not the plane but joins its known neighbours smoothly
+        self.assertLessEqual(filled[mask].max(), self.plane[~mask].max())
+        self.assertLess(np.abs(filled[19, 100:] - filled[20, 100:]).max(), 2.0)
+        self.assertLess(np.abs(filled[:20, 100] - filled[:20, 99]).max(), 2.0)
+
+    def test_remove_shine_method(self):
+        """Test the pyramid method of remove_shine_from_image"""
+        image = Image.fromarray(np.rint(self.plane).astype(np.uint8))
+        mask = Image.fromarray(self.mask.astype(np.uint8) * 255)
+        result = np.array(remove_shine_from_image(image, mask, 'pyramid', levels=3))
+        original = np.array(image)
+        np.testing.assert_array_equal(result[~self.mask], original[~self.mask])
+        self.assertLessEqual(np.abs(result.astype(int) - original)[self.mask].max(), 1)
+
+        result = remove_shine_from_image(image, mask, 'pyramid', time_budget=0)
+        self.assertEqual(result.size, image.size)
+
+if __name__ == '__main__':
+    unittest.main()
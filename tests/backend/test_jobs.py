@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import unittest
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.jobs import JobManager, JobQueueFull, COMPLETED, CANCELLED, FAILED
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.manager = JobManager(max_workers=1, max_queued=1, max_finished=2)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.manager.shutdown()
+
+    def _blocking_job(self, job):
+        """Report epochs until released or cancelled"""
+        epoch = 0
+        while not self.release.wait(0.01):
+            if job.cancel_requested:
+                break
+            job.on_epoch_end(epoch, {'loss': 0.5, 'val_loss': 0.6, 'samples_per_sec': 10.0})
+            epoch += 1
+        return {'epochs_completed': epoch}
+
+    def _wait(self, job):
+        while not job.finished:
+            job.wait_for_change(job.version, timeout=1)
+
+    def test_progress_and_completion(self):
+        """Test progress is published and the result kept"""
+        job = self.manager.submit(lambda job: (job.on_epoch_end(0, {
+            'loss': 0.4, 'val_loss': 0.5, 'samples_per_sec': 100.0}), 'done')[1], epochs=1)
+        self._wait(job)
+
+        snapshot = job.snapshot()
+        self.assertEqual(snapshot['status'], COMPLETED)
+        self.assertEqual(snapshot['history']['loss'], [0.4])
+        self.assertEqual(snapshot['progress'], 1.0)
+        self.assertEqual(snapshot['result'], 'done')
+
+    def test_failure(self):
+        """Test exceptions fail the job"""
+        def fail(job):
+            raise ValueError('bad architecture')
+        job = self.manager.submit(fail, epochs=1)
+        self._wait(job)
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.error, 'bad architecture')
+
+    def test_cancel_and_queue_limit(self):
+        """Test running and queued jobs can be cancelled and the queue is bounded"""
+        running = self.manager.submit(self._blocking_job, epochs=100)
+        while running.epoch == 0:
+            running.wait_for_change(running.version, timeout=1)
+
+        queued = self.manager.submit(self._blocking_job, epochs=100)
+        with self.assertRaises(JobQueueFull):
+            self.manager.submit(self._blocking_job, epochs=100)
+
+        # A queued job is cancelled without ever running
+        self.manager.cancel(queued.id)
+        self.assertEqual(queued.status, CANCELLED)
+        self.assertIsNone(queued.started_at)
+
+        # A running job stops at its next check
+        self.manager.cancel(running.id)
+        self._wait(running)
+        self.assertEqual(running.status, CANCELLED)
+
+    def test_finished_jobs_are_pruned(self):
+        """Test only the newest finished jobs are remembered"""
+        jobs = []
+        for _ in range(4):
+            job = self.manager.submit(lambda job: None, epochs=1)
+            self._wait(job)
+            jobs.append(job)
+        self.assertIsNone(self.manager.get(jobs[0].id))
+        self.assertIsNotNone(self.manager.get(jobs[-1].id))
+
+if __name__ == '__main__':
+    unittest.main()
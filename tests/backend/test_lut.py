@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+import numpy as np
+from scipy import ndimage
+from skimage import exposure
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.lut import (point_lut, gain_lut, offset_lut, gamma_lut, compose, apply_lut,
+                       histogram, equalize_lut, percentile)
+from model.pipeline import Pipeline
+from model.model import UnShineyModel
+from model.morphology import close_open
+
+class TestLUT(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img_array = rng.randint(0, 256, size=(48, 64)).astype(np.uint8)
+        # Narrow value range, as equalization sees after a dark exposure
+        self.dark = rng.randint(20, 90, size=(48, 64)).astype(np.uint8)
+
+    def test_point_tables(self):
+        """Test tables reproduce the float point operations they replace"""
+        img = self.img_array
+        np.testing.assert_array_equal(apply_lut(gain_lut(1.3), img),
+                                      np.clip(img.astype(float) * 1.3, 0, 255).astype(np.uint8))
+        np.testing.assert_array_equal(apply_lut(offset_lut(-40), img),
+                                      np.clip(img.astype(float) - 40, 0, 255).astype(np.uint8))
+        np.testing.assert_array_equal(apply_lut(gamma_lut(0.8), img), exposure.adjust_gamma(img, gamma=0.8))
+        self.assertFalse(gain_lut(1.3).flags.writeable)
+
+        # Writing into a preallocated float buffer
+        out = np.empty(img.shape, dtype=np.float32)
+        apply_lut(gain_lut(2.0).astype(np.float32), img, out=out)
+        np.testing.assert_array_equal(out, np.clip(img.astype(float) * 2.0, 0, 255).astype(np.uint8))
+
+    def test_compose(self):
+        """Test composed tables equal applying each table in turn"""
+        tables = [gain_lut(1.4), offset_lut(-12), gamma_lut(1.5), point_lut(lambda v: 255 - v)]
+        expected = self.img_array
+        for table in tables:
+            expected = apply_lut(table, expected)
+        np.testing.assert_array_equal(apply_lut(compose(*tables), self.img_array), expected)
+        np.testing.assert_array_equal(compose(), np.arange(256))
+
+    def test_histogram(self):
+        """Test one bincount gives the histogram of every image of a stack"""
+        stack = np.stack([self.img_array, self.dark])
+        hist = histogram(stack)
+        self.assertEqual(hist.shape, (2, 256))
+        np.testing.assert_array_equal(hist[1], np.bincount(self.dark.ravel(), minlength=256))
+        np.testing.assert_array_equal(histogram(self.img_array), hist[0])
+
+    def test_equalize_matches_skimage(self):
+        """Test the equalization table gives exactly exposure.equalize_hist"""
+        flat = np.full((8, 8), 77, dtype=np.uint8)
+        for img in (self.img_array, self.dark, flat):
+            table = equalize_lut(histogram(img))
+            np.testing.assert_array_equal(apply_lut(table, img), exposure.equalize_hist(img))
+
+    def test_percentile_matches_numpy(self):
+        """Test percentiles read off the histogram equal np.percentile"""
+        for img in (self.img_array, self.dark, self.img_array[:1, :3]):
+            hist = histogram(img)
+            for q in (0, 10, 50, 90, 97.5, 100):
+                self.assertAlmostEqual(percentile(hist, q), np.percentile(img, q), places=9)
+
+        stack = np.stack([self.img_array, self.dark])
+        np.testing.assert_allclose(percentile(histogram(stack), 90), np.percentile(stack, 90, axis=(1, 2)))
+
+    def test_consumers(self):
+        """Test pipelines and shine detection give the same result as before"""
+        pipeline = Pipeline('custom', {'processing_params': {'contrast': 1.4, 'brightness': -12}})
+        self.assertEqual(len(pipeline.stages), 1)
+        expected = np.clip(np.clip(self.img_array.astype(float) * 1.4, 0, 255).astype(np.uint8) - 12.0, 0, 255)
+        np.testing.assert_array_equal(pipeline.run(self.img_array), expected.astype(np.uint8))
+
+        # Equalization of the hybrid pipeline is a table lookup
+        expected = ndimage.gaussian_filter(exposure.equalize_hist(self.dark) * 255, sigma=0.5)
+        np.testing.assert_array_equal(Pipeline('hybrid').run(self.dark), expected.astype(np.uint8))
+
+        # Shine threshold from the histogram
+        expected = close_open(self.img_array > np.percentile(self.img_array, 95), 3, 1)
+        np.testing.assert_array_equal(UnShineyModel().detect_shine(self.img_array, 95), expected)
+
+if __name__ == '__main__':
+    unittest.main()
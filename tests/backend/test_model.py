@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import unittest
@@ -69,6 +70,32 @@ class TestModel(unittest.TestCase):
         self.assertEqual(self.dense_model.metrics['processed_images'], 1)
         self.assertGreater(self.dense_model.metrics['avg_processing_time'], 0)
 
+    def test_process_batch(self):
+        """Test batch processing matches per-image processing"""
+        # Create a stack of distinct images
+        rng = np.random.RandomState(0)
+        stack = rng.randint(0, 256, size=(4, 64, 64)).astype(np.uint8)
+        stack[1] = 128
+        stack[2, 20:30, 20:30] = 240
+
+        models = [self.dense_model, self.conv_model, self.hybrid_model,
+                  self.custom_model, self.config_model]
+        for model in models:
+            batch_output = model.process_batch(stack)
+            self.assertEqual(batch_output.shape, stack.shape)
+            self.assertEqual(batch_output.dtype, np.uint8)
+
+            # Each image must come out exactly as it would on its own
+            for img, processed in zip(stack, batch_output):
+                np.testing.assert_array_equal(processed, model.process_image(img))
+
+        # Verify metrics count every image in the batch
+        self.assertEqual(self.dense_model.metrics['processed_images'], 2 * len(stack))
+
+        # Only N×H×W stacks are accepted
+        with self.assertRaises(ValueError):
+            self.dense_model.process_batch(self.test_img_array)
+
     def test_custom_processing(self):
         """Test custom processing parameters"""
         # Create model with specific processing params
@@ -89,6 +116,65 @@ class TestModel(unittest.TestCase):
         self.assertEqual(output.shape, self.test_img_array.shape)
         self.assertEqual(output.dtype, np.uint8)
 
+    def test_processing_plan(self):
+        """Test processing params compile into a fused plan"""
+        # Contrast, brightness, blur and sharpen merge into one linear step
+        params = {'contrast': 1.3, 'brightness': -5, 'blur': 1.5, 'sharpen': 0.6, 'equalize': True}
+        model = UnShineyModel(model_type='custom', config={'processing_params': params})
+        self.assertEqual(model.processing_plan.describe(), ['linear', 'equalize'])
+
+        # No-op steps are dropped
+        params = {'sharpen': 0, 'denoise': 0, 'edge_enhance': 0, 'equalize': False}
+        model = UnShineyModel(model_type='custom', config={'processing_params': params})
+        self.assertEqual(model.processing_plan.describe(), [])
+        np.testing.assert_array_equal(model.process_image(self.test_img_array), self.test_img_array)
+
+    def test_fused_linear_step(self):
+        """Test the fused linear step against the sequential passes"""
+        from scipy import ndimage
+        from model.plan import LinearStep
+        from model.workspace import get_workspace
+
+        rng = np.random.RandomState(1)
+        img = rng.randint(0, 256, size=(64, 64)).astype(np.uint8)
+        params = {'contrast': 1.3, 'brightness': -5, 'blur': 1.5, 'sharpen': 0.6}
+
+        # Reference: one full-image pass per parameter
+        expected = img.astype(np.float32)
+        mean = np.mean(expected)
+        expected = (expected - mean) * 1.3 + mean
+        expected += -5
+        expected = ndimage.gaussian_filter(expected, sigma=1.5)
+        expected = expected + (expected - ndimage.gaussian_filter(expected, sigma=1.0)) * 0.6
+
+        # Blur and sharpen in the DCT domain match to float32 rounding
+        for shape in ((64, 64), (3, 5), (40, 70)):
+            sub = img[:shape[0], :shape[1]]
+            reference = sub.astype(np.float32)
+            reference = ndimage.gaussian_filter(reference, sigma=1.5)
+            reference = reference + (reference - ndimage.gaussian_filter(reference, sigma=1.0)) * 0.6
+            fused = LinearStep(blur=1.5, sharpen=0.6)(sub[np.newaxis].astype(np.float32), get_workspace())
+            np.testing.assert_allclose(fused[0], reference, rtol=0, atol=1e-3)
+
+        # So the image differs by at most one level where it truncates differently
+        model = UnShineyModel(model_type='custom', config={'processing_params': params})
+        diff = np.abs(model.process_image(img).astype(int) - np.clip(expected, 0, 255).astype(np.uint8))
+        self.assertLessEqual(diff.max(), 1)
+        self.assertLess(np.count_nonzero(diff), img.size * 0.01)
+
+        # Contrast and brightness alone are exact, on a flat image too
+        for img in (img, np.full((64, 64), 77, dtype=np.uint8)):
+            model = UnShineyModel(model_type='custom', config={'processing_params': {'contrast': 1.3, 'brightness': -10}})
+            expected = img.astype(np.float32)
+            mean = np.mean(expected)
+            expected = (expected - mean) * 1.3 + mean + -10
+            np.testing.assert_array_equal(model.process_image(img), np.clip(expected, 0, 255).astype(np.uint8))
+
+        # Per-image tables in a batch
+        model = UnShineyModel(model_type='custom', config={'processing_params': {'contrast': 0.7, 'brightness': 3}})
+        batch = np.stack([img, rng.randint(0, 256, size=(64, 64)).astype(np.uint8)])
+        np.testing.assert_array_equal(model.process_batch(batch), [model.process_image(image) for image in batch])
+
     def test_model_save_load_config(self):
         """Test saving and loading model configuration"""
         import tempfile
@@ -176,12 +262,85 @@ class TestModel(unittest.TestCase):
             if os.path.exists('temp_test_img.png'):
                 os.remove('temp_test_img.png')
 
+    def test_utils_reduced_decode(self):
+        """Test large images are decoded at reduced resolution and limited in size"""
+        from model.utils import open_image, resize_for_model, ImageTooLarge
+
+        # A smooth gradient, so the shortcuts barely change the result
+        gradient = np.add.outer(np.arange(1200), np.arange(1600)) * 255 // 2800
+        large = Image.fromarray(gradient.astype(np.uint8)).convert('RGB')
+        expected = np.array(large.convert('L').resize((64, 64), Image.LANCZOS)).astype(int)
+
+        for image_format in ('JPEG', 'PNG'):
+            buffer = io.BytesIO()
+            large.save(buffer, format=image_format)
+            buffer.seek(0)
+            img = open_image(buffer)
+            processed = resize_for_model(img, (64, 64))
+            self.assertEqual(processed.mode, 'L')
+            self.assertEqual(processed.size, (64, 64))
+            self.assertLessEqual(np.abs(np.array(processed) - expected).max(), 3)
+
+        # JPEGs are decoded at a reduced DCT scale
+        buffer = io.BytesIO()
+        large.save(buffer, format='JPEG')
+        img = open_image(buffer)
+        img.draft('L', (192, 192))
+        self.assertLess(img.size[0], 1600)
+
+        # The pixel limit applies before decoding
+        buffer.seek(0)
+        with self.assertRaises(ImageTooLarge):
+            open_image(buffer, max_pixels=1000)
+
+    def test_utils_process_luminance(self):
+        """Test color images are processed through their luminance only"""
+        from model.utils import process_luminance, luminance
+
+        rgb = Image.new('RGB', (32, 32), color=(160, 120, 100))
+        calls = []
+
+        def darken(y):
+            calls.append(y.shape)
+            return y.astype(int) * 3 // 4
+
+        result = process_luminance(rgb, darken)
+        self.assertEqual(result.mode, 'RGB')
+        self.assertEqual(calls, [(32, 32)])
+
+        # Luminance changed, chroma kept
+        before = np.array(rgb.convert('YCbCr')).astype(int)
+        after = np.array(result.convert('YCbCr')).astype(int)
+        self.assertLessEqual(np.abs(after[..., 0] - before[..., 0] * 3 // 4).max(), 2)
+        self.assertLessEqual(np.abs(after[..., 1:] - before[..., 1:]).max(), 2)
+
+        # preprocess_image can keep color as YCbCr
+        processed = preprocess_image(rgb, color=True)
+        self.assertEqual(processed.shape, (64, 64, 3))
+        np.testing.assert_array_equal(np.array(luminance(rgb.convert('YCbCr'))), before[..., 0])
+
     def test_utils_image_to_base64(self):
         """Test image to base64 conversion"""
         base64_str = image_to_base64(self.test_img)
         self.assertTrue(isinstance(base64_str, str))
         self.assertGreater(len(base64_str), 0)
 
+    def test_utils_encode_image(self):
+        """Test lossless image encoding"""
+        from model.utils import encode_image
+        img = Image.fromarray(np.random.RandomState(0).randint(0, 256, size=(32, 32)).astype(np.uint8))
+
+        fast = encode_image(img, 'PNG', compress_level=0)
+        small = encode_image(img, 'PNG', compress_level=9, optimize=True)
+        self.assertLessEqual(len(small), len(fast))
+
+        # Every encoding decodes back to the same pixels
+        for data in (fast, small, encode_image(img, 'WEBP')):
+            np.testing.assert_array_equal(np.array(Image.open(io.BytesIO(data)).convert('L')), np.array(img))
+
+        with self.assertRaises(ValueError):
+            encode_image(img, 'BMP')
+
     def test_utils_generate_sample_images(self):
         """Test sample image generation"""
         samples = generate_sample_images(count=3)
@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+import warnings
+import numpy as np
+from skimage import morphology
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.morphology import (disk_rows, pack_mask, unpack_mask, binary_dilation, binary_erosion,
+                              binary_closing, binary_opening, close_open)
+from model.model import UnShineyModel
+
+class TestMorphology(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        # skimage deprecated the binary_* functions but they define the expected output
+        catcher = warnings.catch_warnings()
+        catcher.__enter__()
+        self.addCleanup(catcher.__exit__, None, None, None)
+        warnings.simplefilter('ignore', FutureWarning)
+
+    def test_pack_round_trip(self):
+        """Test packing keeps every pixel for widths around word boundaries"""
+        for width in (1, 7, 63, 64, 65, 130):
+            mask = self.rng.rand(3, 5, width) < 0.5
+            packed = pack_mask(mask)
+            self.assertEqual(packed.shape, (3, 5, -(-width // 64)))
+            np.testing.assert_array_equal(unpack_mask(packed, width), mask)
+
+    def test_disk_rows(self):
+        """Test the line decomposition covers the disk exactly"""
+        for radius in (1, 3, 6):
+            footprint = np.zeros((2 * radius + 1,) * 2, dtype=np.uint8)
+            for dy, half_width in disk_rows(radius):
+                footprint[dy + radius, radius - half_width:radius + half_width + 1] = 1
+            np.testing.assert_array_equal(footprint, morphology.disk(radius))
+
+    def test_matches_skimage(self):
+        """Test every operation matches skimage, borders included"""
+        for shape in ((1, 1), (6, 9), (40, 65), (33, 130)):
+            for density in (0.2, 0.5, 0.85):
+                mask = self.rng.rand(*shape) < density
+                for radius in (1, 3, 5):
+                    disk = morphology.disk(radius)
+                    np.testing.assert_array_equal(binary_dilation(mask, radius), morphology.binary_dilation(mask, disk))
+                    np.testing.assert_array_equal(binary_erosion(mask, radius), morphology.binary_erosion(mask, disk))
+                    np.testing.assert_array_equal(binary_closing(mask, radius), morphology.binary_closing(mask, disk))
+                    np.testing.assert_array_equal(binary_opening(mask, radius), morphology.binary_opening(mask, disk))
+
+    def test_stacks_do_not_mix(self):
+        """Test an N×H×W stack gives the same masks as one image at a time"""
+        stack = self.rng.rand(4, 30, 70) < 0.6
+        result = close_open(stack, 3, 1)
+        for mask, cleaned in zip(stack, result):
+            expected = morphology.binary_opening(morphology.binary_closing(mask, morphology.disk(3)), morphology.disk(1))
+            np.testing.assert_array_equal(cleaned, expected)
+
+    def test_detect_shine(self):
+        """Test shine detection is unchanged and accepts stacks"""
+        model = UnShineyModel('dense')
+        stack = self.rng.randint(0, 256, size=(3, 48, 72)).astype(np.uint8)
+        stack[1, 10:20, 30:40] = 255
+        masks = model.detect_shine(stack)
+        self.assertEqual(masks.shape, stack.shape)
+        for img, mask in zip(stack, masks):
+            expected = (img > np.percentile(img, 90)).astype(np.uint8)
+            expected = morphology.binary_closing(expected, morphology.disk(3))
+            expected = morphology.binary_opening(expected, morphology.disk(1))
+            np.testing.assert_array_equal(mask, expected)
+            np.testing.assert_array_equal(model.detect_shine(img), expected)
+
+if __name__ == '__main__':
+    unittest.main()
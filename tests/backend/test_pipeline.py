@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+import numpy as np
+from scipy import ndimage
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.kernels import gaussian_blur
+from model.pipeline import Pipeline, PipelineCache, config_hash
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        # Create test image with some structure
+        rng = np.random.RandomState(0)
+        self.test_img_array = rng.randint(0, 256, size=(64, 64)).astype(np.uint8)
+
+    def test_gaussian_blur_matches_ndimage(self):
+        """Test cached-kernel blur is identical to ndimage.gaussian_filter"""
+        for sigma in (0.5, 0.8, 1, 2.5):
+            np.testing.assert_array_equal(
+                gaussian_blur(self.test_img_array, sigma),
+                ndimage.gaussian_filter(self.test_img_array, sigma=sigma)
+            )
+
+    def test_config_hash_is_canonical(self):
+        """Test config hash ignores key order"""
+        a = {'processing_params': {'contrast': 1.2, 'brightness': 5}}
+        b = {'processing_params': {'brightness': 5, 'contrast': 1.2}}
+        self.assertEqual(config_hash(a), config_hash(b))
+        self.assertNotEqual(config_hash(a), config_hash({'processing_params': {'contrast': 1.3}}))
+        self.assertEqual(config_hash(None), '')
+
+    def test_contrast_brightness_lut(self):
+        """Test folded contrast and brightness table matches sequential float math"""
+        pipeline = Pipeline('dense', {'processing_params': {'contrast': 1.4, 'brightness': -12}})
+        expected = np.clip(self.test_img_array.astype(float) * 1.4, 0, 255).astype(np.uint8)
+        expected = np.clip(expected.astype(float) - 12, 0, 255).astype(np.uint8)
+        self.assertEqual(len(pipeline.stages), 1)
+        np.testing.assert_array_equal(pipeline.run(self.test_img_array), expected)
+
+    def test_pipeline_model_types(self):
+        """Test every model type produces a uint8 image of the same shape"""
+        for model_type in ('dense', 'conv', 'hybrid', 'custom'):
+            output = Pipeline(model_type).run(self.test_img_array)
+            self.assertEqual(output.shape, self.test_img_array.shape)
+            self.assertEqual(output.dtype, np.uint8)
+
+    def test_cache_hits_and_eviction(self):
+        """Test LRU behaviour and hit/miss counters"""
+        cache = PipelineCache(max_size=2)
+        dense = cache.get('dense')
+        self.assertIs(cache.get('dense'), dense)
+        cache.get('conv', {'processing_params': {'blur': 1}})
+        cache.get('dense')
+        cache.get('hybrid')
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+        # The least recently used entry (conv) was evicted, dense survived
+        self.assertIs(cache.get('dense'), dense)
+        cache.get('conv', {'processing_params': {'blur': 1}})
+        self.assertEqual(cache.stats()['misses'], 4)
+
+if __name__ == '__main__':
+    unittest.main()
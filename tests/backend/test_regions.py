@@ -0,0 +1,141 @@
+import os
+import sys
+import unittest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from scipy import ndimage
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.model import UnShineyModel
+from model.regions import blur_radius, blurred_box, blend_fixed, region_boxes, replace_regions
+from model.scale_space import ScaleSpace
+from model.utils import remove_shine_from_image
+
+class TestRegions(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img_array = ndimage.uniform_filter(rng.randint(0, 256, size=(96, 128)), 3).astype(np.uint8)
+        # Small highlights, one touching the image edge and two close together
+        self.mask = np.zeros(self.img_array.shape, dtype=np.uint8)
+        self.mask[10:16, 20:28] = 255
+        self.mask[14:18, 34:37] = 255
+        self.mask[60:70, 0:6] = 255
+        self.mask[85:96, 100:128] = 128
+
+    def test_region_boxes(self):
+        """Test boxes are padded, clipped and merged when they overlap"""
+        for pad in (0, 4, 12, 20):
+            regions = region_boxes(self.mask > 0, pad)
+            covered = np.zeros(self.mask.shape, dtype=int)
+            for box, region in regions:
+                covered[box][region] += 1
+                # Region pixels keep pad pixels of context inside the box
+                rows, cols = np.nonzero(region)
+                for s, size, near, far in ((box[0], self.mask.shape[0], rows.min(), rows.max()),
+                                           (box[1], self.mask.shape[1], cols.min(), cols.max())):
+                    self.assertTrue(s.start == 0 or near >= pad)
+                    self.assertTrue(s.stop == size or s.stop - s.start - 1 - far >= pad)
+            # Every masked pixel belongs to exactly one box
+            np.testing.assert_array_equal(covered, self.mask > 0)
+
+        # Distant highlights get their own boxes, close ones share one
+        mask = np.zeros((512, 512), dtype=bool)
+        mask[10:16, 20:28] = mask[14:18, 34:37] = True
+        mask[300:310, 0:6] = True
+        mask[500:512, 400:512] = True
+        regions = region_boxes(mask, 12)
+        self.assertEqual(len(regions), 3)
+        self.assertLess(sum(region.size for _, region in regions), mask.size // 10)
+        self.assertEqual(region_boxes(np.zeros((4, 4)), 2), [])
+
+    def test_blurred_box_is_exact(self):
+        """Test a padded box blurs exactly like the whole image"""
+        full = ScaleSpace(self.img_array)
+        for sigma in (3, (0, 5), (5, 0)):
+            reference = full.blur(sigma)
+            for box, region in region_boxes(self.mask > 0, blur_radius(max(np.atleast_1d(sigma)))):
+                np.testing.assert_array_equal(blurred_box(self.img_array, box, sigma)[region], reference[box][region])
+                # Cached levels of a shared scale space are sliced
+                self.assertIs(blurred_box(self.img_array, box, sigma, full).base, reference)
+
+    def test_blend_fixed(self):
+        """Test fixed point blending against the float blend"""
+        rng = np.random.RandomState(1)
+        original = rng.randint(0, 256, size=1000).astype(np.uint8)
+        replacement = rng.uniform(0, 255, size=1000)
+        weights = rng.randint(0, 256, size=1000).astype(np.uint8)
+        weights[:10] = 0
+        weights[10:20] = 255
+
+        expected = original * (1 - weights / 255.0) + replacement * (weights / 255.0)
+        nearest = blend_fixed(original, replacement, weights)
+        truncated = blend_fixed(original, replacement, weights, rounding='truncate')
+        self.assertLessEqual(np.abs(nearest.astype(int) - np.rint(expected)).max(), 1)
+        self.assertLessEqual(np.abs(truncated.astype(int) - expected.astype(np.uint8)).max(), 1)
+        np.testing.assert_array_equal(nearest[:10], original[:10])
+        np.testing.assert_array_equal(nearest[10:20], np.rint(replacement[10:20]))
+
+    def test_matches_full_frame(self):
+        """Test region-limited removal matches blending the whole frame"""
+        weights = self.mask / 255.0
+        space = ScaleSpace(self.img_array)
+        references = {
+            'inpainting': space.blur(3),
+            'blend': (space.blur((0, 5)) + space.blur((5, 0))) / 2
+        }
+        for method, blurred in references.items():
+            expected = np.clip(self.img_array * (1 - weights) + blurred * weights, 0, 255).astype(np.uint8)
+            result = np.array(remove_shine_from_image(Image.fromarray(self.img_array), Image.fromarray(self.mask), method))
+            self.assertLessEqual(np.abs(result.astype(int) - expected).max(), 1)
+            np.testing.assert_array_equal(result[self.mask == 0], self.img_array[self.mask == 0])
+
+        shine = (self.mask == 255).astype(np.uint8)
+        expected = self.img_array.copy()
+        expected[shine == 1] = np.rint(references['inpainting'][shine == 1])
+        result = UnShineyModel('dense').remove_shine(self.img_array, shine)
+        self.assertLessEqual(np.abs(result.astype(int) - expected).max(), 1)
+
+        # Float images are replaced exactly
+        img = self.img_array.astype(np.float32)
+        result = UnShineyModel('dense').remove_shine(img, shine)
+        np.testing.assert_array_equal(result[shine == 1], references['inpainting'][shine == 1])
+
+    def test_blend_does_not_wrap(self):
+        """Test 'blend' averages bright blurs without the old uint8 wraparound"""
+        img = (self.img_array // 4 + 190).astype(np.uint8)
+        mask = np.zeros(img.shape, dtype=np.uint8)
+        mask[30:60, 40:80] = 255
+        result = np.array(remove_shine_from_image(Image.fromarray(img), Image.fromarray(mask), 'blend'))
+
+        # The average of the two directional blurs, as floats
+        reference = img.astype(np.float64)
+        blurred = (ndimage.gaussian_filter1d(reference, 5, axis=1) + ndimage.gaussian_filter1d(reference, 5, axis=0)) / 2
+        inside = mask == 255
+        self.assertLessEqual(np.abs(result[inside] - np.trunc(blurred[inside])).max(), 1)
+        self.assertTrue((result[inside] >= 190).all())
+
+        # Adding the uint8 blurs, as the method first did, wrapped around 256
+        wrapped = (ndimage.gaussian_filter1d(img, 5, axis=1) + ndimage.gaussian_filter1d(img, 5, axis=0)) / 2
+        self.assertTrue((wrapped[inside] < 128).all())
+
+    def test_parallel(self):
+        """Test boxes processed on an executor give the serial result"""
+        replace = lambda box: blurred_box(self.img_array, box, 3)
+        serial = replace_regions(self.img_array, self.mask, blur_radius(3), replace)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            parallel = replace_regions(self.img_array, self.mask, blur_radius(3), replace, executor=executor)
+        np.testing.assert_array_equal(parallel, serial)
+
+        # Calls without an executor share one thread pool
+        import model.regions as regions
+        replace_regions(self.img_array, self.mask, blur_radius(3), replace)
+        self.assertIsNotNone(regions._executor)
+        shared = regions._executor
+        UnShineyModel('dense').remove_shine(self.img_array, self.mask // 255)
+        self.assertIs(regions._executor, shared)
+
+if __name__ == '__main__':
+    unittest.main()
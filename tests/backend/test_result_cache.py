@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.result_cache import ResultCache
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.result = np.arange(64 * 64, dtype=np.uint32).reshape(64, 64).astype(np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key(self):
+        """Test keys depend on version, content, model type and canonical config"""
+        data = b'image bytes'
+        key = ResultCache.key(data, 'dense', {'a': 1, 'b': 2})
+        self.assertEqual(key, ResultCache.key(data, 'dense', {'b': 2, 'a': 1}))
+        self.assertNotEqual(key, ResultCache.key(data, 'conv', {'a': 1, 'b': 2}))
+        self.assertNotEqual(key, ResultCache.key(b'other bytes', 'dense', {'a': 1, 'b': 2}))
+
+        # Files are hashed like their bytes and rewound
+        stream = io.BytesIO(data)
+        self.assertEqual(ResultCache.key(stream, 'dense', {'a': 1, 'b': 2}), key)
+        self.assertEqual(stream.tell(), 0)
+
+        # A new cache version invalidates every key
+        with mock.patch('model.result_cache.CACHE_VERSION', 2):
+            self.assertNotEqual(ResultCache.key(data, 'dense', {'a': 1, 'b': 2}), key)
+
+    def test_memory_lru(self):
+        """Test the memory tier evicts the least recently used result"""
+        cache = ResultCache(max_bytes=2 * self.result.nbytes)
+        cache.put('a', self.result)
+        cache.put('b', self.result)
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', self.result)
+
+        self.assertIsNone(cache.get('b'))
+        np.testing.assert_array_equal(cache.get('a'), self.result)
+        self.assertIsNotNone(cache.get('c'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['items'], 2)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+
+        # Cached results cannot be modified by callers
+        with self.assertRaises(ValueError):
+            cache.get('a')[0, 0] = 1
+
+    def test_disk_tier(self):
+        """Test results survive on disk within the size cap"""
+        cache = ResultCache(max_bytes=self.result.nbytes, disk_path=self.tmp_dir)
+        cache.put('a' * 64, self.result)
+        cache.put('b' * 64, self.result)
+
+        # 'a' dropped out of memory but is still on disk
+        np.testing.assert_array_equal(cache.get('a' * 64), self.result)
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+        # A new cache finds the results of the old one
+        reopened = ResultCache(disk_path=self.tmp_dir)
+        self.assertEqual(reopened.stats()['disk_items'], 2)
+        np.testing.assert_array_equal(reopened.get('b' * 64), self.result)
+
+        # The disk tier is trimmed to its cap
+        entry_size = reopened.stats()['disk_bytes'] // 2
+        capped = ResultCache(max_bytes=0, disk_path=self.tmp_dir, disk_max_bytes=2 * entry_size)
+        capped.put('c' * 64, self.result)
+        self.assertEqual(capped.stats()['disk_items'], 2)
+        self.assertIsNotNone(capped.get('c' * 64))
+
+        capped.clear()
+        self.assertIsNone(ResultCache(disk_path=self.tmp_dir).get('c' * 64))
+
+if __name__ == '__main__':
+    unittest.main()
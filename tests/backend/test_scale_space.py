@@ -0,0 +1,111 @@
+import os
+import sys
+import unittest
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.scale_space import ScaleSpace
+from model.model import UnShineyModel
+from model.pipeline import Pipeline
+from model.utils import remove_shine_from_image
+
+class TestScaleSpace(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img_array = rng.randint(0, 256, (72, 90)).astype(np.uint8)
+        self.reference = self.img_array.astype(np.float64)
+
+    def test_matches_direct_blur(self):
+        """Test blurs built incrementally match blurring from scratch"""
+        space = ScaleSpace(self.img_array)
+        for sigma in (1, 3, 2, 5):
+            expected = ndimage.gaussian_filter(self.reference, sigma)
+            np.testing.assert_allclose(space.blur(sigma), expected, atol=0.05)
+
+        # Anisotropic blurs
+        expected = ndimage.gaussian_filter1d(self.reference, 5, axis=1)
+        np.testing.assert_allclose(space.blur((0, 5)), expected, atol=1e-3)
+        expected = ndimage.gaussian_filter(self.reference, (4, 5))
+        np.testing.assert_allclose(space.blur((4, 5)), expected, atol=0.05)
+
+    def test_each_sigma_is_computed_once(self):
+        """Test repeated requests are served from the cache"""
+        space = ScaleSpace(self.img_array)
+        first = space.blur(3)
+        passes = space.passes
+        self.assertIs(space.blur(3.0), first)
+        self.assertIs(space.blur((3, 3)), first)
+        self.assertEqual(space.passes, passes)
+        self.assertFalse(first.flags.writeable)
+        self.assertIs(space.blur(0), space.image)
+
+        # A larger sigma starts from sigma 3, not from the image
+        space.blur(5)
+        self.assertEqual(space.passes, passes + 2)
+        self.assertEqual(space.sigmas(), [(0.0, 0.0), (3.0, 3.0), (5.0, 5.0)])
+
+        with self.assertRaises(ValueError):
+            space.blur(-1)
+
+    def test_stacks_do_not_mix(self):
+        """Test every image of a stack is blurred on its own"""
+        stack = np.stack([self.img_array, self.img_array[::-1]])
+        blurred = ScaleSpace(stack).blur(2)
+        for img, result in zip(stack, blurred):
+            np.testing.assert_allclose(result, ScaleSpace(img).blur(2), atol=1e-4)
+
+    def test_shared_by_removal_stages(self):
+        """Test shine removal stages give the same result with a shared scale space"""
+        mask = np.zeros(self.img_array.shape, dtype=np.uint8)
+        mask[20:40, 30:50] = 255
+        image = Image.fromarray(self.img_array)
+        space = ScaleSpace(self.img_array)
+        for method in ('inpainting', 'blend'):
+            shared = remove_shine_from_image(image, Image.fromarray(mask), method, scale_space=space)
+            alone = remove_shine_from_image(image, Image.fromarray(mask), method)
+            np.testing.assert_array_equal(np.array(shared), np.array(alone))
+
+        model = UnShineyModel('dense')
+        passes = space.passes
+        shared = model.remove_shine(self.img_array, mask // 255, scale_space=space)
+        self.assertEqual(space.passes, passes)
+        np.testing.assert_array_equal(shared, model.remove_shine(self.img_array, mask // 255))
+
+    def test_truncated_levels(self):
+        """Test truncated blurs match the uint8 blur and are computed once"""
+        space = ScaleSpace(self.img_array)
+        level = space.truncated(1)
+        np.testing.assert_array_equal(level, ndimage.gaussian_filter(self.img_array, 1))
+        self.assertIs(space.truncated(1.0), level)
+        self.assertEqual(space.passes, 2)
+        self.assertFalse(level.flags.writeable)
+
+    def test_shared_by_processing(self):
+        """Test model and pipeline stages blurring one image share its scale space"""
+        space = ScaleSpace(self.img_array)
+        conv = UnShineyModel('conv')
+        np.testing.assert_array_equal(conv.process_image(self.img_array, scale_space=space),
+                                      conv.process_image(self.img_array))
+        self.assertEqual(space.passes, 2)
+
+        # The pipeline reuses the model's blur, and adds its own sigma once
+        np.testing.assert_array_equal(Pipeline('conv').run(self.img_array, space), Pipeline('conv').run(self.img_array))
+        self.assertEqual(space.passes, 2)
+        for _ in range(2):
+            np.testing.assert_array_equal(Pipeline('custom').run(self.img_array, space),
+                                          Pipeline('custom').run(self.img_array))
+        self.assertEqual(space.passes, 4)
+
+        # Shine removal on the same image still blurs its own sigma
+        mask = np.zeros(self.img_array.shape, dtype=np.uint8)
+        mask[20:40, 30:50] = 1
+        model = UnShineyModel('dense')
+        np.testing.assert_array_equal(model.remove_shine(self.img_array, mask, scale_space=space),
+                                      model.remove_shine(self.img_array, mask))
+
+if __name__ == '__main__':
+    unittest.main()
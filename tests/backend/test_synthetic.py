@@ -0,0 +1,95 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.dataset_store import DatasetStore, DatasetWriter
+from model.synthetic import KINDS, render_pairs, write_pairs
+from model.utils import generate_sample_images
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_render_pairs(self):
+        """Test pairs have the right shape, kinds and saturated shine"""
+        originals, cleans = render_pairs(12, size=48, seed=3)
+        self.assertEqual(originals.shape, (12, 48, 48))
+        self.assertEqual(cleans.shape, (12, 48, 48))
+        self.assertEqual(originals.dtype, np.uint8)
+        self.assertEqual(cleans.dtype, np.uint8)
+
+        # Shine only ever brightens, and every pair has some
+        self.assertTrue(np.all(originals >= cleans))
+        for original, clean in zip(originals, cleans):
+            self.assertTrue(np.any(original != clean))
+
+        # Kinds rotate, and gradient and circle pairs share a clean image
+        np.testing.assert_array_equal(cleans[0], cleans[5])
+        np.testing.assert_array_equal(cleans[1], cleans[6])
+
+    def test_deterministic(self):
+        """Test the same seed and start give the same pairs"""
+        first = render_pairs(7, size=32, seed=11, start=4)
+        second = render_pairs(7, size=32, seed=11, start=4)
+        np.testing.assert_array_equal(first[0], second[0])
+        np.testing.assert_array_equal(first[1], second[1])
+
+        # A different start picks other kinds and seeds
+        other = render_pairs(7, size=32, seed=11, start=5)
+        self.assertFalse(np.array_equal(first[0], other[0]))
+
+    def test_kinds(self):
+        """Test a subset of kinds and unknown kinds"""
+        originals, cleans = render_pairs(3, size=32, seed=0, kinds=('grid',))
+        np.testing.assert_array_equal(cleans[0], cleans[2])
+
+        with self.assertRaises(ValueError):
+            render_pairs(2, size=32, kinds=('gradient', 'mirror'))
+
+    def test_sample_images(self):
+        """Test generate_sample_images returns PIL pairs of every kind"""
+        samples = generate_sample_images(count=len(KINDS), size=40, seed=1)
+        self.assertEqual(len(samples), len(KINDS))
+        for original, clean in samples:
+            self.assertEqual(original.size, (40, 40))
+            self.assertEqual(clean.mode, 'L')
+
+    def test_write_pairs(self):
+        """Test pairs written serially and by worker processes are the same"""
+        paths = []
+        for processes in (0, 2):
+            path = os.path.join(self.test_dir, f"store_{processes}")
+            with DatasetWriter(path, shape=(24, 24), shard_size=8) as writer:
+                self.assertEqual(write_pairs(writer, 13, seed=5, processes=processes, chunk_size=4), 13)
+                # Appending continues the sequence instead of repeating it
+                write_pairs(writer, 6, seed=5, processes=processes, chunk_size=4)
+            paths.append(path)
+
+        serial, parallel = DatasetStore(paths[0]), DatasetStore(paths[1])
+        self.assertEqual(len(serial), 19)
+        self.assertEqual(serial.ids, [str(i) for i in range(19)])
+        self.assertEqual(len(serial.index['shards']), 3)
+        for position in range(len(serial)):
+            for a, b in zip(serial.get_at(position), parallel.get_at(position)):
+                np.testing.assert_array_equal(a, b)
+
+        # Chunks are rendered from their position in the store
+        originals, cleans = render_pairs(4, size=24, seed=5, start=13)
+        np.testing.assert_array_equal(serial.get_at(13)[0], originals[0])
+        np.testing.assert_array_equal(serial.get_at(16)[1], cleans[3])
+
+        with DatasetWriter(os.path.join(self.test_dir, 'wide'), shape=(16, 24)) as writer:
+            with self.assertRaises(ValueError):
+                write_pairs(writer, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.pipeline import Pipeline
+from model.tiling import tile_positions, iter_tiled_rows, process_tiled
+
+class TestTiling(unittest.TestCase):
+    def setUp(self):
+        # A smooth image with some texture, not a multiple of the tile size
+        rng = np.random.RandomState(0)
+        yy, xx = np.mgrid[0:300, 0:410]
+        img = 120 + 60 * np.sin(xx / 17.0) * np.cos(yy / 23.0) + rng.normal(0, 5, size=xx.shape)
+        self.img_array = np.clip(img, 0, 255).astype(np.uint8)
+
+    def test_tile_positions(self):
+        """Test tiles cover the axis with at least the requested overlap"""
+        self.assertEqual(tile_positions(50, 64, 8), [0])
+        for length in (64, 100, 410, 1000):
+            positions = tile_positions(length, 64, 8)
+            self.assertEqual(positions[0], 0)
+            self.assertEqual(positions[-1] + 64, length)
+            for a, b in zip(positions, positions[1:]):
+                self.assertLessEqual(b - a, 64 - 8)
+
+    def test_identity_and_point_operations_are_exact(self):
+        """Test tiling is invisible for operations without neighbourhoods"""
+        np.testing.assert_array_equal(process_tiled(self.img_array, lambda tile: tile, 64, 8), self.img_array)
+
+        pipeline = Pipeline('dense')
+        expected = pipeline.run(self.img_array)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            tiled = process_tiled(self.img_array, pipeline.run, 64, 8, executor=executor)
+        np.testing.assert_array_equal(tiled, expected)
+
+        # PIL Images are read a band at a time
+        tiled = process_tiled(Image.fromarray(self.img_array), pipeline.run, 64, 8)
+        np.testing.assert_array_equal(tiled, expected)
+
+    def test_seams_are_blended(self):
+        """Test filters with a neighbourhood stay close to the whole-image result"""
+        pipeline = Pipeline('conv')
+        expected = pipeline.run(self.img_array).astype(int)
+        tiled = process_tiled(self.img_array, pipeline.run, 96, 24).astype(int)
+        self.assertEqual(tiled.shape, expected.shape)
+        self.assertLessEqual(np.abs(tiled - expected).max(), 4)
+        self.assertLess(np.abs(tiled - expected).mean(), 0.5)
+
+    def test_rows_are_streamed(self):
+        """Test finished rows come out in order as each row of tiles completes"""
+        bands = list(iter_tiled_rows(lambda top, bottom: self.img_array[top:bottom],
+                                     self.img_array.shape, lambda tile: tile, 64, 16))
+        self.assertEqual(len(bands), len(tile_positions(300, 64, 16)))
+        top = 0
+        for band_top, rows in bands:
+            self.assertEqual(band_top, top)
+            self.assertLessEqual(len(rows), 64)
+            top += len(rows)
+        self.assertEqual(top, 300)
+
+        with self.assertRaises(ValueError):
+            process_tiled(self.img_array, lambda tile: tile, 64, 64)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.model import UnShineyModel
+from model.training import Network, train_network, _mae
+
+class TestTraining(unittest.TestCase):
+    def setUp(self):
+        # Small images keep the networks tiny
+        self.size = 8
+        rng = np.random.RandomState(0)
+        self.inputs = rng.randint(0, 256, size=(12, self.size, self.size)).astype(np.uint8)
+        self.targets = (self.inputs // 2).astype(np.uint8)
+
+    def _architecture(self, activation='relu'):
+        return [
+            {'type': 'conv2d', 'filters': 3, 'kernel_size': 3, 'activation': activation},
+            {'type': 'maxpool', 'pool_size': 2},
+            {'type': 'flatten'},
+            {'type': 'dense', 'units': 16, 'activation': activation},
+            {'type': 'dropout', 'rate': 0.0},
+            {'type': 'dense', 'units': self.size * self.size, 'activation': 'sigmoid'}
+        ]
+
+    def _loss(self, network, x, t):
+        return _mae(network.forward(x), t)[0]
+
+    def test_gradients_match_finite_differences(self):
+        """Test backpropagated gradients against numerical derivatives"""
+        for activation in ('relu', 'tanh', 'selu', 'sigmoid'):
+            network = Network(self._architecture(activation), (self.size, self.size), seed=1)
+            # Keep the first convolution's input gradient so every layer is checked
+            network.layers[0].needs_input_grad = True
+
+            x = (self.inputs[:3, ..., np.newaxis] / 255.0).astype(np.float32)
+            t = (self.targets[:3].reshape(3, -1) / 255.0).astype(np.float32)
+
+            _, grad = _mae(network.forward(x), t)
+            network.backward(grad)
+
+            rng = np.random.RandomState(2)
+            for param, param_grad in network.params:
+                analytic = param_grad.copy()
+                for _ in range(3):
+                    i = tuple(rng.randint(0, dim) for dim in param.shape)
+                    original = param[i]
+                    eps = 1e-2
+                    param[i] = original + eps
+                    plus = self._loss(network, x, t)
+                    param[i] = original - eps
+                    minus = self._loss(network, x, t)
+                    param[i] = original
+                    numeric = (plus - minus) / (2 * eps)
+                    self.assertAlmostEqual(analytic[i], numeric, delta=2e-3 + 0.05 * abs(numeric))
+
+    def test_loss_reuses_buffers(self):
+        """Test the loss writes into the buffers it is given"""
+        rng = np.random.RandomState(3)
+        pred, t = rng.rand(2, 4, 9).astype(np.float32)
+        diff, grad = np.empty_like(pred), np.empty_like(pred)
+        loss, result = _mae(pred, t, diff, grad)
+        self.assertIs(result, grad)
+        self.assertAlmostEqual(loss, float(np.mean(np.abs(pred - t))), places=6)
+        np.testing.assert_array_equal(grad, np.sign(pred - t) / pred.size)
+        fresh_loss, fresh_grad = _mae(pred, t)
+        self.assertEqual(fresh_loss, loss)
+        np.testing.assert_array_equal(fresh_grad, grad)
+
+    def test_training_reduces_loss(self):
+        """Test training lowers the loss and reports throughput"""
+        network = Network(self._architecture(), (self.size, self.size), seed=0)
+        history = train_network(network, self.inputs, self.targets, epochs=30,
+                                batch_size=4, learning_rate=0.01, seed=0)
+
+        self.assertEqual(history['epochs_completed'], 30)
+        self.assertLess(history['loss'][-1], history['loss'][0])
+        self.assertGreater(history['samples_per_sec'], 0)
+
+        # Predictions come back as uint8 images
+        predicted = network.predict(self.inputs)
+        self.assertEqual(predicted.shape, self.inputs.shape)
+        self.assertEqual(predicted.dtype, np.uint8)
+
+    def test_callbacks_and_stop(self):
+        """Test the epoch callback and early stopping"""
+        network = Network(self._architecture(), (self.size, self.size), seed=0)
+        epochs_seen = []
+        history = train_network(network, self.inputs, self.targets, epochs=10, batch_size=4,
+                                on_epoch_end=lambda epoch, stats: epochs_seen.append(epoch),
+                                should_stop=lambda: len(epochs_seen) >= 2)
+
+        self.assertEqual(epochs_seen, [0, 1])
+        self.assertEqual(history['epochs_completed'], 2)
+
+    def test_invalid_architecture(self):
+        """Test an output layer of the wrong size is rejected"""
+        architecture = [{'type': 'dense', 'units': 10, 'activation': 'sigmoid'}]
+        with self.assertRaises(ValueError):
+            Network(architecture, (self.size, self.size))
+
+        architecture = [{'type': 'unknown'}]
+        with self.assertRaises(ValueError):
+            Network(architecture, (self.size, self.size))
+
+    def test_trained_model_processes_with_network(self):
+        """Test a trained model processes images with its network"""
+        model = UnShineyModel(model_type='conv', img_size=self.size)
+        history = model.train(list(zip(self.inputs, self.targets)), epochs=2, batch_size=4, seed=0)
+
+        self.assertTrue(model.trained)
+        self.assertEqual(len(history['loss']), 2)
+        np.testing.assert_array_equal(model.process_batch(self.inputs), model.network.predict(self.inputs))
+
+        # Other sizes are resized to the network's input and back
+        output = model.process_image(np.full((20, 24), 100, dtype=np.uint8))
+        self.assertEqual(output.shape, (20, 24))
+
+if __name__ == '__main__':
+    unittest.main()
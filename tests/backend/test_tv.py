@@ -0,0 +1,93 @@
+import os
+import sys
+import unittest
+import numpy as np
+from skimage import restoration
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.tv import denoise_tv, tv_options
+from model.plan import ProcessingPlan
+from model.model import UnShineyModel
+
+class TestTV(unittest.TestCase):
+    def setUp(self):
+        # Noisy blocks of a few sizes
+        rng = np.random.RandomState(0)
+        yy, xx = np.mgrid[0:48, 0:40]
+        base = 0.5 + 0.3 * np.sign(np.sin(xx / 7.0)) * np.cos(yy / 11.0)
+        self.stack = np.clip(base + rng.normal(0, 0.08, (5,) + base.shape), 0, 1).astype(np.float32)
+
+    def test_matches_skimage(self):
+        """Test the default Chambolle solver gives skimage's result on every image, bit for bit"""
+        result, iterations = denoise_tv(self.stack, weight=0.1)
+        self.assertEqual(result.shape, self.stack.shape)
+        self.assertGreater(iterations, 1)
+        for img, denoised in zip(self.stack, result):
+            np.testing.assert_array_equal(denoised, restoration.denoise_tv_chambolle(img, weight=0.1))
+        stack = self.stack.astype(np.float64)
+        for img, denoised in zip(stack, denoise_tv(stack, weight=0.1)[0]):
+            np.testing.assert_array_equal(denoised, restoration.denoise_tv_chambolle(img, weight=0.1))
+
+        # A single image works too
+        single, _ = denoise_tv(self.stack[0], weight=0.1)
+        np.testing.assert_array_equal(single, result[0])
+
+        # So the default custom model keeps its original output
+        from skimage import exposure, feature
+        img = (np.tile(self.stack[0], (1, 2)) * 255).astype(np.uint8)
+        expected = restoration.denoise_tv_chambolle(img.astype(np.float32) / 255.0, weight=0.1)
+        expected = exposure.adjust_gamma(expected, gamma=0.9)
+        edges = feature.canny(expected, sigma=2)
+        expected = expected * 0.9
+        expected[edges] = 1.0
+        np.testing.assert_array_equal(UnShineyModel('custom').process_image(img), (expected * 255).astype(np.uint8))
+
+    def test_budgets(self):
+        """Test the iteration and time budgets stop the solver early"""
+        _, iterations = denoise_tv(self.stack, weight=0.1, max_iterations=3, tolerance=0)
+        self.assertEqual(iterations, 3)
+        _, iterations = denoise_tv(self.stack, weight=0.1, max_iterations=1000, tolerance=0, time_budget=0)
+        self.assertEqual(iterations, 1)
+
+        # A looser tolerance stops sooner
+        _, tight = denoise_tv(self.stack, weight=0.1, tolerance=1e-5)
+        _, loose = denoise_tv(self.stack, weight=0.1, tolerance=1e-3)
+        self.assertLess(loose, tight)
+
+    def test_bregman_converges_faster(self):
+        """Test split Bregman gets closer to the converged solution in fewer iterations"""
+        stack = self.stack.astype(np.float64)
+        converged, _ = denoise_tv(stack, weight=0.1, max_iterations=3000, tolerance=0)
+        bregman, bregman_iterations = denoise_tv(stack, weight=0.1, method='bregman', tolerance=1e-3)
+        chambolle, _ = denoise_tv(stack, weight=0.1, max_iterations=bregman_iterations, tolerance=0)
+        self.assertLess(np.abs(bregman - converged).mean(), np.abs(chambolle - converged).mean())
+        self.assertLess(np.abs(bregman - converged).mean(), 2.0 / 255)
+
+    def test_options(self):
+        """Test budget settings are read from configuration dictionaries"""
+        options = tv_options({'denoise_method': 'bregman', 'denoise_max_iterations': '20',
+                              'denoise_time_budget': 0.5})
+        self.assertEqual(options, {'method': 'bregman', 'max_iterations': 20,
+                                   'tolerance': 2e-4, 'time_budget': 0.5})
+        with self.assertRaises(ValueError):
+            tv_options({'denoise_method': 'newton'})
+        with self.assertRaises(ValueError):
+            denoise_tv(self.stack, weight=0)
+
+    def test_iterations_are_reported(self):
+        """Test models and plans report the iterations of their last run"""
+        img_stack = (self.stack * 255).astype(np.uint8)
+
+        plan = ProcessingPlan({'denoise': 0.1, 'denoise_max_iterations': 4, 'denoise_tolerance': 0})
+        plan.run(img_stack)
+        self.assertEqual(plan.find('denoise').iterations, 4)
+
+        model = UnShineyModel('custom', config={'denoise_method': 'bregman', 'denoise_max_iterations': 6})
+        model.process_batch(img_stack)
+        self.assertGreater(model.metrics['denoise_iterations'], 0)
+        self.assertLessEqual(model.metrics['denoise_iterations'], 6)
+
+if __name__ == '__main__':
+    unittest.main()
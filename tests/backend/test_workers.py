@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+from io import BytesIO
+from unittest import mock
+import numpy as np
+from PIL import Image
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.pipeline import Pipeline
+from model.utils import process_for_model
+from model.workers import ProcessPool, WorkerTimeout, WorkerError, _Worker
+
+class TestProcessPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ProcessPool(workers=2, timeout=30, preload=('dense',), slot_bytes=1024)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.test_img_array = rng.randint(0, 256, size=(64, 64)).astype(np.uint8)
+
+    def test_matches_in_process_pipeline(self):
+        """Test workers produce exactly what the pipeline does in-process"""
+        config = {'processing_params': {'contrast': 1.4, 'blur': 1.0}}
+        for model_type, model_config in (('dense', None), ('conv', None), ('custom', config)):
+            expected = Pipeline(model_type, model_config).run(self.test_img_array)
+            np.testing.assert_array_equal(self.pool.run(self.test_img_array, model_type, model_config), expected)
+
+        # Images larger than the initial shared memory grow it
+        large = np.tile(self.test_img_array, (4, 4))
+        np.testing.assert_array_equal(self.pool.run(large, 'dense'), Pipeline('dense', None).run(large))
+
+    def test_run_encoded(self):
+        """Test encoded uploads are decoded and resized in the worker like in-process"""
+        rng = np.random.RandomState(2)
+        for mode, color in (('L', False), ('RGB', True)):
+            img = Image.fromarray(rng.randint(0, 256, size=(200, 300, 3)).astype(np.uint8)).convert(mode)
+            buffer = BytesIO()
+            img.save(buffer, 'PNG')
+            expected = process_for_model(Image.open(BytesIO(buffer.getvalue())),
+                                         Pipeline('dense').run, color=color)
+            result = self.pool.run_encoded(buffer.getvalue(), 'dense', color=color)
+            np.testing.assert_array_equal(result, np.asarray(expected))
+
+        with self.assertRaises(WorkerError):
+            self.pool.run_encoded(b'not an image', 'dense')
+
+    def test_errors(self):
+        """Test failures inside a worker are reported"""
+        with self.assertRaises(WorkerError):
+            self.pool.run(self.test_img_array, 'custom', {'processing_params': {'contrast': 'high'}})
+        with self.assertRaises(ValueError):
+            self.pool.run(np.zeros((2, 8, 8), dtype=np.uint8), 'dense')
+
+        # The worker is still usable afterwards
+        self.assertEqual(self.pool.run(self.test_img_array, 'dense').shape, (64, 64))
+
+        # Unexpected errors on the calling side give the worker back as well
+        with mock.patch.object(_Worker, 'ensure_capacity', side_effect=MemoryError):
+            for _ in range(self.pool.size + 1):
+                with self.assertRaises(MemoryError):
+                    self.pool.run(self.test_img_array, 'dense')
+        self.assertEqual(self.pool._idle.qsize(), self.pool.size)
+
+    def test_hung_worker_is_replaced(self):
+        """Test a job over the timeout kills its worker and a new one takes its place"""
+        slow = np.random.RandomState(1).randint(0, 256, size=(1024, 1024)).astype(np.uint8)
+        replaced = self.pool.replaced
+        self.pool.timeout = 0.01
+        try:
+            with self.assertRaises(WorkerTimeout):
+                self.pool.run(slow, 'hybrid')
+        finally:
+            self.pool.timeout = 30
+        self.assertEqual(self.pool.replaced, replaced + 1)
+
+        # The pool is back at full strength
+        for _ in range(self.pool.size):
+            self.assertEqual(self.pool.run(self.test_img_array, 'dense').shape, (64, 64))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import unittest
+import threading
+import numpy as np
+from scipy import ndimage
+from skimage import exposure
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from model.workspace import Workspace, get_workspace
+from model.pipeline import Pipeline
+from model.model import UnShineyModel
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img_array = rng.randint(0, 256, size=(64, 80)).astype(np.uint8)
+
+    def test_buffers_are_reused(self):
+        """Test a buffer is allocated once per name, shape and dtype"""
+        workspace = Workspace()
+        first = workspace.get('a', (4, 5))
+        self.assertEqual(first.dtype, np.float32)
+        self.assertIs(workspace.get('a', (4, 5)), first)
+        self.assertIsNot(workspace.get('a', (4, 6)), first)
+        self.assertIsNot(workspace.get('a', (4, 5), np.uint8), first)
+        self.assertEqual(workspace.stats()['allocations'], 3)
+
+    def test_size_cap(self):
+        """Test least recently used buffers are freed beyond the cap"""
+        workspace = Workspace(max_bytes=1000)
+        first = workspace.get('a', (100,))
+        workspace.get('b', (100,))
+        self.assertIs(workspace.get('a', (100,)), first)
+        workspace.get('c', (100,))
+        stats = workspace.stats()
+        self.assertEqual(stats['buffers'], 2)
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertIs(workspace.get('a', (100,)), first)
+
+    def test_to_uint8(self):
+        """Test conversion clips, truncates and never aliases the workspace"""
+        values = np.array([-3.0, 0.4, 1.9, 254.99, 300.0], dtype=np.float32)
+        output = Workspace.to_uint8(values)
+        np.testing.assert_array_equal(output, [0, 0, 1, 254, 255])
+        self.assertEqual(output.dtype, np.uint8)
+        self.assertFalse(np.shares_memory(output, values))
+
+    def test_per_thread(self):
+        """Test every thread gets its own workspace"""
+        workspaces = []
+        thread = threading.Thread(target=lambda: workspaces.append(get_workspace()))
+        thread.start()
+        thread.join()
+        self.assertIs(get_workspace(), get_workspace())
+        self.assertIsNot(workspaces[0], get_workspace())
+
+    def test_pipelines_do_not_allocate_per_image(self):
+        """Test repeated runs reuse the workspace and give identical results"""
+        workspace = get_workspace()
+        for model_type in ('dense', 'conv', 'hybrid', 'custom'):
+            pipeline = Pipeline(model_type)
+            first = pipeline.run(self.img_array)
+            allocations = workspace.stats()['allocations']
+            second = pipeline.run(self.img_array)
+            self.assertEqual(workspace.stats()['allocations'], allocations)
+            np.testing.assert_array_equal(first, second)
+
+        model = UnShineyModel('conv')
+        first = model.process_image(self.img_array)
+        allocations = workspace.stats()['allocations']
+        np.testing.assert_array_equal(model.process_image(self.img_array), first)
+        self.assertEqual(workspace.stats()['allocations'], allocations)
+
+    def test_matches_uint8_stages(self):
+        """Test float32 stages keep the whole gray levels of the uint8 stages they replace"""
+        smooth = ndimage.gaussian_filter(self.img_array, 2.0)
+        for img in (self.img_array, smooth, np.full((16, 16), 77, np.uint8)):
+            # Dense: truncated gain and blur, then a signed high-pass
+            contrasted = np.clip(img.astype(float) * 1.2, 0, 255).astype(np.uint8)
+            highpass = contrasted.astype(np.float32) - ndimage.gaussian_filter(contrasted, sigma=1.0)
+            expected = np.clip(contrasted + highpass * np.float32(0.3), 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(UnShineyModel('dense').process_image(img), expected)
+
+            # Conv: uint8 blur, then signed Sobel filters
+            blurred = ndimage.gaussian_filter(img, sigma=1).astype(float)
+            magnitude = np.hypot(ndimage.sobel(blurred, axis=0), ndimage.sobel(blurred, axis=1))
+            expected = np.clip(blurred * 0.8 + magnitude * 0.2, 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(UnShineyModel('conv').process_image(img), expected)
+            np.testing.assert_array_equal(Pipeline('conv').run(img), expected)
+
+            # Custom pipeline: uint8 blur and gamma, then a signed high-pass
+            blurred = exposure.adjust_gamma(ndimage.gaussian_filter(img, sigma=0.8), gamma=0.8)
+            highpass = blurred.astype(float) - ndimage.gaussian_filter(blurred, sigma=1.0)
+            expected = np.clip(blurred + highpass * 0.5, 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(Pipeline('custom').run(img), expected)
+
+            # A blur parameter blurs the uint8 image
+            pipeline = Pipeline('dense', {'processing_params': {'brightness': 10, 'blur': 1.5}})
+            expected = np.clip(img.astype(float) + 10, 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(pipeline.run(img), ndimage.gaussian_filter(expected, sigma=1.5))
+
+    def test_no_wraparound(self):
+        """Test sharpening and edge enhancement saturate instead of wrapping around"""
+        # A dark band next to a bright one
+        img = np.full((32, 32), 220, dtype=np.uint8)
+        img[:, :16] = 30
+
+        # Sharpening darkens the dark side of the edge, it does not turn it white
+        dense = UnShineyModel('dense').process_image(img)
+        self.assertLessEqual(dense[:, :16].max(), 36)
+        self.assertEqual(dense[:, 16].min(), 255)
+        blurred = exposure.adjust_gamma(ndimage.gaussian_filter(img, sigma=0.8), gamma=0.8)
+        custom = Pipeline('custom').run(img)
+        self.assertTrue(np.all(custom[:, 15] < blurred[:, 15]))
+
+        # The edge is brighter than the flat areas on both sides
+        for output in (UnShineyModel('conv').process_image(img), Pipeline('conv').run(img)):
+            self.assertTrue(np.all(output[:, 15] > output[:, 0]))
+            self.assertTrue(np.all(output[:, 16] > output[:, 31]))
+            self.assertLess(output[:, 0].max(), 30)
+
+if __name__ == '__main__':
+    unittest.main()